@@ -0,0 +1,213 @@
+"""
+NovelOS 分片一致性检查
+整章正文按段落边界切成带重叠的分片，分片并发检查（受并发上限约束），结果合并去重：
+- 分片不截断段落，相邻分片重叠 CONSISTENCY_OVERLAP_PARAS 段，跨分片边界的问题也能被看到
+- 问题与修补项中的段落引用在分片内解析（“第3段”指分片内第3段），再统一映射为章节段落锚点
+- 重叠段落的问题两侧都可能报告，按段落与原因去重，保留更高的严重程度
+run_consistency_check 串起正文检查的完整流程（本地规则预检 + 分片检查），各一致性检查节点只提供提示词
+"""
+import os
+import re
+import json
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from langchain_core.messages import HumanMessage
+
+from graphs.state import ConsistencyCheckOutput, IssueItem, NovelState, PatchPlanItem
+from utils.text.paragraph import ParagraphIndex, build_paragraph_index, format_annotated, bind_anchors
+from utils.text.rule_check import run_rule_checks, has_blocker
+
+logger = logging.getLogger(__name__)
+
+# 单个分片的最大字符数（含段落ID前缀）
+CONSISTENCY_CHUNK_CHARS = int(os.getenv("NOVELOS_CONSISTENCY_CHUNK_CHARS", "2400"))
+# 相邻分片重叠的段落数
+CONSISTENCY_OVERLAP_PARAS = int(os.getenv("NOVELOS_CONSISTENCY_OVERLAP_PARAS", "1"))
+# 同一次检查中并发检查的分片数上限
+CONSISTENCY_MAX_CONCURRENCY = int(os.getenv("NOVELOS_CONSISTENCY_MAX_CONCURRENCY", "4"))
+
+_SEVERITY_RANK = {"info": 0, "warn": 1, "blocker": 2}
+_WHY_NORMALIZE_RE = re.compile(r"[\s，。！？、；：,.!?;:“”\"'「」『』（）()]+")
+
+
+class ConsistencyChunk(BaseModel):
+    """一致性检查分片（段落区间 [para_start, para_end)）"""
+    chunk_no: int = Field(..., description="分片序号（从0开始）")
+    para_start: int = Field(..., description="起始段落序号")
+    para_end: int = Field(..., description="结束段落序号（不含）")
+    overlap: int = Field(default=0, description="开头与上一分片重叠的段落数")
+
+
+def split_chunks(index: ParagraphIndex, max_chars: int = CONSISTENCY_CHUNK_CHARS,
+                 overlap: int = CONSISTENCY_OVERLAP_PARAS) -> List[ConsistencyChunk]:
+    """按段落边界贪心切分；单段超过 max_chars 时独占一个分片（不截断）"""
+    paragraphs = index.paragraphs
+    chunks: List[ConsistencyChunk] = []
+    start = 0
+    prev_end = 0
+    while start < len(paragraphs):
+        end = start
+        total = 0
+        while end < len(paragraphs):
+            p = paragraphs[end]
+            size = len(p.para_id) + 3 + (p.char_end - p.char_start)
+            if end > start and total + size > max_chars:
+                break
+            total += size
+            end += 1
+        chunks.append(ConsistencyChunk(chunk_no=len(chunks), para_start=start, para_end=end,
+                                       overlap=max(0, prev_end - start)))
+        if end >= len(paragraphs):
+            break
+        prev_end = end
+        # 下一分片回退 overlap 段，但至少前进一段
+        start = max(start + 1, end - overlap)
+    return chunks
+
+
+def annotate_chunk(text: str, index: ParagraphIndex, chunk: ConsistencyChunk, total_chunks: int) -> str:
+    """生成分片的带段落ID正文；多分片时附带分片位置说明"""
+    annotated = format_annotated(index.paragraphs[chunk.para_start:chunk.para_end],
+                                 lambda p: text[p.char_start:p.char_end])
+    if total_chunks <= 1:
+        return annotated
+    note = f"（全章第 {chunk.chunk_no + 1}/{total_chunks} 部分，只检查本部分内容"
+    if chunk.overlap:
+        note += f"；开头 {chunk.overlap} 段与上一部分重叠"
+    return f"{note}）\n{annotated}"
+
+
+def parse_check_result(content: str) -> Tuple[List[IssueItem], List[PatchPlanItem]]:
+    """解析一致性检查的 LLM 输出，无法解析时返回空结果"""
+    json_start = content.find('{')
+    json_end = content.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        return [], []
+    try:
+        data = json.loads(content[json_start:json_end])
+        issues = [IssueItem(**item) for item in data.get("issues", [])]
+        patch_plan = [PatchPlanItem(**item) for item in data.get("patch_plan", [])]
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return [], []
+    return issues, patch_plan
+
+
+def _chunk_index(index: ParagraphIndex, chunk: ConsistencyChunk) -> ParagraphIndex:
+    """分片内的段落索引：序号引用（第N段/PN）按分片内位置解析，para_id 仍是章节锚点"""
+    return ParagraphIndex(text_hash=index.text_hash, paragraphs=index.paragraphs[chunk.para_start:chunk.para_end])
+
+
+def _issue_key(issue: IssueItem) -> Tuple[str, str]:
+    where = issue.para_id or _WHY_NORMALIZE_RE.sub("", issue.where)
+    return where, _WHY_NORMALIZE_RE.sub("", issue.why)[:40]
+
+
+def merge_results(results: List[Tuple[ConsistencyChunk, List[IssueItem], List[PatchPlanItem]]],
+                  index: ParagraphIndex) -> Tuple[List[IssueItem], List[PatchPlanItem]]:
+    """
+    合并各分片结果：问题按 (段落, 原因) 去重并保留最高严重程度；
+    同一段落同一操作的修补项只保留一条，优先取该段落不处于重叠区的分片给出的
+    """
+    issues: Dict[Tuple[str, str], IssueItem] = {}
+    patches: Dict[Tuple[str, str], Tuple[bool, PatchPlanItem]] = {}
+    unanchored_patches: List[PatchPlanItem] = []
+    for chunk, chunk_issues, chunk_patches in results:
+        overlap_ids = {p.para_id for p in index.paragraphs[chunk.para_start:chunk.para_start + chunk.overlap]}
+        for issue in chunk_issues:
+            key = _issue_key(issue)
+            kept = issues.get(key)
+            if kept is None or _SEVERITY_RANK.get(issue.severity, 0) > _SEVERITY_RANK.get(kept.severity, 0):
+                issues[key] = issue
+        for patch in chunk_patches:
+            if not patch.para_id:
+                unanchored_patches.append(patch)
+                continue
+            key = (patch.para_id, patch.action)
+            owned = patch.para_id not in overlap_ids
+            kept = patches.get(key)
+            if kept is None or (owned and not kept[0]):
+                patches[key] = (owned, patch)
+
+    def position(para_id: Optional[str]) -> int:
+        anchor = index.get(para_id) if para_id else None
+        return anchor.index if anchor is not None else len(index)
+
+    merged_issues = sorted(issues.values(), key=lambda i: position(i.para_id))
+    merged_patches = sorted((p for _, p in patches.values()), key=lambda p: position(p.para_id)) + unanchored_patches
+    return merged_issues, merged_patches
+
+
+async def check_chunks(client, text: str, index: ParagraphIndex, build_prompt: Callable[[str], str],
+                       max_chars: int = CONSISTENCY_CHUNK_CHARS,
+                       max_concurrency: int = CONSISTENCY_MAX_CONCURRENCY) -> Tuple[List[IssueItem], List[PatchPlanItem]]:
+    """
+    分片并发检查整章正文。build_prompt 接收带段落ID的分片正文并返回完整提示词；
+    单个分片调用失败时记为 info 问题（注明未覆盖的段落范围），不影响其余分片
+    """
+    chunks = split_chunks(index, max_chars)
+    if not chunks:
+        return [], []
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def check(chunk: ConsistencyChunk):
+        prompt = build_prompt(annotate_chunk(text, index, chunk, len(chunks)))
+        async with semaphore:
+            response = await client.ainvoke(messages=[HumanMessage(content=prompt)], temperature=0)
+        content = response.content
+        content = content.strip() if isinstance(content, str) else str(content)
+        issues, patch_plan = parse_check_result(content)
+        sub_index = _chunk_index(index, chunk)
+        bind_anchors(issues, sub_index, text, "where")
+        bind_anchors(patch_plan, sub_index, text, "target")
+        return issues, patch_plan
+
+    outcomes = await asyncio.gather(*(check(chunk) for chunk in chunks), return_exceptions=True)
+    results = []
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            logger.warning(f"Consistency check failed for chunk {chunk.chunk_no + 1}/{len(chunks)}: {outcome}")
+            first = index.paragraphs[chunk.para_start]
+            results.append((chunk, [IssueItem(
+                severity="info",
+                where=f"第{chunk.para_start + 1}段至第{chunk.para_end}段",
+                para_id=first.para_id,
+                why="该部分一致性检查调用失败，未完成检查",
+                fix_suggestion="重新执行一致性检查"
+            )], []))
+            continue
+        results.append((chunk, *outcome))
+    if len(chunks) > 1:
+        logger.info(f"Consistency check over {len(chunks)} chunks ({len(index)} paragraphs)")
+    return merge_results(results, index)
+
+
+async def run_consistency_check(client, text: str, novel_state: Optional[NovelState],
+                                build_prompt: Callable[[str], str]) -> ConsistencyCheckOutput:
+    """
+    检查整章正文：本地规则预检（禁忌词、视角、实体），命中禁忌词（blocker）时不再调用大模型；
+    否则分片调用大模型检查，本地问题在前、大模型问题在后合并输出
+    """
+    # 段落索引：正文每段带 para_id 前缀，问题与修补计划按 para_id 定位
+    index = build_paragraph_index(text)
+    rule_issues = run_rule_checks(text, novel_state, index)
+    if has_blocker(rule_issues):
+        return ConsistencyCheckOutput(issues=rule_issues, patch_plan=[], passed=False)
+    issues, patch_plan = await check_chunks(client, text, index, build_prompt)
+    issues = rule_issues + issues
+    return ConsistencyCheckOutput(issues=issues, patch_plan=patch_plan, passed=not has_blocker(issues))
+
+
+__all__ = [
+    "ConsistencyChunk",
+    "split_chunks",
+    "annotate_chunk",
+    "parse_check_result",
+    "merge_results",
+    "check_chunks",
+    "run_consistency_check",
+]
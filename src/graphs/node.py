@@ -3,15 +3,17 @@ NovelOS 节点函数实现
 包含所有工作流节点的实现
 """
 import os
+import re
+import asyncio
 import json
 import uuid
+import time
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterable, List, Optional
 from datetime import datetime
 from langchain_core.runnables import RunnableConfig
 from langgraph.runtime import Runtime
 from coze_coding_utils.runtime_ctx.context import Context
-from coze_coding_dev_sdk import LLMClient
 from langchain_core.messages import HumanMessage, SystemMessage
 from jinja2 import Template
 
@@ -46,25 +48,74 @@ from graphs.state import (
     # 全局状态
     GlobalState
 )
+from graphs.consistency import run_consistency_check
 
 from storage.database.db import get_session
 from storage.database.novel_manager import NovelStateManager, NovelStateCreate, NovelStateUpdate, StateEventCreate
+from storage.asset.asset_store import get_asset_store
+from storage.asset.chapter_reader import open_chapter
+from storage.search.text_index import get_search_index, update_search_index
+from utils.text.paragraph import (
+    build_paragraph_index, annotate_paragraphs, annotate_window, bind_anchors, load_paragraph_index,
+    save_paragraph_index
+)
+from utils.text.patch import apply_patch_plan
+from utils.text.diff import diff_texts, summarize_diff, save_diff
+from utils.text.token_budget import (
+    PROMPT_RULES_BUDGET, PROMPT_ENTITIES_BUDGET, PROMPT_TIMELINE_BUDGET, BudgetItem, PackResult, pack_ranked
+)
+from utils.llm.gateway import get_llm_gateway
+from utils.text.intent_classifier import INTENTS, extract_parameters, get_intent_classifier
+from utils.llm.json_stream import JsonStringFieldStream, answer_delta_emitter, parse_json_object
 
 
 # ==================== 意图识别节点 ====================
 
-def intent_router_node(state: IntentRouterInput, config: RunnableConfig, runtime: Runtime[Context]) -> IntentRouterOutput:
-    """
-    title: 意图识别
-    desc: 分析用户输入，识别用户想要执行的操作类型（新建项目/写作/改稿/检查/查询/审批/导出）
-    integrations: 大语言模型
-    """
-    ctx = runtime.context
-    
-    # 读取配置文件
+def _load_json_file(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as fd:
+        return json.load(fd)
+
+
+def _load_project_state(project_id: str) -> Optional[NovelState]:
+    """从快照加载项目的 NovelState；项目不存在或数据库连接失败时返回 None"""
+    try:
+        db = get_session()
+        try:
+            snapshot = NovelStateManager().get_snapshot(db, project_id)
+            return NovelState(**snapshot.snapshot) if snapshot else None
+        finally:
+            db.close()
+    except Exception as e:
+        # 数据库连接失败时，假设项目不存在
+        logger.warning(f"Failed to check/load project existence: {e}")
+        return None
+
+
+def _pack_rules(rules: Iterable[CanonRule], query: str, budget: int = PROMPT_RULES_BUDGET) -> PackResult:
+    """按与 query 的相关度把硬设定规则装入 token 预算"""
+    items = [BudgetItem(key=rule.rule_id, text=f"- {rule.content}") for rule in rules]
+    return pack_ranked(items, budget, query, label="rules")
+
+
+def _pack_rules_text(rules: Iterable[CanonRule], query: str, budget: int = PROMPT_RULES_BUDGET) -> str:
+    """提示词中的规则段落（附省略说明）"""
+    result = _pack_rules(rules, query, budget)
+    return result.text() + result.note("规则")
+
+
+def _pack_entities_text(entities: List[Entity], query: str, fmt: Callable[[Entity], str], label: str,
+                        budget: int = PROMPT_ENTITIES_BUDGET) -> str:
+    """提示词中的实体段落：名称出现在 query 中的实体优先，按相关度装入预算（附省略说明）"""
+    items = [BudgetItem(key=e.entity_id, text=fmt(e)) for e in entities]
+    result = pack_ranked(items, budget, query, label="entities", names=[[e.name] for e in entities])
+    return result.text() + result.note(label)
+
+
+async def _llm_route_intent(user_input: str, config: RunnableConfig, ctx: Context) -> tuple:
+    """调用大模型识别意图，返回 (意图, 置信度, 参数)"""
+    # 读取配置文件（阻塞 IO 放到线程中，不占用事件循环）
     cfg_file = os.path.join(os.getenv("COZE_WORKSPACE_PATH"), config['metadata']['llm_cfg'])
-    with open(cfg_file, 'r', encoding='utf-8') as fd:
-        llm_cfg = json.load(fd)
+    llm_cfg = await asyncio.to_thread(_load_json_file, cfg_file)
     
     model_config = llm_cfg.get("config", {})
     sp = llm_cfg.get("sp", "")
@@ -72,19 +123,19 @@ def intent_router_node(state: IntentRouterInput, config: RunnableConfig, runtime
     
     # 渲染用户提示词
     up_tpl = Template(up_template)
-    user_prompt = up_tpl.render({"user_input": state.user_input})
+    user_prompt = up_tpl.render({"user_input": user_input})
     
     # 调用大模型
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="intent_router")
     messages = [
         SystemMessage(content=sp),
         HumanMessage(content=user_prompt)
     ]
     
-    response = client.invoke(
+    response = await client.ainvoke(
         messages=messages,
         model=model_config.get("model", "doubao-seed-1-8-251228"),
-        temperature=model_config.get("temperature", 0.3),
+        temperature=model_config.get("temperature", 0),
         max_completion_tokens=model_config.get("max_completion_tokens", 1000)
     )
     
@@ -113,26 +164,52 @@ def intent_router_node(state: IntentRouterInput, config: RunnableConfig, runtime
         intent = "unknown"
         confidence = 0.0
         parameters = {}
+    return intent, confidence, parameters
+
+
+async def intent_router_node(state: IntentRouterInput, config: RunnableConfig, runtime: Runtime[Context]) -> IntentRouterOutput:
+    """
+    title: 意图识别
+    desc: 分析用户输入，识别用户想要执行的操作类型（新建项目/写作/改稿/检查/查询/审批/导出）；输入中显式指定意图时跳过识别，只加载项目
+    integrations: 大语言模型
+    """
+    ctx = runtime.context
+    
+    classifier = get_intent_classifier()
+    t0 = time.perf_counter()
+    explicit = state.intent in INTENTS
+    if state.intent and not explicit:
+        logger.warning(f"Unknown explicit intent {state.intent}, falling back to intent detection")
+    
+    if explicit:
+        # 程序化调用显式指定了意图：不做识别，只加载项目
+        local, need_llm = None, False
+    else:
+        # 本地快速判定：规则或 n-gram 模型置信度足够时不调用大模型（按比例抽样仍调用大模型核对准确率）
+        local, need_llm = classifier.decide(state.user_input)
+    
+    if explicit:
+        intent, confidence, parameters = state.intent, 1.0, state.parameters or {}
+        latency_ms = (time.perf_counter() - t0) * 1000
+        classifier.record("explicit", latency_ms)
+        path = "explicit"
+    elif need_llm:
+        intent, confidence, parameters = await _llm_route_intent(state.user_input, config, ctx)
+        latency_ms = (time.perf_counter() - t0) * 1000
+        classifier.record("llm", latency_ms)
+        if local is not None:
+            classifier.record_agreement(local, intent)
+        path = "llm"
+    else:
+        intent, confidence, parameters = local.intent, local.confidence, local.parameters
+        latency_ms = (time.perf_counter() - t0) * 1000
+        classifier.record(local.source, latency_ms)
+        path = local.source
+    logger.info(f"Intent {intent} ({confidence}) via {path} in {latency_ms:.1f}ms")
     
     # 检查项目是否存在，并加载NovelState
-    project_exists = False
-    loaded_novel_state = None
-    if state.project_id:
-        try:
-            db = get_session()
-            try:
-                mgr = NovelStateManager()
-                snapshot = mgr.get_snapshot(db, state.project_id)
-                if snapshot:
-                    project_exists = True
-                    # 从快照加载NovelState
-                    loaded_novel_state = NovelState(**snapshot.snapshot)
-            finally:
-                db.close()
-        except Exception as e:
-            # 数据库连接失败时，假设项目不存在
-            logger.warning(f"Failed to check/load project existence: {e}")
-            project_exists = False
+    loaded_novel_state = await asyncio.to_thread(_load_project_state, state.project_id) if state.project_id else None
+    project_exists = loaded_novel_state is not None
 
     return IntentRouterOutput(
         intent=intent,
@@ -156,7 +233,7 @@ def collect_project_info_node(state: CollectProjectInfoInput, config: RunnableCo
     input_data = state  # 直接使用state作为输入对象
     
     # 使用LLM提取项目信息
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="collect_project_info")
     
     prompt = f"""请从以下用户输入中提取小说项目的基本信息，返回JSON格式：
 
@@ -229,7 +306,7 @@ def generate_style_bible_node(state: GenerateStyleBibleInput, config: RunnableCo
     """
     ctx = runtime.context
     
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="generate_style_bible")
     
     prompt = f"""基于以下小说项目信息，生成写作宪法（Style Bible），返回JSON格式：
 
@@ -443,7 +520,7 @@ def generate_outline_node(state: GenerateOutlineInput, config: RunnableConfig, r
         ]
         return GenerateOutlineOutput(outline=outline, initial_scenes=initial_scenes)
 
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="generate_outline")
 
     prompt = f"""基于以下信息生成小说大纲和初始场景卡，返回JSON格式：
 
@@ -826,18 +903,35 @@ def build_context_pack_node(state: BuildContextPackInput, config: RunnableConfig
         if state.scene_card.location in novel_state.world.entities:
             location_info = novel_state.world.entities[state.scene_card.location]
 
-    # 提取时间线上下文
+    # 场景相关度查询文本：场景卡内容 + 出场人物与地点名称
+    scene_card = state.scene_card
+    scene_names = [e.name for e in relevant_characters.values()] + ([location_info.name] if location_info else [])
+    scene_query = "\n".join([scene_card.objective, scene_card.conflict, scene_card.turning_point, scene_card.result,
+                             scene_card.location, scene_card.time_point, *scene_card.foreshadowing, *scene_names])
+    omitted: Dict[str, List[str]] = {}
+
+    # 提取时间线上下文：本章事件、涉及出场人物的事件优先，按相关度装入预算（保持时间顺序）
     timeline_context = []
     if novel_state.timeline:
+        items = []
         for event in novel_state.timeline:
-            if state.scene_card.chapter_ref in (event.chapter_ref or ""):
-                timeline_context.append(event)
-
-    # 提取相关规则
+            base = 5.0 if scene_card.chapter_ref in (event.chapter_ref or "") else 0.0
+            base += 2.0 * len(set(event.involved_entities) & set(scene_card.characters))
+            items.append(BudgetItem(key=event.event_id, text=f"- {event.time_point}: {event.description}", score=base))
+        timeline_pack = pack_ranked(items, PROMPT_TIMELINE_BUDGET, scene_query, label="timeline")
+        kept = set(timeline_pack.keys)
+        timeline_context = [event for event in novel_state.timeline if event.event_id in kept]
+        if timeline_pack.dropped:
+            omitted["timeline"] = timeline_pack.dropped
+
+    # 提取相关规则：按与场景的相关度装入预算
     relevant_rules = {}
     if novel_state.world and novel_state.world.canon_rules:
-        for rule_id, rule in novel_state.world.canon_rules.items():
-            relevant_rules[rule_id] = rule
+        rules_pack = _pack_rules(novel_state.world.canon_rules.values(), scene_query)
+        kept = set(rules_pack.keys)
+        relevant_rules = {rule_id: rule for rule_id, rule in novel_state.world.canon_rules.items() if rule_id in kept}
+        if rules_pack.dropped:
+            omitted["rules"] = rules_pack.dropped
 
     # 获取章节摘要
     chapter_summary = ""
@@ -864,13 +958,99 @@ def build_context_pack_node(state: BuildContextPackInput, config: RunnableConfig
         timeline_context=timeline_context,
         relevant_rules=relevant_rules,
         style_bible=style_bible,
-        chapter_summary=chapter_summary
+        chapter_summary=chapter_summary,
+        omitted=omitted
     )
 
     return BuildContextPackOutput(context_pack=context_pack)
 
 
-def draft_scene_node(state: DraftSceneInput, config: RunnableConfig, runtime: Runtime[Context]) -> DraftSceneOutput:
+# 结构化起草：正文、摘要与状态增量由一次调用返回（设为 0 时退回“正文 + 摘要”两次调用）
+STRUCTURED_DRAFT = os.getenv("NOVELOS_STRUCTURED_DRAFT", "1") != "0"
+
+
+def _draft_known_entities(context_pack: ContextPack) -> Dict[str, Entity]:
+    """起草时允许更新状态的实体：本场景相关人物与地点"""
+    known = dict(context_pack.relevant_characters)
+    if context_pack.location_info is not None:
+        known[context_pack.location_info.entity_id] = context_pack.location_info
+    return known
+
+
+def _draft_state_delta(data: Dict[str, Any], context_pack: ContextPack) -> StateDelta:
+    """把结构化起草结果中的实体变化与新事件转换为 StateDelta（只保留已知实体，实体名称映射为ID）"""
+    scene_card = context_pack.scene_card
+    known = _draft_known_entities(context_pack)
+    by_name = {e.name: entity_id for entity_id, e in known.items()}
+    
+    def resolve(ref: Any) -> Optional[str]:
+        if not isinstance(ref, str):
+            return None
+        ref = ref.strip()
+        return ref if ref in known else by_name.get(ref)
+    
+    entities_updated: Dict[str, Dict[str, Any]] = {}
+    for item in data.get("entity_updates") or []:
+        if not isinstance(item, dict) or not isinstance(item.get("changes"), dict):
+            continue
+        entity_id = resolve(item.get("entity_id")) or resolve(item.get("name"))
+        if entity_id and item["changes"]:
+            entities_updated.setdefault(entity_id, {}).update(item["changes"])
+    
+    new_events: List[TimelineEvent] = []
+    for item in data.get("new_events") or []:
+        if not isinstance(item, dict) or not item.get("description"):
+            continue
+        new_events.append(TimelineEvent(
+            event_id=f"evt_{uuid.uuid4().hex[:8]}",
+            time_point=str(item.get("time_point") or scene_card.time_point),
+            description=str(item["description"]),
+            involved_entities=[e for e in map(resolve, item.get("involved_entities") or []) if e],
+            chapter_ref=scene_card.chapter_ref,
+            scene_ref=scene_card.scene_id
+        ))
+    
+    return StateDelta(
+        entities_updated=entities_updated,
+        new_events=new_events,
+        new_proposals=[],
+        chapter_updates={},
+        scene_updates=[scene_card.scene_id]
+    )
+
+
+async def _draft_structured(client, prompt: str, emit) -> Optional[tuple]:
+    """
+    一次调用生成结构化起草结果，正文字段边生成边推送；
+    返回 (正文, 解析出的 JSON 对象)，无法取得正文时返回 None
+    """
+    parser = JsonStringFieldStream("content")
+    streamed = False
+    async for chunk in client.astream(messages=[HumanMessage(content=prompt)], temperature=0.8, max_completion_tokens=4500):
+        delta = parser.feed(chunk.content if isinstance(chunk.content, str) else str(chunk.content))
+        if delta:
+            emit(delta)
+            streamed = True
+    if streamed:
+        emit("", finish=True)
+    
+    raw = parser.text.strip()
+    data = parse_json_object(raw) or {}
+    content = data.get("content") if isinstance(data.get("content"), str) else None
+    if content is None and parser.done:
+        # JSON 整体不合法（如被截断），但正文字段已完整
+        content = parser.value
+    if content is None and raw and not raw.startswith('{'):
+        # 模型未按 JSON 返回，整段视为正文
+        content = raw
+        emit(raw, finish=True)
+    if not content or not content.strip():
+        logger.warning("Structured draft returned no content, falling back to plain drafting")
+        return None
+    return content.strip(), data
+
+
+async def draft_scene_node(state: DraftSceneInput, config: RunnableConfig, runtime: Runtime[Context]) -> DraftSceneOutput:
     """
     title: 起草场景
     desc: 根据Context Pack生成场景正文内容，同时生成摘要和状态增量
@@ -878,7 +1058,8 @@ def draft_scene_node(state: DraftSceneInput, config: RunnableConfig, runtime: Ru
     """
     ctx = runtime.context
     
-    client = LLMClient(ctx=ctx)
+    # 摘要等中间结果不推送；结构化起草的正文经 custom 流推送，两次调用模式下正文逐 token 推送
+    client = get_llm_gateway().bind(ctx, node="draft_scene")
     
     # 构建提示词
     context_info = f"""
@@ -900,7 +1081,49 @@ def draft_scene_node(state: DraftSceneInput, config: RunnableConfig, runtime: Ru
     if state.context_pack.chapter_summary:
         context_info += f"\n章节摘要：{state.context_pack.chapter_summary}"
     
-    prompt = f"""请根据以下信息写一个场景：
+    content = None
+    data: Dict[str, Any] = {}
+    if STRUCTURED_DRAFT:
+        entities_text = "\n".join(f"- {entity_id}：{e.name}" for entity_id, e in _draft_known_entities(state.context_pack).items())
+        prompt = f"""请根据以下信息写一个场景，并同时给出摘要和本场景造成的状态变化，返回JSON格式：
+
+{context_info}
+
+{style_info}
+
+已知实体（ID：名称）：
+{entities_text if entities_text else '暂无'}
+
+要求：
+1. 正文字数800-1500字
+2. 紧扣场景目标和冲突
+3. 体现转折点
+4. 遵循指定的文风
+5. 状态变化只记录本场景中实际发生的变化（位置、伤势、持有物品、关系等），实体只能使用已知实体ID
+
+返回JSON格式（content 字段放在最前）：
+{{
+    "content": "场景正文（段落之间用换行分隔）",
+    "summary": "100-200字的场景摘要",
+    "key_points": ["关键点"],
+    "entity_updates": [
+        {{"entity_id": "已知实体ID", "changes": {{"状态项": "新状态"}}}}
+    ],
+    "new_events": [
+        {{"time_point": "时间点", "description": "事件描述", "involved_entities": ["已知实体ID"]}}
+    ]
+}}
+
+请只返回JSON，不要有其他文字。
+"""
+        writer = getattr(runtime, "stream_writer", None)
+        emit = answer_delta_emitter(writer, "draft_scene", f"draft_{uuid.uuid4().hex[:8]}")
+        result = await _draft_structured(client, prompt, emit)
+        if result is not None:
+            content, data = result
+    
+    if content is None:
+        prompt = f"""请根据以下信息写一个场景：
 
 {context_info}
 
@@ -914,40 +1137,35 @@ def draft_scene_node(state: DraftSceneInput, config: RunnableConfig, runtime: Ru
 
 请直接返回场景正文内容，不要有任何前言或后言。
 """
-    
-    messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.8, max_completion_tokens=4000)
-    
-    content = response.content
-    if isinstance(content, str):
-        content = content.strip()
-    else:
-        content = str(content)
-    
-    # 生成摘要
-    summary_prompt = f"""请为以下场景内容写一个100-200字的摘要：
+        prose_client = get_llm_gateway().bind(ctx, node="draft_scene", stream=True)
+        response = await prose_client.ainvoke(messages=[HumanMessage(content=prompt)], temperature=0.8, max_completion_tokens=4000)
+        content = response.content
+        if isinstance(content, str):
+            content = content.strip()
+        else:
+            content = str(content)
+    
+    summary_text = data.get("summary") if isinstance(data.get("summary"), str) else ""
+    if not summary_text.strip():
+        # 生成摘要
+        summary_prompt = f"""请为以下场景内容写一个100-200字的摘要：
 
 {content[:1000]}...
 """
-    summary_response = client.invoke(messages=[HumanMessage(content=summary_prompt)], temperature=0.3)
-    summary_text = summary_response.content
+        summary_response = await client.ainvoke(messages=[HumanMessage(content=summary_prompt)], temperature=0.3)
+        summary_text = summary_response.content
     if isinstance(summary_text, str):
         summary_text = summary_text.strip()
     else:
         summary_text = str(summary_text)
     
     # 生成状态增量
-    state_delta = StateDelta(
-        entities_updated={},
-        new_events=[],
-        new_proposals=[],
-        chapter_updates={},
-        scene_updates=[state.context_pack.scene_card.scene_id]
-    )
+    state_delta = _draft_state_delta(data, state.context_pack)
     
+    key_points = [p for p in data.get("key_points") or [] if isinstance(p, str) and p.strip()]
     scene_summary = SceneSummary(
         content=summary_text,
-        key_points=[state.context_pack.scene_card.objective, state.context_pack.scene_card.conflict]
+        key_points=key_points or [state.context_pack.scene_card.objective, state.context_pack.scene_card.conflict]
     )
     
     return DraftSceneOutput(
@@ -1005,13 +1223,10 @@ def commit_state_node(state: CommitStateInput, config: RunnableConfig, runtime:
     chapter_dir = f"{project_dir}/chapter_{state.chapter_no}"
     file_path = f"{chapter_dir}/v{updated_state.current_version}.md"
     
-    # 创建目录
-    import os
-    os.makedirs(chapter_dir, exist_ok=True)
-    
-    # 保存正文文件
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(state.content)
+    # 保存正文文件（经资产存储写入，多实例共享）及段落索引
+    asset_store = get_asset_store()
+    asset_store.write_text(file_path, state.content)
+    para_index = save_paragraph_index(asset_store, file_path, state.content)
     
     # 更新章节信息
     if state.chapter_no not in updated_state.chapters:
@@ -1031,7 +1246,15 @@ def commit_state_node(state: CommitStateInput, config: RunnableConfig, runtime:
     
     # 从队列中移除已完成的场景
     updated_state.scene_queue = [s for s in updated_state.scene_queue if s.scene_id != state.scene_id]
-    
+
+    # 应用状态增量：实体状态变更与新增时间线事件
+    for entity_id, changes in state.state_delta.entities_updated.items():
+        entity = updated_state.world.entities.get(entity_id)
+        if entity is not None:
+            entity.status.update(changes)
+    known_events = {e.event_id for e in updated_state.timeline}
+    updated_state.timeline.extend(e for e in state.state_delta.new_events if e.event_id not in known_events)
+
     # 增加版本号
     updated_state.current_version += 1
     
@@ -1063,6 +1286,9 @@ def commit_state_node(state: CommitStateInput, config: RunnableConfig, runtime:
             )
             mgr.update_snapshot(db, snapshot_in)
             
+            # 快照落库后再增量更新全文检索索引，避免索引中出现未提交的版本
+            update_search_index(updated_state, state.chapter_no, updated_state.current_version - 1, state.content, para_index)
+            
             # 记录事件
             event_in = StateEventCreate(
                 project_id=updated_state.project_id,
@@ -1087,7 +1313,30 @@ def commit_state_node(state: CommitStateInput, config: RunnableConfig, runtime:
     )
 
 
-def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
+# 手动一致性检查时附带的章节正文节选上限（字）
+CONSISTENCY_ENTRY_MAX_CHARS = 2000
+
+
+def _chapter_excerpt(chapter_info: Optional[ChapterInfo], max_chars: int, asset_store=None) -> str:
+    """
+    从章节当前版本文件读取带段落ID的开头节选：按段落索引的字节偏移逐段读取，只解码装得下的段落；
+    段落索引缺失时按行读取开头。文件缺失返回空字符串
+    """
+    if not chapter_info or not chapter_info.file_path:
+        return ""
+    asset_store = asset_store or get_asset_store()
+    try:
+        para_index = load_paragraph_index(asset_store, chapter_info.file_path)
+        with open_chapter(chapter_info.file_path, asset_store) as reader:
+            if para_index is not None:
+                return reader.annotate(para_index, max_chars=max_chars)
+            return reader.head(max_chars)
+    except FileNotFoundError:
+        logger.warning(f"Chapter file not found: {chapter_info.file_path}")
+        return ""
+
+
+async def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
     """
     title: 一致性检查入口
     desc: 用户手动触发一致性检查的入口节点，用于检查指定章节/场景的内容一致性
@@ -1103,18 +1352,24 @@ def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfi
             passed=True
         )
     
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="consistency_check_entry")
     
-    # 构建规则上下文
-    rules_text = "\n".join([f"- {rule.content}" for rule in state.novel_state.world.canon_rules.values()])
+    # 构建规则与人物上下文：按与查询的相关度装入 token 预算
+    rules_text = _pack_rules_text(state.novel_state.world.canon_rules.values(), state.query or "")
+    characters_text = _pack_entities_text(
+        [char for char in state.novel_state.world.entities.values() if char.type == "character"], state.query or "",
+        lambda char: f"- {char.name}: {char.description}", "人物"
+    )
     
-    # 构建人物上下文
-    characters_text = "\n".join([f"- {char.name}: {char.description}" for char in state.novel_state.world.entities.values() if char.type == "character"])
+    # 查询指定了已有章节时，附带该章正文节选（从版本文件按段落读取）
+    chapter_no = extract_parameters(state.query or "").get("chapter_no")
+    excerpt = _chapter_excerpt(state.novel_state.chapters.get(chapter_no), CONSISTENCY_ENTRY_MAX_CHARS)
+    excerpt_text = f"\n第{chapter_no}章正文节选（每段以 [段落ID] 开头）：\n{excerpt}\n" if excerpt else ""
     
     prompt = f"""用户请求检查设定的一致性。根据查询内容确定检查范围，返回JSON格式：
 
 用户查询：{state.query}
-
+{excerpt_text}
 硬设定规则：
 {rules_text if rules_text else '暂无规则'}
 
@@ -1142,9 +1397,9 @@ def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfi
     ],
     "patch_plan": [
         {{
-            "target": "目标位置",
+            "target": "目标位置（用“”引用要修改的原文片段，须与原文逐字一致）",
             "action": "replace|delete|insert",
-            "content": "内容",
+            "content": "引用了原文片段时为替换/插入后的原文文字（直接写入正文，不要写修改说明）；未引用片段时为修改要求",
             "rationale": "理由"
         }}
     ]
@@ -1154,7 +1409,7 @@ def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfi
 """
     
     messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
+    response = await client.ainvoke(messages=messages, temperature=0)
     
     # 解析结果
     content = response.content
@@ -1192,31 +1447,22 @@ def consistency_check_entry_node(state: QuerySettingInput, config: RunnableConfi
 
 # ==================== 一致性检查节点 ====================
 
-def consistency_check_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
-    """
-    title: 一致性检查
-    desc: 检查内容是否符合设定规则，生成问题列表和修补计划
-    integrations: 大语言模型
-    """
-    ctx = runtime.context
-    
-    # 检查novel_state是否存在
-    if not state.novel_state:
-        return ConsistencyCheckOutput(
-            issues=[],
-            patch_plan=[],
-            passed=True
-        )
-    
-    client = LLMClient(ctx=ctx)
-    
-    # 构建规则上下文
-    rules_text = "\n".join([f"- {rule.content}" for rule in state.novel_state.world.canon_rules.values()])
-    
-    # 构建人物上下文
-    characters_text = "\n".join([f"- {char.name}: {char.description}" for char in state.novel_state.world.entities.values() if char.type == "character"])
-    
-    prompt = f"""请检查以下内容的一致性，返回JSON格式：
+# 各一致性检查节点的检查项
+_CONSISTENCY_CHECKS = ["视角是否一致", "时间线是否有矛盾", "人物属性是否一致", "是否违反硬设定规则"]
+
+
+def _consistency_prompt_builder(state: ConsistencyCheckInput, intro: str, checks: List[str]) -> Callable[[str], str]:
+    """按正文装入规则与人物预算，返回分片提示词构造函数（接收带段落ID的分片正文）"""
+    # 构建规则与人物上下文：按与正文的相关度装入 token 预算
+    rules_text = _pack_rules_text(state.novel_state.world.canon_rules.values(), state.content)
+    characters_text = _pack_entities_text(
+        [char for char in state.novel_state.world.entities.values() if char.type == "character"], state.content,
+        lambda char: f"- {char.name}: {char.description}", "人物"
+    )
+    checks_text = "\n".join(f"{i}. {check}" for i, check in enumerate(checks, 1))
+
+    def build_prompt(annotated_content: str) -> str:
+        return f"""{intro}，返回JSON格式：
 
 章节号：{state.chapter_no}
 场景ID：{state.scene_id or '无'}
@@ -1227,20 +1473,18 @@ def consistency_check_node(state: ConsistencyCheckInput, config: RunnableConfig,
 人物信息：
 {characters_text if characters_text else '暂无人物信息'}
 
-待检查内容：
-{state.content[:2000]}...
+待检查内容（每段以 [段落ID] 开头）：
+{annotated_content}
 
 请检查：
-1. 视角是否一致
-2. 时间线是否有矛盾
-3. 人物属性是否一致
-4. 是否违反硬设定规则
+{checks_text}
 
 返回JSON格式：
 {{
     "issues": [
         {{
             "severity": "blocker|warn|info",
+            "para_id": "问题所在段落的段落ID",
             "where": "位置描述",
             "why": "违反的规则",
             "fix_suggestion": "修复建议",
@@ -1249,9 +1493,10 @@ def consistency_check_node(state: ConsistencyCheckInput, config: RunnableConfig,
     ],
     "patch_plan": [
         {{
-            "target": "目标位置",
+            "para_id": "目标段落的段落ID",
+            "target": "目标位置（用“”引用要修改的原文片段，须与原文逐字一致）",
             "action": "replace|delete|insert",
-            "content": "内容",
+            "content": "引用了原文片段时为替换/插入后的原文文字（直接写入正文，不要写修改说明）；未引用片段时为修改要求",
             "rationale": "理由"
         }}
     ]
@@ -1259,48 +1504,14 @@ def consistency_check_node(state: ConsistencyCheckInput, config: RunnableConfig,
 
 如果没有问题，返回空的issues数组。
 """
-    
-    messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
-    
-    # 解析结果
-    content = response.content
-    if isinstance(content, str):
-        content = content.strip()
-    else:
-        content = str(content)
-    
-    json_start = content.find('{')
-    json_end = content.rfind('}') + 1
-    if json_start >= 0 and json_end > json_start:
-        json_str = content[json_start:json_end]
-        try:
-            data = json.loads(json_str)
-            issues_data = data.get("issues", [])
-            patch_data = data.get("patch_plan", [])
-            
-            issues = [IssueItem(**item) for item in issues_data]
-            patch_plan = [PatchPlanItem(**item) for item in patch_data]
-        except (json.JSONDecodeError, TypeError):
-            issues = []
-            patch_plan = []
-    else:
-        issues = []
-        patch_plan = []
-    
-    passed = len([i for i in issues if i.severity == "blocker"]) == 0
-    
-    return ConsistencyCheckOutput(
-        issues=issues,
-        patch_plan=patch_plan,
-        passed=passed
-    )
+
+    return build_prompt
 
 
-def consistency_check_draft_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
+async def consistency_check_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
     """
-    title: 起草后一致性检查
-    desc: 检查起草内容是否符合设定规则，生成问题列表和修补计划
+    title: 一致性检查
+    desc: 检查内容是否符合设定规则，生成问题列表和修补计划
     integrations: 大语言模型
     """
     ctx = runtime.context
@@ -1313,96 +1524,33 @@ def consistency_check_draft_node(state: ConsistencyCheckInput, config: RunnableC
             passed=True
         )
     
-    client = LLMClient(ctx=ctx)
-    
-    # 构建规则上下文
-    rules_text = "\n".join([f"- {rule.content}" for rule in state.novel_state.world.canon_rules.values()])
-    
-    # 构建人物上下文
-    characters_text = "\n".join([f"- {char.name}: {char.description}" for char in state.novel_state.world.entities.values() if char.type == "character"])
-    
-    prompt = f"""请检查以下内容的一致性，返回JSON格式：
-
-章节号：{state.chapter_no}
-场景ID：{state.scene_id or '无'}
-
-硬设定规则：
-{rules_text if rules_text else '暂无规则'}
+    client = get_llm_gateway().bind(ctx, node="consistency_check")
+    build_prompt = _consistency_prompt_builder(state, "请检查以下内容的一致性", _CONSISTENCY_CHECKS)
+    return await run_consistency_check(client, state.content, state.novel_state, build_prompt)
 
-人物信息：
-{characters_text if characters_text else '暂无人物信息'}
-
-待检查内容：
-{state.content[:2000]}...
-
-请检查：
-1. 视角是否一致
-2. 时间线是否有矛盾
-3. 人物属性是否一致
-4. 是否违反硬设定规则
-
-返回JSON格式：
-{{
-    "issues": [
-        {{
-            "severity": "blocker|warn|info",
-            "where": "位置描述",
-            "why": "违反的规则",
-            "fix_suggestion": "修复建议",
-            "rule_ref": "规则ID"
-        }}
-    ],
-    "patch_plan": [
-        {{
-            "target": "目标位置",
-            "action": "replace|delete|insert",
-            "content": "内容",
-            "rationale": "理由"
-        }}
-    ]
-}}
 
-如果没有问题，返回空的issues数组。
-"""
-    
-    messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
-    
-    # 解析结果
-    content = response.content
-    if isinstance(content, str):
-        content = content.strip()
-    else:
-        content = str(content)
-    
-    json_start = content.find('{')
-    json_end = content.rfind('}') + 1
-    if json_start >= 0 and json_end > json_start:
-        json_str = content[json_start:json_end]
-        try:
-            data = json.loads(json_str)
-            issues_data = data.get("issues", [])
-            patch_data = data.get("patch_plan", [])
-            
-            issues = [IssueItem(**item) for item in issues_data]
-            patch_plan = [PatchPlanItem(**item) for item in patch_data]
-        except (json.JSONDecodeError, TypeError):
-            issues = []
-            patch_plan = []
-    else:
-        issues = []
-        patch_plan = []
+async def consistency_check_draft_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
+    """
+    title: 起草后一致性检查
+    desc: 检查起草内容是否符合设定规则，生成问题列表和修补计划
+    integrations: 大语言模型
+    """
+    ctx = runtime.context
     
-    passed = len([i for i in issues if i.severity == "blocker"]) == 0
+    # 检查novel_state是否存在
+    if not state.novel_state:
+        return ConsistencyCheckOutput(
+            issues=[],
+            patch_plan=[],
+            passed=True
+        )
     
-    return ConsistencyCheckOutput(
-        issues=issues,
-        patch_plan=patch_plan,
-        passed=passed
-    )
+    client = get_llm_gateway().bind(ctx, node="consistency_check_draft")
+    build_prompt = _consistency_prompt_builder(state, "请检查以下内容的一致性", _CONSISTENCY_CHECKS)
+    return await run_consistency_check(client, state.content, state.novel_state, build_prompt)
 
 
-def consistency_check_revise_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
+async def consistency_check_revise_node(state: ConsistencyCheckInput, config: RunnableConfig, runtime: Runtime[Context]) -> ConsistencyCheckOutput:
     """
     title: 改稿后一致性检查
     desc: 检查改稿内容是否符合设定规则，验证修补效果
@@ -1418,99 +1566,15 @@ def consistency_check_revise_node(state: ConsistencyCheckInput, config: Runnable
             passed=True
         )
     
-    client = LLMClient(ctx=ctx)
-    
-    # 构建规则上下文
-    rules_text = "\n".join([f"- {rule.content}" for rule in state.novel_state.world.canon_rules.values()])
-    
-    # 构建人物上下文
-    characters_text = "\n".join([f"- {char.name}: {char.description}" for char in state.novel_state.world.entities.values() if char.type == "character"])
-    
-    prompt = f"""请检查改稿后内容的一致性，验证修补效果，返回JSON格式：
-
-章节号：{state.chapter_no}
-场景ID：{state.scene_id or '无'}
-
-硬设定规则：
-{rules_text if rules_text else '暂无规则'}
-
-人物信息：
-{characters_text if characters_text else '暂无人物信息'}
-
-待检查内容：
-{state.content[:2000]}...
-
-请检查：
-1. 视角是否一致
-2. 时间线是否有矛盾
-3. 人物属性是否一致
-4. 是否违反硬设定规则
-5. 是否成功修复了之前的问题
-
-返回JSON格式：
-{{
-    "issues": [
-        {{
-            "severity": "blocker|warn|info",
-            "where": "位置描述",
-            "why": "违反的规则",
-            "fix_suggestion": "修复建议",
-            "rule_ref": "规则ID"
-        }}
-    ],
-    "patch_plan": [
-        {{
-            "target": "目标位置",
-            "action": "replace|delete|insert",
-            "content": "内容",
-            "rationale": "理由"
-        }}
-    ]
-}}
-
-如果没有问题，返回空的issues数组。
-"""
-    
-    messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
-    
-    # 解析结果
-    content = response.content
-    if isinstance(content, str):
-        content = content.strip()
-    else:
-        content = str(content)
-    
-    json_start = content.find('{')
-    json_end = content.rfind('}') + 1
-    if json_start >= 0 and json_end > json_start:
-        json_str = content[json_start:json_end]
-        try:
-            data = json.loads(json_str)
-            issues_data = data.get("issues", [])
-            patch_data = data.get("patch_plan", [])
-            
-            issues = [IssueItem(**item) for item in issues_data]
-            patch_plan = [PatchPlanItem(**item) for item in patch_data]
-        except (json.JSONDecodeError, TypeError):
-            issues = []
-            patch_plan = []
-    else:
-        issues = []
-        patch_plan = []
-    
-    passed = len([i for i in issues if i.severity == "blocker"]) == 0
-    
-    return ConsistencyCheckOutput(
-        issues=issues,
-        patch_plan=patch_plan,
-        passed=passed
-    )
+    client = get_llm_gateway().bind(ctx, node="consistency_check_revise")
+    build_prompt = _consistency_prompt_builder(state, "请检查改稿后内容的一致性，验证修补效果",
+                                               _CONSISTENCY_CHECKS + ["是否成功修复了之前的问题"])
+    return await run_consistency_check(client, state.content, state.novel_state, build_prompt)
 
 
 # ==================== 改稿流程节点 ====================
 
-def select_revise_mode_node(state: SelectReviseModeInput, config: RunnableConfig, runtime: Runtime[Context]) -> SelectReviseModeOutput:
+async def select_revise_mode_node(state: SelectReviseModeInput, config: RunnableConfig, runtime: Runtime[Context]) -> SelectReviseModeOutput:
     """
     title: 选择改稿模式
     desc: 从用户输入中识别改稿模式（润色/结构重写/剧情修订）
@@ -1518,7 +1582,7 @@ def select_revise_mode_node(state: SelectReviseModeInput, config: RunnableConfig
     """
     ctx = runtime.context
     
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="select_revise_mode")
     
     prompt = f"""请从用户输入中识别改稿模式，返回JSON格式：
 
@@ -1540,7 +1604,7 @@ def select_revise_mode_node(state: SelectReviseModeInput, config: RunnableConfig
 """
     
     messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
+    response = await client.ainvoke(messages=messages, temperature=0)
     
     # 解析结果
     content = response.content
@@ -1574,7 +1638,11 @@ def select_revise_mode_node(state: SelectReviseModeInput, config: RunnableConfig
     )
 
 
-def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableConfig, runtime: Runtime[Context]) -> GenerateRevisePlanOutput:
+# 生成改稿计划时交给 LLM 的正文窗口上限（字）
+REVISE_PLAN_MAX_CHARS = 1500
+
+
+async def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableConfig, runtime: Runtime[Context]) -> GenerateRevisePlanOutput:
     """
     title: 生成改稿计划
     desc: 根据改稿模式和问题列表生成具体的改稿计划
@@ -1582,10 +1650,18 @@ def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableCo
     """
     ctx = runtime.context
     
-    client = LLMClient(ctx=ctx)
+    client = get_llm_gateway().bind(ctx, node="generate_revise_plan")
     
     issues_text = "\n".join([f"- [{i.severity}] {i.where}: {i.why} -> {i.fix_suggestion}" for i in state.issues])
     
+    # 问题已定位到段落时只给出相关段落及其上下文，否则给出开头部分
+    para_index = build_paragraph_index(state.content)
+    focus_ids = [i.para_id for i in state.issues if i.para_id]
+    if focus_ids:
+        content_window = annotate_window(state.content, para_index, focus_ids, max_chars=REVISE_PLAN_MAX_CHARS)
+    else:
+        content_window = annotate_paragraphs(state.content, para_index, max_chars=REVISE_PLAN_MAX_CHARS)
+    
     mode_desc = {
         "polish": "语句润色（不改剧情、不新增设定）",
         "restructure": "结构重写（允许重排段落、加强冲突，但不改关键事件）",
@@ -1599,11 +1675,12 @@ def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableCo
 问题列表：
 {issues_text if issues_text else '无问题'}
 
-待改稿内容：
-{state.content[:1500]}...
+待改稿内容（每段以 [段落ID] 开头，... 表示省略）：
+{content_window}
 
 请生成具体的改稿计划，每个计划项包含：
 - location: 位置描述
+- para_id: 针对具体段落时为该段落的段落ID，针对全文或多个段落时留空
 - action: 操作描述
 - rationale: 理由
 
@@ -1612,6 +1689,7 @@ def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableCo
     "plan": [
         {{
             "location": "位置",
+            "para_id": "段落ID（可选）",
             "action": "操作描述",
             "rationale": "理由"
         }}
@@ -1620,7 +1698,7 @@ def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableCo
 """
     
     messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.5)
+    response = await client.ainvoke(messages=messages, temperature=0.5)
     
     # 解析结果
     content = response.content
@@ -1641,11 +1719,60 @@ def generate_revise_plan_node(state: GenerateRevisePlanInput, config: RunnableCo
             plan = []
     else:
         plan = []
+    bind_anchors(plan, para_index, state.content, "location")
     
     return GenerateRevisePlanOutput(plan=plan)
 
 
-def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runtime: Runtime[Context]) -> ApplyRevisionOutput:
+async def _rewrite_paragraphs_with_llm(client, content: str, para_index, patch_result, patch_plan, failures, mode_text: str) -> Dict[str, str]:
+    """
+    对本地无法应用的修补项做段落级局部重写：只把涉及的段落发给 LLM，返回 {para_id: 重写后的段落}；
+    已被本地修补改动过的段落不参与重写
+    """
+    requests: Dict[str, List[str]] = {}
+    for f in failures:
+        item = patch_plan[f.item_index]
+        para_id = f.para_id or item.para_id
+        if para_id in patch_result.touched_para_ids or para_id not in para_index:
+            continue
+        requests.setdefault(para_id, []).append(f"{item.action}（{item.target}）：{item.content}（{item.rationale}）")
+    if not requests:
+        return {}
+    
+    paragraphs_text = "\n".join(
+        f"[{para_id}] {para_index.text_of(content, para_id)}\n修改要求：" + "；".join(reqs)
+        for para_id, reqs in requests.items()
+    )
+    prompt = f"""请按修改要求重写以下段落，返回JSON格式：
+
+改稿模式：{mode_text}
+
+待重写段落：
+{paragraphs_text}
+
+返回JSON格式（key 为段落ID，value 为重写后的完整段落）：
+{{
+    "段落ID": "重写后的段落"
+}}
+"""
+    messages = [HumanMessage(content=prompt)]
+    response = await client.ainvoke(messages=messages, temperature=0.5, max_completion_tokens=200 + 400 * len(requests))
+    
+    result = response.content if isinstance(response.content, str) else str(response.content)
+    json_start = result.find('{')
+    json_end = result.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        logger.warning("Paragraph rewrite returned no JSON, keeping locally patched content")
+        return {}
+    try:
+        data = json.loads(result[json_start:json_end])
+    except json.JSONDecodeError:
+        logger.warning("Paragraph rewrite returned invalid JSON, keeping locally patched content")
+        return {}
+    return {k: v for k, v in data.items() if k in requests and isinstance(v, str) and v.strip()}
+
+
+async def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runtime: Runtime[Context]) -> ApplyRevisionOutput:
     """
     title: 应用改稿
     desc: 根据改稿计划对原文进行修改
@@ -1653,9 +1780,9 @@ def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runti
     """
     ctx = runtime.context
     
-    client = LLMClient(ctx=ctx)
-    
-    plan_text = "\n".join([f"{i+1}. 位置：{item.location}，操作：{item.action}，理由：{item.rationale}" for i, item in enumerate(state.plan)])
+    # 段落重写返回 JSON，不推送；全文改稿的正文逐 token 推送给客户端
+    client = get_llm_gateway().bind(ctx, node="apply_revision")
+    prose_client = get_llm_gateway().bind(ctx, node="apply_revision", stream=True)
     
     mode_desc = {
         "polish": "语句润色（不改剧情、不新增设定）",
@@ -1663,6 +1790,64 @@ def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runti
         "plot_revision": "剧情修订（允许改事件）"
     }
     
+    original_content = state.original_content
+    plan_items = [f"位置：{item.location}，操作：{item.action}，理由：{item.rationale}" for item in state.plan]
+    
+    # 有修补计划时先在本地确定性应用，无法应用的项按段落交给 LLM 局部重写
+    if state.patch_plan:
+        para_index = build_paragraph_index(original_content)
+        patch_result = apply_patch_plan(original_content, state.patch_plan, para_index)
+        revised_content = patch_result.content
+        
+        scoped = [f for f in patch_result.failed if f.para_id or state.patch_plan[f.item_index].para_id]
+        unscoped = [f for f in patch_result.failed if f not in scoped]
+        rewrites: Dict[str, str] = {}
+        if scoped:
+            rewrites = await _rewrite_paragraphs_with_llm(
+                client, original_content, para_index, patch_result, state.patch_plan, scoped,
+                mode_desc.get(state.mode, state.mode)
+            )
+            if rewrites:
+                # 重写段落均未被本地修补改动，与已应用项一起基于原文偏移重新应用一次
+                rewrite_items = [
+                    PatchPlanItem(target="", para_id=para_id, action="replace", content=text, rationale="段落重写",
+                                  literal=True)
+                    for para_id, text in rewrites.items()
+                ]
+                applied_items = [state.patch_plan[i] for i in patch_result.applied]
+                revised_content = apply_patch_plan(original_content, applied_items + rewrite_items, para_index).content
+        
+        # 改稿计划中没有被修补项覆盖的指令（未指定段落，或所指段落未被修补/重写）仍需交给 LLM
+        covered = set(patch_result.touched_para_ids) | set(rewrites)
+        covered.update(state.patch_plan[i].para_id for i in patch_result.applied if state.patch_plan[i].para_id)
+        uncovered_plan = [item for item in state.plan if not (item.para_id and item.para_id in covered)]
+        
+        logger.info(
+            f"Patch plan applied locally: {len(patch_result.applied)} applied, "
+            f"{len(rewrites)} paragraphs rewritten, {len(unscoped)} unresolved, "
+            f"{len(uncovered_plan)} plan items not covered"
+        )
+        if not unscoped and not uncovered_plan:
+            diff_summary = (
+                f"改稿模式：{state.mode}，本地修补 {len(patch_result.applied)} 项，"
+                f"段落重写 {len(rewrites)} 段\n"
+                + summarize_diff(diff_texts(state.original_content, revised_content))
+            )
+            return ApplyRevisionOutput(
+                revised_content=revised_content,
+                diff_summary=diff_summary
+            )
+        
+        # 仍有无法定位的修补项或未覆盖的计划项：以本地修补后的正文为底稿，交给 LLM 全文处理剩余项
+        original_content = revised_content
+        plan_items = [
+            f"位置：{state.patch_plan[f.item_index].target}，操作：{state.patch_plan[f.item_index].action}"
+            f"「{state.patch_plan[f.item_index].content}」，理由：{state.patch_plan[f.item_index].rationale}"
+            for f in unscoped
+        ] + [f"位置：{item.location}，操作：{item.action}，理由：{item.rationale}" for item in uncovered_plan]
+    
+    plan_text = "\n".join([f"{i+1}. {item}" for i, item in enumerate(plan_items)])
+    
     prompt = f"""请根据改稿计划对原文进行修改，返回改后的内容：
 
 改稿模式：{mode_desc.get(state.mode, state.mode)}
@@ -1671,7 +1856,7 @@ def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runti
 {plan_text if plan_text else '无具体计划，请根据模式进行通用修改'}
 
 原文：
-{state.original_content}
+{original_content}
 
 要求：
 1. 直接返回改后的内容，不要有任何前言或后言
@@ -1680,7 +1865,7 @@ def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runti
 """
     
     messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.7, max_completion_tokens=4000)
+    response = await prose_client.ainvoke(messages=messages, temperature=0.7, max_completion_tokens=4000)
     
     revised_content = response.content
     if isinstance(revised_content, str):
@@ -1688,7 +1873,7 @@ def apply_revision_node(state: ApplyRevisionInput, config: RunnableConfig, runti
     else:
         revised_content = str(revised_content)
     
-    diff_summary = f"改稿模式：{state.mode}，修改计划项数：{len(state.plan)}"
+    diff_summary = f"改稿模式：{state.mode}\n" + summarize_diff(diff_texts(state.original_content, revised_content))
     
     return ApplyRevisionOutput(
         revised_content=revised_content,
@@ -1710,13 +1895,28 @@ def save_version_node(state: SaveVersionInput, config: RunnableConfig, runtime:
     chapter_dir = f"{project_dir}/chapter_{state.chapter_no}"
     file_path = f"{chapter_dir}/v{updated_state.current_version}.md"
     
-    # 创建目录
-    import os
-    os.makedirs(chapter_dir, exist_ok=True)
+    # 保存正文文件（经资产存储写入，多实例共享）及段落索引
+    asset_store = get_asset_store()
+    asset_store.write_text(file_path, state.content)
+    para_index = save_paragraph_index(asset_store, file_path, state.content)
     
-    # 保存正文文件
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(state.content)
+    # 与章节上一版本做 diff 并持久化，事件中只记录 diff 文件路径与统计
+    diff_delta: Dict[str, Any] = {}
+    previous = updated_state.chapters.get(state.chapter_no)
+    if previous and previous.file_path and previous.file_path != file_path:
+        try:
+            previous_content = asset_store.read_text(previous.file_path)
+            diff = diff_texts(previous_content, state.content, previous.current_version, updated_state.current_version)
+            diff_delta = {
+                "diff_path": save_diff(asset_store, file_path, diff),
+                "base_version": previous.current_version,
+                "hunks": len(diff.hunks),
+                "inserted_chars": diff.inserted_chars,
+                "deleted_chars": diff.deleted_chars,
+                "changed_para_ids": diff.changed_para_ids,
+            }
+        except FileNotFoundError:
+            logger.warning(f"Previous chapter version not found: {previous.file_path}, skip diff")
     
     # 更新章节信息
     if state.chapter_no not in updated_state.chapters:
@@ -1765,13 +1965,16 @@ def save_version_node(state: SaveVersionInput, config: RunnableConfig, runtime:
             )
             mgr.update_snapshot(db, snapshot_in)
             
+            # 快照落库后再增量更新全文检索索引，避免索引中出现未提交的版本
+            update_search_index(updated_state, state.chapter_no, new_version - 1, state.content, para_index)
+            
             # 记录事件
             event_in = StateEventCreate(
                 project_id=updated_state.project_id,
                 event_type=state.event_type,
                 version_before=new_version - 1,
                 version_after=new_version,
-                state_delta={},
+                state_delta=diff_delta,
                 chapter_ref=state.chapter_no,
                 scene_ref=None,
                 description=f"保存版本 {new_version}"
@@ -1867,6 +2070,15 @@ def merge_proposals_node(state: MergeProposalsInput, config: RunnableConfig, run
 
 # ==================== 查询设定流程节点 ====================
 
+# “X 第一次出现在哪一章”类查询
+_FIRST_APPEARANCE_RE = re.compile(
+    r"[「“\"]?(?P<term>[^「」“”\"\s，。？?]{1,20}?)[」”\"]?\s*(?:是)?(?:在)?(?:哪里|哪儿|哪一?章|什么时候|何时)?\s*"
+    r"(?:第一次|首次|最早|最先)\s*(?:是)?(?:在)?(?:哪里|哪儿|哪一?章)?\s*(?:出现|出场|登场|提到|提及)"
+)
+# 查询设定时交给 LLM 的检索结果条数
+QUERY_SEARCH_LIMIT = 12
+
+
 def query_setting_node(state: QuerySettingInput, config: RunnableConfig, runtime: Runtime[Context]) -> QuerySettingOutput:
     """
     title: 查询设定
@@ -1886,12 +2098,39 @@ def query_setting_node(state: QuerySettingInput, config: RunnableConfig, runtime
             }]
         )
     
-    client = LLMClient(ctx=ctx)
-    
-    # 构建设定信息文本
-    entities_text = "\n".join([f"- {char.name}（{char.type}）: {char.description}" for char in state.novel_state.world.entities.values()])
-    rules_text = "\n".join([f"- {rule.content}" for rule in state.novel_state.world.canon_rules.values()])
-    outline_text = "\n".join([f"{i+1}. {beat.title}: {beat.description}" for i, beat in enumerate(state.novel_state.outline)])
+    # 全文检索：“X 第一次出现在哪”直接查索引返回，其余查询只把检索命中的设定/正文片段交给 LLM
+    search_index = get_search_index(state.novel_state.project_id, state.novel_state)
+    first_match = _FIRST_APPEARANCE_RE.search(state.query or "")
+    if first_match:
+        term = first_match.group("term")
+        hit = search_index.first_appearance(term)
+        if hit is not None:
+            return QuerySettingOutput(results=[{
+                "type": "chapter",
+                "name": f"第{hit.ref}章",
+                "content": hit.snippet,
+                "relevance": f"「{term}」首次出现（段落 {hit.para_id}，段内偏移 {hit.offset}）"
+            }])
+        logger.info(f"First appearance of '{term}' not found in chapters, falling back to LLM")
+    
+    hits = search_index.search(state.query or "", limit=QUERY_SEARCH_LIMIT)
+    hit_refs = {(h.doc_type, h.ref) for h in hits}
+    entities = list(state.novel_state.world.entities.values())
+    rules = list(state.novel_state.world.canon_rules.values())
+    outline = list(state.novel_state.outline)
+    if hits:
+        entities = [e for e in entities if ("entity", e.entity_id) in hit_refs]
+        rules = [r for r in rules if ("rule", r.rule_id) in hit_refs]
+        outline = [b for b in outline if ("outline", b.beat_id) in hit_refs]
+    passages_text = "\n".join([f"- 第{h.ref}章 [{h.para_id}]: {h.snippet}" for h in hits if h.doc_type == "chapter"])
+    
+    client = get_llm_gateway().bind(ctx, node="query_setting")
+    
+    # 构建设定信息文本（按与查询及命中片段的相关度装入 token 预算）
+    relevance_query = f"{state.query or ''}\n{passages_text}"
+    entities_text = _pack_entities_text(entities, relevance_query, lambda char: f"- {char.name}（{char.type}）: {char.description}", "设定")
+    rules_text = _pack_rules_text(rules, relevance_query)
+    outline_text = "\n".join([f"{beat.sequence}. {beat.title}: {beat.description}" for beat in outline])
     
     prompt = f"""请根据查询内容从以下设定中查找相关信息，返回JSON格式：
 
@@ -1906,11 +2145,14 @@ def query_setting_node(state: QuerySettingInput, config: RunnableConfig, runtime
 大纲：
 {outline_text if outline_text else '暂无大纲'}
 
+正文相关片段：
+{passages_text if passages_text else '无'}
+
 请返回相关的设定信息，格式如下：
 {{
     "results": [
         {{
-            "type": "character|location|rule|outline",
+            "type": "character|location|rule|outline|chapter",
             "name": "名称",
             "content": "内容",
             "relevance": "相关性描述"
@@ -1920,7 +2162,7 @@ def query_setting_node(state: QuerySettingInput, config: RunnableConfig, runtime
 """
     
     messages = [HumanMessage(content=prompt)]
-    response = client.invoke(messages=messages, temperature=0.3)
+    response = client.invoke(messages=messages, temperature=0)
     
     # 解析结果
     content = response.content
@@ -1960,36 +2202,34 @@ def export_node(state: ExportInput, config: RunnableConfig, runtime: Runtime[Con
         )
     
     project_dir = f"assets/{state.novel_state.project_id}"
-    os.makedirs(project_dir, exist_ok=True)
+    asset_store = get_asset_store()
     
     # 按章节顺序导出
     chapters = sorted(state.novel_state.chapters.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0)
     
-    full_content = f"# {state.novel_state.project.title}\n\n"
-    
-    for chapter_no, chapter_info in chapters:
-        # 读取章节内容
-        if chapter_info.file_path:
-            file_path = os.path.join(os.getenv("COZE_WORKSPACE_PATH"), chapter_info.file_path)
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    chapter_content = f.read()
-                
-                full_content += f"## {chapter_info.title}\n\n{chapter_content}\n\n"
+    def iter_export():
+        # 按字节流式写出：章节正文直接从映射文件按块读取，不做解码/再编码，也不拼接整本书
+        yield f"# {state.novel_state.project.title}\n\n".encode('utf-8')
+        for chapter_no, chapter_info in chapters:
+            # 读取章节内容（本地未命中时从对象存储回源）
+            if not chapter_info.file_path:
+                continue
+            try:
+                reader = open_chapter(chapter_info.file_path, asset_store)
+            except FileNotFoundError:
+                logger.warning(f"Chapter file not found: {chapter_info.file_path}")
+                continue
+            with reader:
+                yield f"## {chapter_info.title}\n\n".encode('utf-8')
+                yield from reader.iter_bytes()
+                yield b"\n\n"
     
     # 保存文件
-    if state.format == "markdown":
-        output_path = f"{project_dir}/export.md"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_content)
-    elif state.format == "txt":
+    if state.format == "txt":
         output_path = f"{project_dir}/export.txt"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_content)
     else:
         output_path = f"{project_dir}/export.md"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_content)
+    asset_store.write_chunks(output_path, iter_export())
     
     return ExportOutput(
         output_path=output_path,
@@ -163,8 +163,11 @@ class GraphInput(BaseModel):
     """工作流输入"""
     user_input: str = Field(..., description="用户输入文本")
     project_id: Optional[str] = Field(default=None, description="项目ID（可选，已有项目时提供）")
+    patch_plan: Optional[List["PatchPlanItem"]] = Field(default=None, description="修补计划（可选，改稿时直接应用上次一致性检查给出的修补项）")
+    intent: Optional[str] = Field(default=None, description="显式意图（可选，程序化调用时提供则跳过意图识别）")
+    parameters: Optional[Dict[str, Any]] = Field(default=None, description="显式意图参数（可选，与 intent 一起提供）")
 
-# GraphOutput 将在 GlobalState 之后定义，因为它引用了 IssueItem
+# GraphOutput 将在 GlobalState 之后定义，因为它引用了 IssueItem；GraphInput 的 PatchPlanItem 前向引用在文件末尾解析
 
 
 # ==================== 节点输入输出定义 ====================
@@ -174,6 +177,8 @@ class IntentRouterInput(BaseModel):
     """意图识别节点输入"""
     user_input: str = Field(..., description="用户输入文本")
     project_id: Optional[str] = Field(default=None, description="项目ID")
+    intent: Optional[str] = Field(default=None, description="显式意图（提供时跳过意图识别）")
+    parameters: Optional[Dict[str, Any]] = Field(default=None, description="显式意图参数")
 
 
 class IntentRouterOutput(BaseModel):
@@ -269,6 +274,7 @@ class ContextPack(BaseModel):
     relevant_rules: Dict[str, CanonRule] = Field(default={}, description="相关规则")
     style_bible: StyleBible = Field(..., description="文风约束")
     chapter_summary: str = Field(default="", description="章节摘要")
+    omitted: Dict[str, List[str]] = Field(default={}, description="因 token 预算省略的条目ID（key: rules/timeline）")
 
 
 class BuildContextPackOutput(BaseModel):
@@ -326,6 +332,7 @@ class IssueItem(BaseModel):
     """问题项"""
     severity: Literal["blocker", "warn", "info"] = Field(..., description="严重程度")
     where: str = Field(..., description="位置（chapter/scene/段落索引或引用片段）")
+    para_id: Optional[str] = Field(default=None, description="段落锚点ID（对应章节版本段落索引，可 O(1) 定位）")
     why: str = Field(..., description="违反的规则/设定")
     fix_suggestion: str = Field(..., description="修复建议")
     rule_ref: Optional[str] = Field(default=None, description="引用的规则ID")
@@ -334,9 +341,11 @@ class IssueItem(BaseModel):
 class PatchPlanItem(BaseModel):
     """修补计划项"""
     target: str = Field(..., description="目标位置")
+    para_id: Optional[str] = Field(default=None, description="目标段落锚点ID")
     action: Literal["replace", "delete", "insert"] = Field(..., description="操作类型")
-    content: str = Field(..., description="内容")
+    content: str = Field(..., description="内容（target 引用了原文片段时为替换/插入的原文；否则为修改要求）")
     rationale: str = Field(..., description="理由")
+    literal: bool = Field(default=False, description="content 是否为可直接写入正文的整段原文（段落级替换/插入时生效）")
 
 
 class ConsistencyCheckOutput(BaseModel):
@@ -370,6 +379,7 @@ class GenerateRevisePlanInput(BaseModel):
 class RevisePlanItem(BaseModel):
     """改稿计划项"""
     location: str = Field(..., description="位置")
+    para_id: Optional[str] = Field(default=None, description="目标段落锚点ID（计划项针对具体段落时）")
     action: str = Field(..., description="操作描述")
     rationale: str = Field(..., description="理由")
 
@@ -384,6 +394,7 @@ class ApplyRevisionInput(BaseModel):
     plan: List[RevisePlanItem] = Field(..., description="改稿计划")
     original_content: str = Field(..., description="原文内容")
     mode: Literal["polish", "restructure", "plot_revision"] = Field(..., description="改稿模式")
+    patch_plan: Optional[List[PatchPlanItem]] = Field(default=None, description="修补计划（提供时优先本地应用，仅对无法应用的段落调用LLM）")
 
 
 class ApplyRevisionOutput(BaseModel):
@@ -530,3 +541,7 @@ class GraphOutput(BaseModel):
     issues: List[IssueItem] = Field(default=[], description="一致性问题列表")
     proposals: List[Proposal] = Field(default=[], description="待审批提案列表")
     output_files: List[str] = Field(default=[], description="输出文件路径列表")
+
+
+# GraphInput 引用了在其后定义的 PatchPlanItem，需要在此解析前向引用
+GraphInput.model_rebuild()
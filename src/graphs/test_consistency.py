@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试脚本：分片一致性检查 split_chunks / merge_results / check_chunks
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from graphs.consistency import ConsistencyChunk, check_chunks, merge_results, run_consistency_check, split_chunks
+from graphs.state import IssueItem, NovelState, PatchPlanItem
+from utils.text.paragraph import build_paragraph_index
+
+TEXT = "\n".join(f"第{i}段，林远走在路上，天色渐暗。" for i in range(1, 11))
+
+
+def _issue(para_id, why="人物属性矛盾", severity="warn") -> IssueItem:
+    return IssueItem(severity=severity, where="某处", para_id=para_id, why=why, fix_suggestion="修改")
+
+
+def _patch(para_id, content) -> PatchPlanItem:
+    return PatchPlanItem(target="“林远”", para_id=para_id, action="replace", content=content, rationale="测试")
+
+
+class _FakeClient:
+    """按分片返回预设结果；提示词中包含 fail_marker 时抛出异常"""
+
+    def __init__(self, fail_marker=None):
+        self.prompts = []
+        self.fail_marker = fail_marker
+
+    async def ainvoke(self, messages, **params):
+        prompt = messages[0].content
+        self.prompts.append(prompt)
+        if self.fail_marker and self.fail_marker in prompt:
+            raise RuntimeError("upstream error")
+        # 每个分片都报告其第 1 段的问题（重叠段落会被两个分片重复报告）
+        data = {"issues": [{"severity": "warn", "where": "第1段", "why": "天色描写矛盾", "fix_suggestion": "统一"}],
+                "patch_plan": []}
+        return SimpleNamespace(content=json.dumps(data, ensure_ascii=False))
+
+
+def test_split_chunks_cover_all_paragraphs_with_overlap():
+    index = build_paragraph_index(TEXT)
+    chunks = split_chunks(index, max_chars=80, overlap=1)
+    assert len(chunks) > 1
+    assert chunks[0].para_start == 0 and chunks[-1].para_end == len(index)
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.para_start == prev.para_end - 1
+        assert cur.overlap == 1
+    assert chunks[0].overlap == 0
+
+
+def test_split_chunks_oversized_paragraph_and_single_chunk():
+    index = build_paragraph_index("短。\n" + "长" * 500 + "\n短。")
+    chunks = split_chunks(index, max_chars=100, overlap=0)
+    assert [(c.para_start, c.para_end) for c in chunks] == [(0, 1), (1, 2), (2, 3)]
+    assert len(split_chunks(build_paragraph_index(TEXT), max_chars=10000)) == 1
+    assert split_chunks(build_paragraph_index("")) == []
+
+
+def test_merge_results_dedup_and_owned_patch():
+    index = build_paragraph_index(TEXT)
+    p = [a.para_id for a in index.paragraphs]
+    first = ConsistencyChunk(chunk_no=0, para_start=0, para_end=4)
+    second = ConsistencyChunk(chunk_no=1, para_start=3, para_end=8, overlap=1)
+    issues, patches = merge_results([
+        (first, [_issue(p[3]), _issue(p[1], why="时间线矛盾")], [_patch(p[3], "第一分片")]),
+        (second, [_issue(p[3], why="人物属性矛盾。", severity="blocker")], [_patch(p[3], "第二分片")]),
+    ], index)
+    # 同段落同原因只保留一条，取更高的严重程度；按段落顺序输出
+    assert [(i.para_id, i.severity) for i in issues] == [(p[1], "warn"), (p[3], "blocker")]
+    # 第4段在第二分片的重叠区内，修补项取第一分片（该段的“所有者”）给出的
+    assert [pp.content for pp in patches] == ["第一分片"]
+
+
+def test_check_chunks_maps_refs_and_reports_failed_chunk():
+    index = build_paragraph_index(TEXT)
+    chunks = split_chunks(index, max_chars=120)
+    assert len(chunks) >= 3
+    fail_para = index.paragraphs[chunks[1].para_start].para_id
+    client = _FakeClient(fail_marker=fail_para)
+    issues, _ = asyncio.run(check_chunks(client, TEXT, index, lambda annotated: annotated, max_chars=120))
+    assert len(client.prompts) == len(chunks)
+    by_para = {i.para_id: i for i in issues}
+    # 分片内的“第1段”映射为各分片首段的章节锚点
+    for chunk in chunks:
+        assert index.paragraphs[chunk.para_start].para_id in by_para
+    failed = by_para[fail_para]
+    assert failed.severity == "info" and "未完成检查" in failed.why
+
+
+def test_run_consistency_check_skips_llm_on_taboo():
+    state = NovelState.model_validate({"project_id": "test", "project": {"title": "测试", "genre": "悬疑"},
+                                       "style": {"taboos": ["天色渐暗"]}})
+    client = _FakeClient()
+    output = asyncio.run(run_consistency_check(client, TEXT, state, lambda annotated: annotated))
+    assert not output.passed
+    assert client.prompts == []
+    assert all(i.rule_ref == "style.taboos" for i in output.issues)
+
+    state.style.taboos = []
+    output = asyncio.run(run_consistency_check(client, TEXT, state, lambda annotated: annotated))
+    assert output.passed and output.issues and client.prompts
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
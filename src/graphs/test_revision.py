@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试脚本：应用改稿 apply_revision_node 的本地修补与 LLM 兜底
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage
+
+import graphs.node as node
+from graphs.state import ApplyRevisionInput, PatchPlanItem, RevisePlanItem
+from utils.text.paragraph import build_paragraph_index
+
+TEXT = "开头的风很冷。\n他叹了口气，推开门。\n屋里没有人。"
+PARA_IDS = [p.para_id for p in build_paragraph_index(TEXT).paragraphs]
+
+
+class _FakeClient:
+    """记录全文改稿提示词，返回固定的改后正文"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, messages, **params):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content="改写后的全文")
+
+
+def _run(monkeypatch, plan):
+    client = _FakeClient()
+    monkeypatch.setattr(node, "get_llm_gateway", lambda: SimpleNamespace(bind=lambda ctx, **kwargs: client))
+    state = ApplyRevisionInput(
+        plan=plan, original_content=TEXT, mode="polish",
+        patch_plan=[PatchPlanItem(target="第2段“叹了口气”", action="replace", content="笑了笑", rationale="测试")],
+    )
+    output = asyncio.run(node.apply_revision_node(state, {}, SimpleNamespace(context=None)))
+    return output, client
+
+
+def test_plan_covered_by_patches_skips_llm(monkeypatch):
+    plan = [RevisePlanItem(location="第2段", para_id=PARA_IDS[1], action="调整动作", rationale="测试")]
+    output, client = _run(monkeypatch, plan)
+    assert client.prompts == []
+    assert output.revised_content == "开头的风很冷。\n他笑了笑，推开门。\n屋里没有人。"
+
+
+def test_uncovered_plan_falls_back_to_llm(monkeypatch):
+    plan = [
+        RevisePlanItem(location="第2段", para_id=PARA_IDS[1], action="调整动作", rationale="测试"),
+        RevisePlanItem(location="全文", action="加强环境描写", rationale="氛围不足"),
+        RevisePlanItem(location="第3段", para_id=PARA_IDS[2], action="补充细节", rationale="过于简略"),
+    ]
+    output, client = _run(monkeypatch, plan)
+    assert output.revised_content == "改写后的全文"
+    assert len(client.prompts) == 1
+    prompt = client.prompts[0]
+    # 以本地修补后的正文为底稿，只交给 LLM 未被修补项覆盖的计划项
+    assert "他笑了笑，推开门。" in prompt
+    assert "加强环境描写" in prompt and "补充细节" in prompt
+    assert "调整动作" not in prompt
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
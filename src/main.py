@@ -41,15 +41,57 @@ from utils.helper.agent_helper import (
     to_stream_input,
     to_client_message,
     agent_iter_server_messages,
+    merge_custom_stream,
 )
 from utils.log.parser import LangGraphParser
 from utils.log.err_trace import extract_core_stack
 from utils.log.loop_trace import init_run_config, init_agent_config
+from storage.asset.asset_store import get_asset_store
+from storage.search.text_index import get_search_index
+from utils.text.diff import TextDiff, diff_texts, load_diff, summarize_diff
+from utils.llm.gateway import get_llm_gateway
+from utils.llm.client_pool import get_llm_client_pool
+from utils.text.intent_classifier import get_intent_classifier
 
 
 # 超时配置常量
 TIMEOUT_SECONDS = 900  # 15分钟
 
+
+def _iter_async(aiterable: AsyncIterable[Any], loop: Optional[asyncio.AbstractEventLoop] = None) -> Iterable[Any]:
+    """
+    在同步代码中逐项消费异步迭代器：指定 loop（在其他线程运行的事件循环）时提交到该事件循环执行，
+    否则在当前线程新建事件循环执行
+    """
+    ait = aiterable.__aiter__()
+
+    async def _next():
+        return await ait.__anext__()
+
+    async def _close():
+        aclose = getattr(ait, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    own_loop = asyncio.new_event_loop() if loop is None else None
+    if own_loop is not None:
+        run = own_loop.run_until_complete
+    else:
+        run = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+    try:
+        while True:
+            try:
+                item = run(_next())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        try:
+            run(_close())
+        finally:
+            if own_loop is not None:
+                own_loop.close()
+
 class GraphService:
     def __init__(self):
         if not graph_helper.is_agent_proj():
@@ -80,7 +122,7 @@ class GraphService:
         stream_input = to_stream_input(client_msg)
         t0 = time.time()
         try:
-            items = self._get_graph(ctx).stream(stream_input, stream_mode="messages", config=run_config, context=ctx)
+            items = merge_custom_stream(_iter_async(self._get_graph(ctx).astream(stream_input, stream_mode=["messages", "custom"], config=run_config, context=ctx)))
             server_msgs_iter = agent_iter_server_messages(
                 items,
                 session_id=client_msg.session_id,
@@ -251,14 +293,14 @@ class GraphService:
         run_config["configurable"] = {"thread_id": session_id}
         stream_input = to_stream_input(client_msg)
 
-        # 使用后台线程拉取同步流，并通过事件循环安全地推送到异步队列
+        # 图在当前事件循环上原生异步执行；消息转换在后台线程逐项拉取，并通过事件循环安全地推送到异步队列
         loop = asyncio.get_running_loop()
         q: asyncio.Queue = asyncio.Queue()
         context = contextvars.copy_context()
         start_time = time.time()
         def producer():
             try:
-                items = graph.stream(stream_input, stream_mode="messages", config=run_config, context=ctx)
+                items = merge_custom_stream(_iter_async(graph.astream(stream_input, stream_mode=["messages", "custom"], config=run_config, context=ctx), loop))
                 server_msgs_iter = agent_iter_server_messages(
                     items,
                     session_id=client_msg.session_id,
@@ -534,6 +576,89 @@ async def http_node_run(node_id: str, request: Request):
         cozeloop.flush()
 
 
+@app.get(path="/projects/{project_id}/chapters/{chapter_no}/diff")
+async def http_chapter_diff(project_id: str, chapter_no: str, version: int, base_version: Optional[int] = None):
+    """
+    查询章节版本差异
+    - 仅提供 version: 返回该版本保存时与上一版本的 diff（save_version 时持久化）
+    - 同时提供 base_version: 返回两个指定版本之间的 diff（与持久化 diff 的基线一致时直接复用）
+    """
+    asset_store = get_asset_store()
+    chapter_dir = f"assets/{project_id}/chapter_{chapter_no}"
+    file_path = f"{chapter_dir}/v{version}.md"
+
+    def _load() -> Optional[TextDiff]:
+        diff = load_diff(asset_store, file_path)
+        if diff is not None and (base_version is None or diff.base_version == base_version):
+            return diff
+        if base_version is None:
+            return None
+        try:
+            old = asset_store.read_text(f"{chapter_dir}/v{base_version}.md")
+            new = asset_store.read_text(file_path)
+        except FileNotFoundError:
+            return None
+        return diff_texts(old, new, base_version, version)
+
+    diff = await asyncio.to_thread(_load)
+    if diff is None:
+        raise HTTPException(status_code=404, detail=f"diff not found for chapter {chapter_no} version {version}")
+    return {
+        **diff.model_dump(),
+        "summary": summarize_diff(diff),
+    }
+
+
+def _load_novel_state(project_id: str):
+    """从数据库快照加载 NovelState，项目不存在时返回 None"""
+    from graphs.state import NovelState
+    from storage.database.db import get_session
+    from storage.database.novel_manager import NovelStateManager
+    db = get_session()
+    try:
+        snapshot = NovelStateManager().get_snapshot(db, project_id)
+        return NovelState(**snapshot.snapshot) if snapshot else None
+    finally:
+        db.close()
+
+
+async def _get_project_search_index(project_id: str):
+    def _load():
+        novel_state = _load_novel_state(project_id)
+        return get_search_index(project_id, novel_state) if novel_state else None
+
+    try:
+        index = await asyncio.to_thread(_load)
+    except Exception as e:
+        logger.error(f"Failed to load search index for {project_id}: {e}")
+        raise HTTPException(status_code=503, detail=f"failed to load project {project_id}: {e}")
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"project {project_id} not found")
+    return index
+
+
+@app.get(path="/projects/{project_id}/search")
+async def http_search(project_id: str, q: str, limit: int = 10, types: Optional[str] = None):
+    """
+    全文检索章节正文与世界观数据（BM25）
+    - types: 逗号分隔的文档类型过滤（chapter/entity/rule/timeline/outline）
+    """
+    index = await _get_project_search_index(project_id)
+    doc_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    hits = index.search(q, limit=max(1, min(limit, 100)), doc_types=doc_types)
+    return {"query": q, "hits": [h.model_dump() for h in hits]}
+
+
+@app.get(path="/projects/{project_id}/first_appearance")
+async def http_first_appearance(project_id: str, term: str):
+    """查询词语在正文中的首次出现位置（章节序 + 段落序）"""
+    index = await _get_project_search_index(project_id)
+    hit = index.first_appearance(term)
+    if hit is None:
+        raise HTTPException(status_code=404, detail=f"'{term}' not found in chapters")
+    return hit.model_dump()
+
+
 @app.get("/health")
 async def health_check():
     try:
@@ -546,6 +671,16 @@ async def health_check():
         raise HTTPException(status_code=503, detail=str(e))
 
 
+@app.get("/llm/stats")
+async def http_llm_stats():
+    """大模型网关缓存、连接池与本地意图分类统计"""
+    return {
+        "gateway": get_llm_gateway().stats(),
+        "pool": get_llm_client_pool().stats(),
+        "intent": get_intent_classifier().stats(),
+    }
+
+
 @app.get(path="/graph_parameter")
 async def http_graph_inout_parameter(request: Request):
     return service.graph_inout_schema()
@@ -0,0 +1,294 @@
+"""
+NovelOS 资产垃圾回收
+清理 assets/ 下不再被引用的文件：
+- 项目在 novel_state_snapshot 中不存在（创建时写库失败、临时项目 temp、已废弃项目）：整个项目目录
+- 项目存在：未被快照（章节当前版本、change_log）和 state_events（版本号、diff 基线）引用的章节版本文件，
+  版本的 .para.json / .diff.json 附属文件随正文版本一起处理
+
+安全约束：
+- 文件修改时间在宽限期内不处理（覆盖“文件已写入、快照尚未落库”的窗口）；无快照的项目以目录内最新文件为准
+- 读取数据库失败的项目整体跳过，不会因为查不到引用而误删
+- 默认归档到 assets/.archive/{日期}/ 而非删除
+
+增量执行：按项目的路径字典序遍历，每次最多处理 max_projects 个项目，游标保存在 assets/.gc_state.json，
+下次从游标处继续，遍历完一轮后从头开始。
+
+用法：python -m storage.asset.asset_gc [--mode archive|delete] [--dry-run] [--max-projects N] [--grace-hours H]
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from storage.asset.asset_store import AssetStore, get_asset_store
+
+logger = logging.getLogger(__name__)
+
+# 宽限期（小时）：修改时间在此之内的文件不回收
+ASSET_GC_GRACE_HOURS = float(os.getenv("NOVELOS_ASSET_GC_GRACE_HOURS", "72"))
+# 回收方式：archive（移动到归档目录）/ delete（直接删除）
+ASSET_GC_MODE = os.getenv("NOVELOS_ASSET_GC_MODE", "archive")
+# 归档目录与游标文件
+ARCHIVE_PREFIX = "assets/.archive"
+GC_STATE_PATH = "assets/.gc_state.json"
+# 报告中列出的回收文件数上限
+REPORT_MAX_PATHS = 200
+
+# 项目目录内的章节版本文件：chapter_{n}/v{version}.md 及其附属文件
+_VERSION_FILE_RE = re.compile(r"^chapter_(?P<chapter>[^/]+)/v(?P<version>\d+)\.(?:md|para\.json|diff\.json)$")
+
+# 引用加载函数：返回项目被引用的章节版本（chapter_no, version）集合，项目不存在时返回 None
+ReferenceLoader = Callable[[str], Optional[Set[Tuple[str, int]]]]
+
+
+class GCReport(BaseModel):
+    """垃圾回收报告"""
+    mode: str = Field(..., description="回收方式：archive/delete")
+    dry_run: bool = Field(default=False, description="是否仅统计不执行")
+    scanned_projects: int = Field(default=0, description="扫描的项目数")
+    scanned_files: int = Field(default=0, description="扫描的文件数")
+    scanned_bytes: int = Field(default=0, description="扫描的文件总字节数")
+    orphan_projects: List[str] = Field(default=[], description="整体回收的项目（无快照）")
+    reclaimed_files: int = Field(default=0, description="回收的文件数")
+    reclaimed_bytes: int = Field(default=0, description="回收的字节数")
+    reclaimed_paths: List[str] = Field(default=[], description="回收的文件路径（最多列出 REPORT_MAX_PATHS 个）")
+    skipped_in_grace: int = Field(default=0, description="未被引用但仍在宽限期内的文件数")
+    skipped_projects: List[str] = Field(default=[], description="读取引用失败而跳过的项目")
+    errors: List[str] = Field(default=[], description="回收失败的文件及原因")
+    cursor: Optional[str] = Field(default=None, description="本次结束时的游标（最后处理的项目ID），完整遍历一轮后为空")
+    finished: bool = Field(default=False, description="是否已遍历到最后一个项目")
+
+
+def _chapter_version_of(path: str) -> Optional[Tuple[str, int]]:
+    """assets/{pid}/chapter_3/v2.md -> ("3", 2)"""
+    m = re.match(r"^assets/[^/]+/chapter_([^/]+)/v(\d+)\.md$", path or "")
+    return (m.group(1), int(m.group(2))) if m else None
+
+
+def load_db_references(project_id: str) -> Optional[Set[Tuple[str, int]]]:
+    """
+    从快照与 state_events 收集项目引用的章节版本；项目无快照时返回 None。
+    数据库异常向上抛出，由调用方跳过该项目
+    """
+    from storage.database.db import get_session
+    from storage.database.novel_manager import NovelStateManager
+
+    db = get_session()
+    try:
+        mgr = NovelStateManager()
+        snapshot = mgr.get_snapshot(db, project_id)
+        if snapshot is None:
+            return None
+        refs: Set[Tuple[str, int]] = set()
+        data = snapshot.snapshot or {}
+        for chapter_no, chapter in (data.get("chapters") or {}).items():
+            ref = _chapter_version_of(chapter.get("file_path"))
+            if ref:
+                refs.add(ref)
+            elif chapter.get("current_version"):
+                refs.add((str(chapter_no), int(chapter["current_version"])))
+        for log in data.get("change_log") or []:
+            if log.get("chapter_ref") and log.get("version") is not None:
+                refs.add((str(log["chapter_ref"]), int(log["version"])))
+        for event in mgr.list_all_events(db, project_id):
+            if not event.chapter_ref:
+                continue
+            # 写入正文时使用的是递增前的版本号，即事件的 version_before
+            if event.version_before is not None:
+                refs.add((str(event.chapter_ref), int(event.version_before)))
+            delta = event.state_delta or {}
+            if delta.get("base_version") is not None:
+                refs.add((str(event.chapter_ref), int(delta["base_version"])))
+            ref = _chapter_version_of(delta.get("diff_path", "").replace(".diff.json", ".md"))
+            if ref:
+                refs.add(ref)
+        return refs
+    finally:
+        db.close()
+
+
+class AssetGC:
+    """资产垃圾回收器"""
+
+    def __init__(
+            self,
+            asset_store: Optional[AssetStore] = None,
+            *,
+            reference_loader: ReferenceLoader = load_db_references,
+            grace_seconds: float = ASSET_GC_GRACE_HOURS * 3600,
+            mode: str = ASSET_GC_MODE,
+            dry_run: bool = False,
+    ):
+        if mode not in ("archive", "delete"):
+            raise ValueError(f"不支持的回收方式: {mode}")
+        self.asset_store = asset_store or get_asset_store()
+        self.reference_loader = reference_loader
+        self.grace_seconds = grace_seconds
+        self.mode = mode
+        self.dry_run = dry_run
+
+    def _load_cursor(self) -> Optional[str]:
+        try:
+            return json.loads(self.asset_store.read_text(GC_STATE_PATH)).get("cursor")
+        except FileNotFoundError:
+            return None
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Invalid asset GC state, restarting from beginning: {e}")
+            return None
+
+    def _save_cursor(self, cursor: Optional[str]) -> None:
+        self.asset_store.write_text(GC_STATE_PATH, json.dumps(
+            {"cursor": cursor, "updated_at": datetime.now().isoformat()}, ensure_ascii=False))
+
+    def _iter_projects(self, cursor: Optional[str]):
+        """按项目分组产出 (project_id, [(path, size, mtime), ...])；同一项目的文件在字典序中连续"""
+        # "assets/{pid}0" 大于所有 "assets/{pid}/..." 路径，从其后继续即跳过已处理的项目
+        start_after = f"assets/{cursor}0" if cursor else None
+        current: Optional[str] = None
+        files: List[Tuple[str, int, float]] = []
+        for path, size, mtime in self.asset_store.iter_assets("assets", start_after=start_after):
+            parts = path.split("/")
+            # 只处理项目目录内的文件，跳过 assets/ 根下的文件与 .archive 等隐藏目录
+            if len(parts) < 3 or parts[1].startswith("."):
+                continue
+            if parts[1] != current:
+                if current is not None:
+                    yield current, files
+                current, files = parts[1], []
+            files.append((path, size, mtime))
+        if current is not None:
+            yield current, files
+
+    def _reclaim(self, files: List[Tuple[str, int]], archive_dir: str, report: GCReport) -> None:
+        """回收一个项目的待回收文件：归档逐个移动，删除模式整批调用 delete_many"""
+        errors: Dict[str, str] = {}
+        if not self.dry_run and files:
+            if self.mode == "archive":
+                for path, _ in files:
+                    try:
+                        self.asset_store.move(path, f"{archive_dir}/{path[len('assets/'):]}")
+                    except Exception as e:
+                        errors[path] = str(e)
+            else:
+                try:
+                    errors = self.asset_store.delete_many(path for path, _ in files)
+                except Exception as e:
+                    errors = {path: str(e) for path, _ in files}
+        for path, size in files:
+            if path in errors:
+                report.errors.append(f"{path}: {errors[path]}")
+                continue
+            report.reclaimed_files += 1
+            report.reclaimed_bytes += size
+            if len(report.reclaimed_paths) < REPORT_MAX_PATHS:
+                report.reclaimed_paths.append(path)
+
+    def _collect_project(self, project_id: str, files: List[Tuple[str, int, float]], now: float,
+                         archive_dir: str, report: GCReport) -> None:
+        try:
+            refs = self.reference_loader(project_id)
+        except Exception as e:
+            logger.warning(f"Asset GC skipped project {project_id}: failed to load references: {e}")
+            report.skipped_projects.append(project_id)
+            return
+
+        deadline = now - self.grace_seconds
+        if refs is None:
+            # 无快照：目录内所有文件都超过宽限期才整体回收
+            if max(mtime for _, _, mtime in files) > deadline:
+                report.skipped_in_grace += len(files)
+                return
+            report.orphan_projects.append(project_id)
+            self._reclaim([(path, size) for path, size, _ in files], archive_dir, report)
+            return
+
+        prefix_len = len(f"assets/{project_id}/")
+        unreferenced: List[Tuple[str, int]] = []
+        for path, size, mtime in files:
+            m = _VERSION_FILE_RE.match(path[prefix_len:])
+            if not m or (m.group("chapter"), int(m.group("version"))) in refs:
+                continue
+            if mtime > deadline:
+                report.skipped_in_grace += 1
+                continue
+            unreferenced.append((path, size))
+        self._reclaim(unreferenced, archive_dir, report)
+
+    def run(self, max_projects: Optional[int] = None, resume: bool = True) -> GCReport:
+        """执行一轮（或一段）回收，返回报告"""
+        report = GCReport(mode=self.mode, dry_run=self.dry_run)
+        now = time.time()
+        archive_dir = f"{ARCHIVE_PREFIX}/{datetime.now().strftime('%Y%m%d')}"
+        cursor = self._load_cursor() if resume else None
+        if cursor:
+            logger.info(f"Asset GC resuming after project {cursor}")
+
+        last: Optional[str] = None
+        finished = True
+        for project_id, files in self._iter_projects(cursor):
+            if max_projects is not None and report.scanned_projects >= max_projects:
+                finished = False
+                break
+            report.scanned_projects += 1
+            report.scanned_files += len(files)
+            report.scanned_bytes += sum(size for _, size, _ in files)
+            self._collect_project(project_id, files, now, archive_dir, report)
+            last = project_id
+
+        report.finished = finished
+        report.cursor = None if finished else last
+        if not self.dry_run:
+            self._save_cursor(report.cursor)
+        logger.info(
+            f"Asset GC {'dry run ' if self.dry_run else ''}done: projects={report.scanned_projects}, "
+            f"reclaimed {report.reclaimed_files} files / {report.reclaimed_bytes} bytes, "
+            f"in grace={report.skipped_in_grace}, skipped projects={len(report.skipped_projects)}, errors={len(report.errors)}"
+        )
+        return report
+
+
+def run_asset_gc(max_projects: Optional[int] = None, dry_run: bool = False, mode: str = ASSET_GC_MODE,
+                 grace_hours: float = ASSET_GC_GRACE_HOURS, resume: bool = True) -> GCReport:
+    """使用进程级资产存储与数据库引用执行回收"""
+    gc = AssetGC(grace_seconds=grace_hours * 3600, mode=mode, dry_run=dry_run)
+    return gc.run(max_projects=max_projects, resume=resume)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Garbage-collect unreferenced NovelOS asset files")
+    parser.add_argument("--mode", choices=["archive", "delete"], default=ASSET_GC_MODE, help="Archive or delete unreferenced files")
+    parser.add_argument("--dry-run", action="store_true", help="Only report, do not move or delete anything")
+    parser.add_argument("--max-projects", type=int, default=None, help="Max projects to process in this run (incremental)")
+    parser.add_argument("--grace-hours", type=float, default=ASSET_GC_GRACE_HOURS, help="Skip files modified within this window")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the saved cursor and start from the first project")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = run_asset_gc(
+        max_projects=args.max_projects,
+        dry_run=args.dry_run,
+        mode=args.mode,
+        grace_hours=args.grace_hours,
+        resume=not args.no_resume,
+    )
+    print(report.model_dump_json(indent=2))
+    return 1 if report.errors else 0
+
+
+__all__ = [
+    "AssetGC",
+    "GCReport",
+    "load_db_references",
+    "run_asset_gc",
+]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
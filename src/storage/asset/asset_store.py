@@ -0,0 +1,555 @@
+"""
+NovelOS 资产存储
+章节正文、导出文件等资产的统一读写入口，路径统一使用相对工作区的资产路径（如 assets/{project_id}/chapter_1/v1.md）：
+- LocalAssetStore: 仅本地磁盘（单机部署）
+- S3AssetStore: 对象存储为主存储，本地磁盘作为 LRU 缓存；写入先落本地再异步回写上传，本地未命中时回源读取
+  待上传的路径记入持久化上传日志，进程重启后重新入队，上传完成前本地副本不可淘汰
+"""
+import os
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from storage.asset.atomic_writer import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# 本地缓存容量上限（字节），默认 2GB
+ASSET_CACHE_MAX_BYTES = int(os.getenv("NOVELOS_ASSET_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# 回写上传并发数
+ASSET_UPLOAD_WORKERS = int(os.getenv("NOVELOS_ASSET_UPLOAD_WORKERS", "4"))
+# 单个文件上传失败的重试次数
+ASSET_UPLOAD_RETRIES = 3
+# 一轮重试全部失败后，再次重新上传的退避时间（秒，指数增长，封顶）
+ASSET_UPLOAD_BACKOFF_BASE = float(os.getenv("NOVELOS_ASSET_UPLOAD_BACKOFF_BASE", "30"))
+ASSET_UPLOAD_BACKOFF_MAX = float(os.getenv("NOVELOS_ASSET_UPLOAD_BACKOFF_MAX", "600"))
+# 上传日志目录（相对工作区根目录），每个待上传路径一个标记文件
+ASSET_UPLOAD_JOURNAL_DIR = ".asset_upload_journal"
+
+
+def get_workspace_root() -> str:
+    """资产相对路径的根目录：优先 COZE_WORKSPACE_PATH，否则为当前工作目录"""
+    return os.getenv("COZE_WORKSPACE_PATH") or os.getcwd()
+
+
+class AssetStore:
+    """资产存储基类（本地磁盘实现）"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or get_workspace_root()
+
+    def _abs_path(self, path: str) -> str:
+        """相对资产路径 -> 本地绝对路径"""
+        if os.path.isabs(path):
+            return path
+        return os.path.join(self.root, path)
+
+    def _write_local(self, path: str, data: Union[bytes, Iterable[bytes]], durable: bool = True) -> str:
+        """原子写入本地副本；durable=False 用于可从对象存储重建的缓存副本，跳过 fsync"""
+        abs_path = self._abs_path(path)
+        atomic_write(abs_path, data, durable=durable)
+        return abs_path
+
+    def write_bytes(self, path: str, data: bytes) -> str:
+        """写入资产，返回相对资产路径"""
+        self._write_local(path, data)
+        return path
+
+    def write_chunks(self, path: str, chunks: Iterable[bytes]) -> str:
+        """按字节块流式写入资产（如导出整本书），不在内存中拼接，返回相对资产路径"""
+        self._write_local(path, chunks)
+        return path
+
+    def write_text(self, path: str, content: str) -> str:
+        """以 UTF-8 写入文本资产，返回相对资产路径"""
+        return self.write_bytes(path, content.encode('utf-8'))
+
+    def read_bytes(self, path: str) -> bytes:
+        """读取资产，不存在时抛出 FileNotFoundError"""
+        with open(self.local_path(path), 'rb') as f:
+            return f.read()
+
+    def read_text(self, path: str) -> str:
+        """以 UTF-8 读取文本资产"""
+        return self.read_bytes(path).decode('utf-8')
+
+    def local_path(self, path: str) -> str:
+        """确保资产在本地可用并返回本地绝对路径，不存在时抛出 FileNotFoundError"""
+        abs_path = self._abs_path(path)
+        if not os.path.exists(abs_path):
+            raise FileNotFoundError(f"资产不存在: {path}")
+        return abs_path
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._abs_path(path))
+
+    def delete(self, path: str) -> bool:
+        abs_path = self._abs_path(path)
+        if os.path.exists(abs_path):
+            os.remove(abs_path)
+            return True
+        return False
+
+    def delete_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        """批量删除资产，返回删除失败的路径及原因"""
+        errors: Dict[str, str] = {}
+        for path in paths:
+            try:
+                self.delete(path)
+            except Exception as e:
+                errors[path] = str(e)
+        return errors
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有挂起的写入完成；本地实现无挂起写入"""
+        return True
+
+    def iter_assets(self, prefix: str = "assets", start_after: Optional[str] = None) -> Iterator[Tuple[str, int, float]]:
+        """
+        按路径字典序遍历 prefix 下的资产，产出 (相对资产路径, 字节数, 修改时间)；
+        start_after 用于断点续扫，跳过不大于该路径的条目；跳过原子写入遗留的临时文件
+        """
+        base = self._abs_path(prefix)
+        if os.path.isdir(base):
+            yield from self._iter_dir_sorted(base, start_after)
+
+    def _iter_dir_sorted(self, abs_dir: str, start_after: Optional[str]) -> Iterator[Tuple[str, int, float]]:
+        try:
+            with os.scandir(abs_dir) as it:
+                # 目录名追加 "/" 参与排序，使遍历顺序与对象存储的 key 字典序一致
+                entries = sorted((e.name + "/" if e.is_dir(follow_symlinks=False) else e.name, e) for e in it)
+        except OSError:
+            return
+        for sort_name, entry in entries:
+            if sort_name.endswith("/"):
+                yield from self._iter_dir_sorted(entry.path, start_after)
+                continue
+            if entry.name.startswith(".") and entry.name.endswith(".tmp"):
+                continue
+            rel = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+            if start_after is not None and rel <= start_after:
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            yield rel, st.st_size, st.st_mtime
+
+    def move(self, src: str, dst: str) -> None:
+        """移动资产（如归档），src 不存在时抛出 FileNotFoundError"""
+        src_abs = self._abs_path(src)
+        dst_abs = self._abs_path(dst)
+        os.makedirs(os.path.dirname(dst_abs), exist_ok=True)
+        os.replace(src_abs, dst_abs)
+
+
+class LocalAssetStore(AssetStore):
+    """本地磁盘资产存储"""
+
+
+class S3AssetStore(AssetStore):
+    """对象存储资产后端：本地 LRU 磁盘缓存 + 写回式异步上传 + 未命中回源"""
+
+    def __init__(
+            self,
+            storage,
+            *,
+            root: Optional[str] = None,
+            key_prefix: str = "",
+            cache_max_bytes: int = ASSET_CACHE_MAX_BYTES,
+            upload_workers: int = ASSET_UPLOAD_WORKERS,
+    ):
+        super().__init__(root)
+        self.storage = storage
+        self.key_prefix = key_prefix.strip("/")
+        self.cache_max_bytes = cache_max_bytes
+        self._lock = threading.RLock()
+        # LRU 索引：相对路径 -> 文件大小，越靠后越新
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_bytes = 0
+        # 尚未上传完成的路径（不可被淘汰），值为最新一次上传的 Future
+        self._pending: Dict[str, Future] = {}
+        # 上传失败后等待退避重传的定时器与已重传轮数
+        self._retry_timers: Dict[str, threading.Timer] = {}
+        self._retry_rounds: Dict[str, int] = {}
+        self._journal_dir = os.path.join(self.root, ASSET_UPLOAD_JOURNAL_DIR)
+        # 回源下载去重：同一路径并发未命中时只下载一次
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix="asset-upload")
+        self._scan_cache()
+        self._resume_pending()
+
+    def _object_key(self, path: str) -> str:
+        rel = os.path.relpath(self._abs_path(path), self.root).replace(os.sep, "/")
+        return f"{self.key_prefix}/{rel}" if self.key_prefix else rel
+
+    def _rel_path(self, path: str) -> str:
+        return os.path.relpath(self._abs_path(path), self.root).replace(os.sep, "/")
+
+    def _scan_cache(self) -> None:
+        """启动时按修改时间重建 LRU 索引"""
+        assets_dir = os.path.join(self.root, "assets")
+        if not os.path.isdir(assets_dir):
+            return
+        entries = []
+        for dirpath, _, filenames in os.walk(assets_dir):
+            for name in filenames:
+                abs_path = os.path.join(dirpath, name)
+                if name.startswith(".") and name.endswith(".tmp"):
+                    # 上次崩溃遗留的原子写入临时文件
+                    _remove_stale_temp(abs_path)
+                    continue
+                try:
+                    st = os.stat(abs_path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, self._rel_path(abs_path), st.st_size))
+        entries.sort()
+        with self._lock:
+            for _, rel, size in entries:
+                self._lru[rel] = size
+                self._cache_bytes += size
+
+    def _journal_path(self, rel: str) -> str:
+        return os.path.join(self._journal_dir, hashlib.sha1(rel.encode('utf-8')).hexdigest())
+
+    def _journal_add(self, rel: str) -> None:
+        """记录待上传路径（持久化），崩溃重启后据此补传"""
+        atomic_write(self._journal_path(rel), rel.encode('utf-8'))
+
+    def _journal_remove(self, rel: str) -> None:
+        try:
+            os.remove(self._journal_path(rel))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Failed to remove upload journal entry for {rel}: {e}")
+
+    def _resume_pending(self) -> None:
+        """启动时把上传日志中的路径重新入队；本地副本已不存在的条目直接清除"""
+        if not os.path.isdir(self._journal_dir):
+            return
+        resumed = 0
+        for name in os.listdir(self._journal_dir):
+            marker = os.path.join(self._journal_dir, name)
+            if name.startswith(".") and name.endswith(".tmp"):
+                _remove_stale_temp(marker)
+                continue
+            try:
+                with open(marker, 'rb') as f:
+                    rel = f.read().decode('utf-8')
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Skipping unreadable upload journal entry {name}: {e}")
+                continue
+            if not os.path.exists(self._abs_path(rel)):
+                self._journal_remove(rel)
+                continue
+            with self._lock:
+                self._submit_upload(rel, None)
+            resumed += 1
+        if resumed:
+            logger.info(f"Resumed {resumed} pending asset uploads from journal")
+
+    def _touch(self, rel: str, size: int) -> None:
+        with self._lock:
+            old = self._lru.pop(rel, None)
+            if old is not None:
+                self._cache_bytes -= old
+            self._lru[rel] = size
+            self._cache_bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        """淘汰最久未使用且已上传完成的本地副本，直到容量回到上限以内"""
+        with self._lock:
+            if self._cache_bytes <= self.cache_max_bytes:
+                return
+            # 最近一次访问的条目始终保留，避免刚回源的文件被立即淘汰
+            for rel in list(self._lru.keys())[:-1]:
+                if self._cache_bytes <= self.cache_max_bytes:
+                    break
+                if rel in self._pending:
+                    continue
+                size = self._lru.pop(rel)
+                self._cache_bytes -= size
+                try:
+                    os.remove(self._abs_path(rel))
+                except OSError as e:
+                    logger.debug(f"Failed to evict cached asset {rel}: {e}")
+
+    def _upload(self, rel: str, data: Optional[bytes]) -> None:
+        """上传资产；data 为 None 时读取本地副本（重启补传/退避重传），本地副本已删除时无需上传"""
+        key = self._object_key(rel)
+        if data is None:
+            try:
+                with open(self._abs_path(rel), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return
+        last_error = None
+        for attempt in range(1, ASSET_UPLOAD_RETRIES + 1):
+            try:
+                self.storage.put_file(file_key=key, file_content=data, content_type=_guess_content_type(rel))
+                return
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Asset upload failed (attempt {attempt}/{ASSET_UPLOAD_RETRIES}) for {key}: {e}")
+                if attempt < ASSET_UPLOAD_RETRIES:
+                    time.sleep(2 ** (attempt - 1))
+        raise last_error  # pyright: ignore [reportGeneralTypeIssues]
+
+    def _submit_upload(self, rel: str, data: Optional[bytes]) -> Future:
+        """提交上传并固定本地副本（调用方持有 self._lock）；取代该路径上等待中的退避重传"""
+        timer = self._retry_timers.pop(rel, None)
+        if timer is not None:
+            timer.cancel()
+        future = self._executor.submit(self._upload, rel, data)
+        self._pending[rel] = future
+        future.add_done_callback(lambda f, rel=rel: self._on_upload_done(rel, f))
+        return future
+
+    def _on_upload_done(self, rel: str, future: Future) -> None:
+        with self._lock:
+            # 只有最新一次上传完成才解除固定，避免旧上传覆盖新状态
+            if self._pending.get(rel) is not future or future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                self._pending.pop(rel, None)
+                self._retry_rounds.pop(rel, None)
+                self._journal_remove(rel)
+            else:
+                # 上传失败时保留本地副本（不淘汰）与上传日志，按指数退避重新上传
+                rounds = self._retry_rounds.get(rel, 0) + 1
+                self._retry_rounds[rel] = rounds
+                delay = min(ASSET_UPLOAD_BACKOFF_MAX, ASSET_UPLOAD_BACKOFF_BASE * 2 ** (rounds - 1))
+                logger.error(f"Asset upload failed for {rel}: {error}, retrying in {delay:.0f}s (round {rounds})")
+                timer = threading.Timer(delay, self._retry_upload, args=(rel, future))
+                timer.daemon = True
+                self._retry_timers[rel] = timer
+                timer.start()
+        self._evict()
+
+    def _retry_upload(self, rel: str, failed: Future) -> None:
+        with self._lock:
+            # 期间已有新的写入或已被删除时放弃本次重传
+            if self._pending.get(rel) is not failed:
+                return
+            self._retry_timers.pop(rel, None)
+            self._submit_upload(rel, None)
+
+    def write_bytes(self, path: str, data: bytes) -> str:
+        rel = self._rel_path(path)
+        with self._lock:
+            # 先记上传日志再提交上传：日志删除只发生在该路径最新一次上传成功之后
+            self._journal_add(rel)
+            self._submit_upload(rel, data)
+        self._write_local(rel, data)
+        self._touch(rel, len(data))
+        return path
+
+    def write_chunks(self, path: str, chunks: Iterable[bytes]) -> str:
+        """流式写入本地副本后从本地文件上传；写入期间以占位 Future 固定该路径，旧上传完成时不会清除上传日志"""
+        rel = self._rel_path(path)
+        placeholder: Future = Future()
+        with self._lock:
+            self._journal_add(rel)
+            previous = self._pending.get(rel)
+            self._pending[rel] = placeholder
+        written = False
+        try:
+            self._write_local(rel, chunks)
+            written = True
+            with self._lock:
+                # 写入期间被删除或被新写入取代时不再上传
+                if self._pending.get(rel) is placeholder:
+                    self._submit_upload(rel, None)
+        finally:
+            with self._lock:
+                if self._pending.get(rel) is placeholder:
+                    self._pending.pop(rel, None)
+                    if not written:
+                        self._abandon_write(rel, previous)
+            if placeholder.set_running_or_notify_cancel():
+                placeholder.set_result(None)
+        self._touch(rel, os.path.getsize(self._abs_path(rel)))
+        return path
+
+    def _abandon_write(self, rel: str, previous: Optional[Future]) -> None:
+        """
+        流式写入中途失败（本地副本未被替换）时撤销占位（调用方持有 self._lock）：
+        此前没有待上传版本则清除上传日志；否则交还给此前的上传，占位期间已完成的上传补做完成处理
+        """
+        if previous is None:
+            self._journal_remove(rel)
+            return
+        self._pending[rel] = previous
+        if previous.done() and rel not in self._retry_timers:
+            self._on_upload_done(rel, previous)
+
+    def local_path(self, path: str) -> str:
+        rel = self._rel_path(path)
+        abs_path = self._abs_path(rel)
+        if os.path.exists(abs_path):
+            self._touch(rel, os.path.getsize(abs_path))
+            return abs_path
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(rel, threading.Lock())
+        with fetch_lock:
+            # 等锁期间可能已被其他线程下载完成
+            if not os.path.exists(abs_path):
+                try:
+                    data = self.storage.read_file(file_key=self._object_key(rel))
+                except Exception as e:
+                    raise FileNotFoundError(f"资产不存在: {path} ({e})")
+                self._write_local(rel, data, durable=False)
+        with self._lock:
+            self._fetch_locks.pop(rel, None)
+        self._touch(rel, os.path.getsize(abs_path))
+        return abs_path
+
+    def read_bytes(self, path: str) -> bytes:
+        try:
+            return super().read_bytes(path)
+        except FileNotFoundError:
+            # local_path 返回后文件可能被并发淘汰，重新回源一次
+            with open(self.local_path(path), 'rb') as f:
+                return f.read()
+
+    def exists(self, path: str) -> bool:
+        if super().exists(path):
+            return True
+        return self.storage.file_exists(file_key=self._object_key(path))
+
+    def _discard_local(self, rels: List[str]) -> None:
+        """删除前解除本地状态：取消挂起的上传与退避重传，移出 LRU 索引，清除上传日志与本地副本"""
+        futures: List[Future] = []
+        with self._lock:
+            for rel in rels:
+                size = self._lru.pop(rel, None)
+                if size is not None:
+                    self._cache_bytes -= size
+                future = self._pending.pop(rel, None)
+                if future is not None:
+                    futures.append(future)
+                timer = self._retry_timers.pop(rel, None)
+                if timer is not None:
+                    timer.cancel()
+                self._retry_rounds.pop(rel, None)
+        # 未开始的上传直接取消；已在上传的等待其结束，避免删除后被迟到的上传重新写回对象存储
+        running = [f for f in futures if not f.cancel()]
+        if running:
+            wait(running)
+        for rel in rels:
+            self._journal_remove(rel)
+            super().delete(rel)
+
+    def delete(self, path: str) -> bool:
+        rel = self._rel_path(path)
+        self._discard_local([rel])
+        return self.storage.delete_file(file_key=self._object_key(rel))
+
+    def delete_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        """批量删除：本地状态逐个解除，对象存储按批调用 delete_many"""
+        rels = [self._rel_path(path) for path in paths]
+        if not rels:
+            return {}
+        self._discard_local(rels)
+        rel_of = {self._object_key(rel): rel for rel in rels}
+        result = self.storage.delete_many(file_keys=list(rel_of))
+        return {rel_of.get(err["key"], err["key"]): f"{err['code']}: {err['message']}" for err in result["errors"]}
+
+    def iter_assets(self, prefix: str = "assets", start_after: Optional[str] = None) -> Iterator[Tuple[str, int, float]]:
+        """以对象存储为准遍历资产（本地只是缓存，可能不完整）"""
+        key_base = f"{self.key_prefix}/" if self.key_prefix else ""
+        for obj in self.storage.iter_objects(
+                prefix=key_base + prefix.strip("/"),
+                start_after=key_base + start_after if start_after else None
+        ):
+            rel = obj["key"][len(key_base):]
+            if os.path.basename(rel).startswith(".") and rel.endswith(".tmp"):
+                continue
+            yield rel, obj["size"], obj["last_modified"]
+
+    def move(self, src: str, dst: str) -> None:
+        self.write_bytes(dst, self.read_bytes(src))
+        self.delete(src)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有挂起的回写上传完成，返回是否全部成功"""
+        with self._lock:
+            futures = list(self._pending.values())
+        if not futures:
+            return True
+        done, not_done = wait(futures, timeout=timeout)
+        return not not_done and all(f.exception() is None for f in done)
+
+
+def _remove_stale_temp(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.debug(f"Failed to remove stale temp file {path}: {e}")
+
+
+def _guess_content_type(path: str) -> str:
+    if path.endswith(".md"):
+        return "text/markdown; charset=utf-8"
+    if path.endswith(".txt"):
+        return "text/plain; charset=utf-8"
+    if path.endswith(".json"):
+        return "application/json"
+    return "application/octet-stream"
+
+
+_asset_store: Optional[AssetStore] = None
+_asset_store_lock = threading.Lock()
+
+
+def _create_asset_store() -> AssetStore:
+    """
+    根据环境变量选择后端：
+    - NOVELOS_ASSET_BACKEND=local: 本地磁盘
+    - NOVELOS_ASSET_BACKEND=s3: 对象存储
+    - 未设置（auto）: 配置了 COZE_BUCKET_NAME 时使用对象存储，否则本地磁盘
+    """
+    backend = os.getenv("NOVELOS_ASSET_BACKEND", "auto").lower()
+    bucket_name = os.getenv("COZE_BUCKET_NAME", "")
+    if backend == "s3" or (backend == "auto" and bucket_name):
+        try:
+            from storage.s3.s3_storage import S3SyncStorage
+            storage = S3SyncStorage(
+                endpoint_url=os.getenv("COZE_BUCKET_ENDPOINT_URL"),
+                access_key=os.getenv("COZE_BUCKET_ACCESS_KEY", ""),
+                secret_key=os.getenv("COZE_BUCKET_SECRET_KEY", ""),
+                bucket_name=bucket_name,
+            )
+            logger.info("Using S3AssetStore for assets")
+            return S3AssetStore(storage, key_prefix=os.getenv("NOVELOS_ASSET_KEY_PREFIX", ""))
+        except Exception as e:
+            logger.warning(f"Failed to create S3AssetStore: {e}, will fallback to LocalAssetStore")
+    return LocalAssetStore()
+
+
+def get_asset_store() -> AssetStore:
+    """获取进程级资产存储实例"""
+    global _asset_store
+    if _asset_store is None:
+        with _asset_store_lock:
+            if _asset_store is None:
+                _asset_store = _create_asset_store()
+    return _asset_store
+
+
+__all__ = [
+    "AssetStore",
+    "LocalAssetStore",
+    "S3AssetStore",
+    "get_asset_store",
+    "get_workspace_root",
+]
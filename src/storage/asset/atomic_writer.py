@@ -0,0 +1,189 @@
+"""
+NovelOS 原子资产写入
+先写同目录临时文件，fsync 后 rename 覆盖目标文件，崩溃时目标文件要么是旧版本、要么是完整新版本，不会出现截断文件。
+
+持久化模式（环境变量 NOVELOS_ASSET_FSYNC）：
+- group（默认）: 组提交，同一进程内并发写入由领头线程成批处理：整批文件并行 fsync，rename 后每个目录只 fsync 一次
+- always: 每次写入各自 fsync
+- off: 只保证原子替换，不 fsync（依赖操作系统回写）
+"""
+import os
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ASSET_FSYNC_MODE = os.getenv("NOVELOS_ASSET_FSYNC", "group").lower()
+# 组提交收集窗口（秒）：领头写入者等待该时长，让并发写入加入同一批
+GROUP_COMMIT_WINDOW = float(os.getenv("NOVELOS_ASSET_GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+# 单批最多提交的文件数
+GROUP_COMMIT_MAX_BATCH = 256
+# 单批内并行 fsync 的线程数（fsync 阻塞在设备 I/O 上，并行提交可让设备合并刷盘）
+GROUP_COMMIT_FSYNC_WORKERS = int(os.getenv("NOVELOS_ASSET_FSYNC_WORKERS", "8"))
+
+
+def _fsync_path(path: str) -> None:
+    """对已关闭的文件/目录执行 fsync"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_temp(path: str, data: Union[bytes, Iterable[bytes]]) -> str:
+    """
+    在目标文件同目录写入临时文件（保证 rename 不跨文件系统），返回临时文件路径；
+    data 为字节块迭代器时逐块写入，不在内存中拼接
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                for chunk in data:
+                    f.write(chunk)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path
+
+
+class _PendingWrite:
+    __slots__ = ("tmp_path", "path", "done", "error")
+
+    def __init__(self, tmp_path: str, path: str):
+        self.tmp_path = tmp_path
+        self.path = path
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """组提交：等待中的写入者排队，由当前领头者一次性完成整批的 fsync + rename + 目录 fsync"""
+
+    def __init__(self, window: float = GROUP_COMMIT_WINDOW, max_batch: int = GROUP_COMMIT_MAX_BATCH,
+                 fsync_workers: int = GROUP_COMMIT_FSYNC_WORKERS):
+        self.window = window
+        self.max_batch = max_batch
+        self._fsync_pool = ThreadPoolExecutor(max_workers=max(1, fsync_workers), thread_name_prefix="asset-fsync")
+        self._cond = threading.Condition()
+        self._queue: List[_PendingWrite] = []
+        self._flushing = False
+        # 统计：提交批次数 / 文件数，用于观察合并效果
+        self.batches = 0
+        self.files = 0
+
+    def commit(self, tmp_path: str, path: str) -> None:
+        entry = _PendingWrite(tmp_path, path)
+        with self._cond:
+            self._queue.append(entry)
+            while not entry.done:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                self._cond.release()
+                batch: List[_PendingWrite] = []
+                try:
+                    if self.window > 0:
+                        time.sleep(self.window)
+                    with self._cond:
+                        batch = self._queue[:self.max_batch]
+                        del self._queue[:self.max_batch]
+                    self._flush(batch)
+                except BaseException as e:
+                    # _flush 中途异常时无法确认本批哪些文件已落盘：尚无结果的条目一律以该异常结束
+                    for pending in batch:
+                        if pending.error is None:
+                            pending.error = e
+                            _remove_quietly(pending.tmp_path)
+                    if entry not in batch:
+                        with self._cond:
+                            if entry in self._queue:
+                                self._queue.remove(entry)
+                        raise
+                finally:
+                    # 已出队的条目无论成败都必须标记完成，否则等待中的写入者永远不会被唤醒
+                    self._cond.acquire()
+                    for pending in batch:
+                        pending.done = True
+                    self._flushing = False
+                    self._cond.notify_all()
+        if entry.error is not None:
+            raise entry.error
+
+    def _flush(self, batch: List[_PendingWrite]) -> None:
+        # 整批临时文件并行 fsync，全部落盘后再 rename（rename 前数据必须已持久化）
+        futures = [self._fsync_pool.submit(_fsync_path, entry.tmp_path) for entry in batch]
+        dirs = set()
+        for entry, future in zip(batch, futures):
+            try:
+                future.result()
+                os.replace(entry.tmp_path, entry.path)
+                dirs.add(os.path.dirname(entry.path) or ".")
+            except BaseException as e:
+                entry.error = e
+                _remove_quietly(entry.tmp_path)
+        # 目录 fsync 使 rename 持久化，同一目录只需一次，不同目录并行；失败时该目录下的写入均视为未持久化
+        for directory, future in [(d, self._fsync_pool.submit(_fsync_path, d)) for d in dirs]:
+            try:
+                future.result()
+            except OSError as e:
+                logger.warning(f"Failed to fsync directory {directory}: {e}")
+                for entry in batch:
+                    if entry.error is None and (os.path.dirname(entry.path) or ".") == directory:
+                        entry.error = e
+        with self._cond:
+            self.batches += 1
+            self.files += len(batch)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_group_committer = GroupCommitter()
+
+
+def atomic_write(path: str, data: Union[bytes, Iterable[bytes]], *, durable: bool = True) -> None:
+    """
+    原子写入文件（data 可为字节块迭代器）
+    - durable=False 时只保证原子替换（用于可重建的缓存文件）
+    - durable=True 时按 NOVELOS_ASSET_FSYNC 模式持久化
+    """
+    tmp_path = _write_temp(path, data)
+    mode = ASSET_FSYNC_MODE if durable else "off"
+    try:
+        if mode == "group":
+            _group_committer.commit(tmp_path, path)
+            return
+        if mode == "always":
+            _fsync_path(tmp_path)
+        os.replace(tmp_path, path)
+        if mode == "always":
+            _fsync_path(os.path.dirname(path) or ".")
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def get_group_committer() -> GroupCommitter:
+    return _group_committer
+
+
+__all__ = [
+    "atomic_write",
+    "GroupCommitter",
+    "get_group_committer",
+]
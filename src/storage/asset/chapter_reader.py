@@ -0,0 +1,172 @@
+"""
+NovelOS 章节正文读取器
+以只读 mmap 映射章节版本文件，按需提供行/段落/字节区间的窗口：
+- 换行偏移表在首次按行访问时扫描字节建立（array，每行 8 字节），不解码整章
+- 段落锚点（vN.para.json）中的字节偏移可直接定位段落，只解码用到的区间
+- 导出等场景按字节块顺序读取，无需解码再编码
+"""
+import mmap
+import logging
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from storage.asset.asset_store import get_asset_store
+from utils.text.paragraph import ParagraphAnchor, ParagraphIndex, format_annotated, select_window
+
+logger = logging.getLogger(__name__)
+
+# 按块读取时的默认块大小
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class ChapterReader:
+    """章节版本文件的只读窗口访问（需 close，或以 with 使用）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            self._mm = None
+        self._line_starts: Optional[array] = None
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "ChapterReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def size(self) -> int:
+        """文件字节数"""
+        return len(self._mm) if self._mm is not None else 0
+
+    def _build_line_table(self) -> array:
+        """扫描换行符建立每行起始字节偏移；末尾追加文件长度作为哨兵"""
+        starts = array('Q', [0])
+        mm = self._mm
+        if mm is not None:
+            pos = mm.find(b"\n")
+            while pos >= 0:
+                starts.append(pos + 1)
+                pos = mm.find(b"\n", pos + 1)
+        if starts[-1] != self.size:
+            starts.append(self.size)
+        return starts
+
+    @property
+    def line_starts(self) -> array:
+        if self._line_starts is None:
+            self._line_starts = self._build_line_table()
+        return self._line_starts
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_starts) - 1
+
+    def read_bytes(self, byte_start: int = 0, byte_end: Optional[int] = None) -> bytes:
+        if self._mm is None:
+            return b""
+        return self._mm[byte_start:self.size if byte_end is None else byte_end]
+
+    def read_range(self, byte_start: int, byte_end: int) -> str:
+        """解码字节区间（区间应落在字符边界上，如段落锚点/行边界）"""
+        return self.read_bytes(byte_start, byte_end).decode('utf-8', errors='replace')
+
+    def read_text(self) -> str:
+        """读取整章（仅在确实需要全文时使用）"""
+        return self.read_range(0, self.size)
+
+    def iter_bytes(self, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """按块顺序读取原始字节"""
+        for pos in range(0, self.size, chunk_size):
+            yield self.read_bytes(pos, pos + chunk_size)
+
+    def _line_span(self, i: int) -> Tuple[int, int]:
+        """第 i 行去掉行尾换行后的字节区间"""
+        starts = self.line_starts
+        start, end = starts[i], starts[i + 1]
+        mm = self._mm
+        while end > start and mm[end - 1:end] in (b"\n", b"\r"):
+            end -= 1
+        return start, end
+
+    def line(self, i: int) -> str:
+        """第 i 行（从0开始，不含换行符）"""
+        return self.read_range(*self._line_span(i))
+
+    def iter_lines(self, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        end = self.line_count if end is None else min(end, self.line_count)
+        for i in range(start, end):
+            yield self.line(i)
+
+    def iter_paragraph_spans(self) -> Iterator[Tuple[int, int]]:
+        """
+        按正文顺序产出非空段落的字节区间（去掉首尾空白，与段落索引的切分一致）；
+        全角空格等非 ASCII 空白需解码判断，逐行解码
+        """
+        for i in range(self.line_count):
+            start, end = self._line_span(i)
+            body = self.read_range(start, end)
+            stripped = body.strip()
+            if not stripped:
+                continue
+            lead = len(body[:len(body) - len(body.lstrip())].encode('utf-8'))
+            yield start + lead, start + lead + len(stripped.encode('utf-8'))
+
+    def paragraph(self, anchor: ParagraphAnchor) -> str:
+        """按段落锚点的字节偏移读取段落原文"""
+        return self.read_range(anchor.byte_start, anchor.byte_end)
+
+    def head(self, max_chars: int) -> str:
+        """
+        读取开头不超过 max_chars 字的内容，在行边界截断（首行超长时按字截断）；
+        只解码用到的行
+        """
+        lines: List[str] = []
+        total = 0
+        for i in range(self.line_count):
+            line = self.line(i)
+            if total + len(line) > max_chars:
+                if not lines:
+                    lines.append(line[:max_chars])
+                break
+            lines.append(line)
+            total += len(line) + 1
+        return "\n".join(lines)
+
+    def annotate_window(self, index: ParagraphIndex, para_ids: Iterable[str], max_chars: Optional[int] = None,
+                        context: int = 1) -> str:
+        """
+        生成目标段落及其前后 context 段的带段落ID正文（格式同 annotate_paragraphs，不相邻的窗口之间以 ... 分隔）；
+        只读取窗口内的段落
+        """
+        anchors = select_window(index, para_ids, context)
+        return format_annotated(anchors, self.paragraph, max_chars)
+
+    def annotate(self, index: ParagraphIndex, max_chars: Optional[int] = None) -> str:
+        """
+        按段落顺序生成带段落ID正文（格式同 annotate_paragraphs）；
+        达到 max_chars 即停止，只读取装得下的开头若干段
+        """
+        return format_annotated(index.paragraphs, self.paragraph, max_chars)
+
+
+def open_chapter(file_path: str, asset_store=None) -> ChapterReader:
+    """打开章节版本文件（对象存储后端时先确保本地有副本）"""
+    asset_store = asset_store or get_asset_store()
+    return ChapterReader(asset_store.local_path(file_path))
+
+
+__all__ = [
+    "ChapterReader",
+    "open_chapter",
+]
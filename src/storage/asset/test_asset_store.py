@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试脚本：对象存储资产后端 S3AssetStore 的流式写入与上传日志
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from storage.asset.asset_store import ASSET_UPLOAD_JOURNAL_DIR, S3AssetStore
+
+FILE_PATH = "assets/p1/export/book.md"
+
+
+class _FakeStorage:
+    """内存对象存储；gate 被清除时上传阻塞，用于模拟进行中的上传"""
+
+    def __init__(self):
+        self.objects = {}
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def put_file(self, file_key, file_content, content_type=None):
+        self.gate.wait(timeout=5)
+        self.objects[file_key] = file_content
+
+
+def _journal(store: S3AssetStore):
+    journal_dir = os.path.join(store.root, ASSET_UPLOAD_JOURNAL_DIR)
+    return [n for n in os.listdir(journal_dir) if not n.endswith(".tmp")] if os.path.isdir(journal_dir) else []
+
+
+def _failing_chunks():
+    yield b"part1"
+    raise IOError("source closed")
+
+
+def test_write_chunks_uploads_from_local_copy(tmp_path):
+    storage = _FakeStorage()
+    store = S3AssetStore(storage, root=str(tmp_path))
+    store.write_chunks(FILE_PATH, iter([b"a", b"b", b"c"]))
+    assert store.flush(timeout=5)
+    assert storage.objects[FILE_PATH] == b"abc"
+    assert _journal(store) == [] and store._pending == {}
+
+
+def test_write_chunks_failure_clears_placeholder_and_journal(tmp_path):
+    storage = _FakeStorage()
+    store = S3AssetStore(storage, root=str(tmp_path))
+    with pytest.raises(IOError):
+        store.write_chunks(FILE_PATH, _failing_chunks())
+    assert store._pending == {}
+    assert _journal(store) == []
+    assert store.flush(timeout=1)
+    assert not os.path.exists(tmp_path / FILE_PATH) and storage.objects == {}
+
+
+def test_write_chunks_failure_hands_back_to_previous_upload(tmp_path):
+    storage = _FakeStorage()
+    store = S3AssetStore(storage, root=str(tmp_path))
+    storage.gate.clear()
+    store.write_bytes(FILE_PATH, b"old")
+    previous = store._pending[FILE_PATH]
+    with pytest.raises(IOError):
+        store.write_chunks(FILE_PATH, _failing_chunks())
+    # 本地副本未被替换，仍由之前的上传负责上传日志
+    assert store._pending[FILE_PATH] is previous
+    assert len(_journal(store)) == 1
+    storage.gate.set()
+    assert store.flush(timeout=5)
+    assert storage.objects[FILE_PATH] == b"old"
+    assert _journal(store) == [] and store._pending == {}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试脚本：组提交 GroupCommitter 的错误传递
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import storage.asset.atomic_writer as atomic_writer
+from storage.asset.atomic_writer import GroupCommitter, _write_temp
+
+
+def _commit_concurrently(committer: GroupCommitter, paths):
+    """并发提交，返回 path -> 异常（成功为 None）；任一写入者超时未返回即失败"""
+    results = {}
+
+    def worker(path):
+        try:
+            committer.commit(_write_temp(path, b"data"), path)
+            results[path] = None
+        except BaseException as e:
+            results[path] = e
+
+    threads = [threading.Thread(target=worker, args=(p,), daemon=True) for p in paths]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert not any(t.is_alive() for t in threads), "writer never woke up"
+    return results
+
+
+def test_group_commit_success(tmp_path):
+    committer = GroupCommitter(window=0.05)
+    paths = [str(tmp_path / f"f{i}.md") for i in range(5)]
+    assert set(_commit_concurrently(committer, paths).values()) == {None}
+    assert all(open(p, 'rb').read() == b"data" for p in paths)
+    assert committer.files == 5 and committer.batches < 5
+    assert [n for n in os.listdir(tmp_path) if n.endswith(".tmp")] == []
+
+
+def test_flush_failure_wakes_every_writer(tmp_path):
+    committer = GroupCommitter(window=0.05)
+    # 线程池已关闭：_flush 在给任何条目写入结果之前就抛出
+    committer._fsync_pool.shutdown()
+    paths = [str(tmp_path / f"f{i}.md") for i in range(4)]
+    results = _commit_concurrently(committer, paths)
+    assert len(results) == 4
+    assert all(isinstance(e, RuntimeError) for e in results.values())
+    assert [n for n in os.listdir(tmp_path) if n.endswith(".tmp")] == []
+
+
+def test_directory_fsync_failure_is_reported(tmp_path, monkeypatch):
+    bad_dir, good_dir = tmp_path / "bad", tmp_path / "good"
+    real_fsync = atomic_writer._fsync_path
+
+    def fsync(path):
+        if path == str(bad_dir):
+            raise OSError("fsync failed")
+        real_fsync(path)
+
+    monkeypatch.setattr(atomic_writer, "_fsync_path", fsync)
+    committer = GroupCommitter(window=0.05)
+    results = _commit_concurrently(committer, [str(bad_dir / "a.md"), str(good_dir / "b.md")])
+    assert isinstance(results[str(bad_dir / "a.md")], OSError)
+    assert results[str(good_dir / "b.md")] is None
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试脚本：章节正文读取器 ChapterReader 的行/段落窗口
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from graphs.state import ChapterInfo
+from storage.asset.asset_store import LocalAssetStore
+from storage.asset.chapter_reader import open_chapter
+from utils.text.paragraph import annotate_paragraphs, annotate_window, save_paragraph_index
+
+TEXT = "第一段，林远走进城门。\r\n\n　　第二段，苏晴在茶楼等他。\n" + "\n".join(
+    f"第{i}段，雨还在下。" for i in range(3, 9)) + "\n"
+FILE_PATH = "assets/p1/chapter_1/v1.md"
+
+
+def _store(tmp_path) -> LocalAssetStore:
+    store = LocalAssetStore(root=str(tmp_path))
+    store.write_text(FILE_PATH, TEXT)
+    return store
+
+
+def test_line_table_and_head(tmp_path):
+    store = _store(tmp_path)
+    lines = TEXT.split("\n")[:-1]
+    with open_chapter(FILE_PATH, store) as reader:
+        assert reader.line_count == len(lines)
+        assert list(reader.iter_lines()) == [line.rstrip("\r") for line in lines]
+        assert reader.line(3) == lines[3]
+        assert reader.head(12) == "第一段，林远走进城门。\n"
+        assert reader.head(3) == "第一段"
+        assert reader.read_text() == TEXT
+
+
+def test_paragraph_windows_match_in_memory_text(tmp_path):
+    store = _store(tmp_path)
+    index = save_paragraph_index(store, FILE_PATH, TEXT)
+    focus = [index.paragraphs[4].para_id]
+    with open_chapter(FILE_PATH, store) as reader:
+        spans = list(reader.iter_paragraph_spans())
+        assert spans == [(p.byte_start, p.byte_end) for p in index.paragraphs]
+        assert [reader.paragraph(p) for p in index.paragraphs] == [
+            TEXT[p.char_start:p.char_end] for p in index.paragraphs]
+        assert reader.annotate_window(index, focus) == annotate_window(TEXT, index, focus)
+        assert reader.annotate(index, max_chars=40) == annotate_paragraphs(TEXT, index, max_chars=40)
+
+
+def test_empty_file(tmp_path):
+    store = LocalAssetStore(root=str(tmp_path))
+    store.write_text(FILE_PATH, "")
+    with open_chapter(FILE_PATH, store) as reader:
+        assert reader.line_count == 0 and reader.head(10) == "" and list(reader.iter_paragraph_spans()) == []
+
+
+def test_chapter_excerpt_reads_version_file(tmp_path):
+    from graphs.node import _chapter_excerpt
+
+    store = _store(tmp_path)
+    chapter = ChapterInfo(chapter_no="1", title="入城", current_version=1, file_path=FILE_PATH)
+    # 段落索引缺失时按行读取开头
+    assert _chapter_excerpt(chapter, 12, store) == "第一段，林远走进城门。\n"
+    index = save_paragraph_index(store, FILE_PATH, TEXT)
+    assert _chapter_excerpt(chapter, 60, store) == annotate_paragraphs(TEXT, index, max_chars=60)
+    missing = ChapterInfo(chapter_no="2", title="缺失", file_path="assets/p1/chapter_2/v1.md")
+    assert _chapter_excerpt(missing, 60, store) == ""
+    assert _chapter_excerpt(None, 60, store) == ""
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
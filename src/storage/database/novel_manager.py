@@ -117,3 +117,9 @@ class NovelStateManager:
             StateEvent.project_id == project_id,
             StateEvent.version_after == version_after
         ).order_by(StateEvent.created_at.desc()).all()
+    
+    def list_all_events(self, db: Session, project_id: str) -> List[StateEvent]:
+        """获取项目的全部事件（按时间正序）"""
+        return db.query(StateEvent).filter(
+            StateEvent.project_id == project_id
+        ).order_by(StateEvent.created_at.asc()).all()
@@ -3,6 +3,7 @@ NovelOS 数据库表定义
 包含：
 - novel_state_snapshot: 存储NovelState最新快照
 - state_events: 记录所有StateDelta、提案合并、回滚事件
+- llm_response_cache: 大模型响应缓存（可选持久化）
 """
 from sqlalchemy import BigInteger, DateTime, String, Text, JSON, Index
 from sqlalchemy.orm import Mapped, mapped_column
@@ -47,3 +48,19 @@ class StateEvent(Base):
         Index("idx_project_id", "project_id"),
         Index("idx_version_after", "version_after"),
     )
+
+
+class LLMResponseCache(Base):
+    """大模型响应缓存表（LLM 网关的持久化层，NOVELOS_LLM_CACHE_BACKEND=db 时使用）"""
+    __tablename__ = "llm_response_cache"
+    
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    cache_key: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, comment="请求哈希（模型+消息+参数）")
+    node: Mapped[Optional[str]] = mapped_column(String(100), comment="发起调用的节点")
+    response: Mapped[dict] = mapped_column(JSON, nullable=False, comment="响应内容与元数据")
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, comment="过期时间")
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, comment="创建时间")
+    
+    __table_args__ = (
+        Index("idx_llm_cache_expires_at", "expires_at"),
+    )
@@ -1,10 +1,16 @@
 import os
 import re
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional, Any, Dict, List, TypedDict, Iterable
+from typing import Optional, Any, Dict, List, TypedDict, Iterable, Iterator, Tuple
 from uuid import uuid4
 
 import boto3
+from cachetools import TLRUCache
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 from boto3.s3.transfer import TransferConfig
 import logging
@@ -13,6 +19,136 @@ logger = logging.getLogger(__name__)
 # 允许的文件名字符集（面向用户输入的约束）
 FILE_NAME_ALLOWED_RE = re.compile(r"^[A-Za-z0-9._\-/]+$")
 
+# 分片大小（字节），默认 5MB 以适配代理层限制；S3 要求除最后一片外不小于 5MB
+DEFAULT_PART_SIZE = int(os.getenv("COZE_BUCKET_PART_SIZE", str(5 * 1024 * 1024)))
+# 分片上传/范围下载的并发数
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("COZE_BUCKET_MAX_CONCURRENCY", "8"))
+
+
+# DeleteObjects 单次请求最多 1000 个 key
+DELETE_BATCH_SIZE = 1000
+# 签名 URL 缓存：最多缓存条目数；条目在 URL 有效期过半后失效，保证返回的 URL 至少还剩一半有效期
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv("COZE_PRESIGNED_URL_CACHE_SIZE", "4096"))
+
+# 服务端未返回有效期时令牌的默认有效期、过期前预留的安全余量，以及提前刷新窗口（秒）
+STORAGE_TOKEN_TTL = int(os.getenv("COZE_STORAGE_TOKEN_TTL", "3600"))
+STORAGE_TOKEN_EXPIRY_MARGIN = int(os.getenv("COZE_STORAGE_TOKEN_EXPIRY_MARGIN", "60"))
+STORAGE_TOKEN_REFRESH_AHEAD = int(os.getenv("COZE_STORAGE_TOKEN_REFRESH_AHEAD", "300"))
+
+
+def _expiry_recorder():
+    """交给专用 SDK 客户端的令牌缓存：不缓存（每次获取都真实换取），只记录服务端返回的 expires_in"""
+    from coze_workload_identity.client import TokenCache
+
+    class _ExpiryRecorder(TokenCache):
+        def __init__(self):
+            super().__init__()
+            self.last: Optional[Tuple[str, int]] = None
+
+        def get(self, key: str) -> Optional[str]:
+            return None
+
+        def set(self, key: str, token: str, expires_in: int) -> None:
+            self.last = (token, expires_in)
+
+    return _ExpiryRecorder()
+
+
+class StorageTokenProvider:
+    """x-storage-token 进程级缓存
+    - 令牌及其过期时间由本类持有：按服务端返回的 expires_in 计算，预留 STORAGE_TOKEN_EXPIRY_MARGIN 秒余量
+    - 专用的 workload identity 客户端不走 SDK 的进程级缓存，刷新时总是换取新令牌
+    - 进入提前刷新窗口时由后台线程刷新（同一时刻只有一个），调用方继续使用当前令牌，不阻塞
+    - 令牌缺失或已过期时同步获取，多线程并发时只发起一次请求
+    """
+
+    def __init__(self, refresh_ahead: int = STORAGE_TOKEN_REFRESH_AHEAD):
+        self.refresh_ahead = refresh_ahead
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+        self._client = None
+        self._recorder = None
+
+    def _fetch(self) -> Tuple[str, int]:
+        """换取新令牌，返回 (令牌, 有效期秒数)；调用方持有 self._fetch_lock"""
+        if self._client is None:
+            from coze_workload_identity import Client as CozeClient
+            self._recorder = _expiry_recorder()
+            client = CozeClient()
+            # 专用客户端换用不缓存的记录器：刷新时真实换取新令牌，并拿到服务端返回的有效期
+            client._token_cache = self._recorder
+            self._client = client
+        token = self._client.get_access_token()
+        last = self._recorder.last
+        expires_in = last[1] if last is not None and last[0] == token else STORAGE_TOKEN_TTL
+        return token, int(expires_in)
+
+    def _store(self, token: str, expires_in: int) -> None:
+        """调用方持有 self._lock"""
+        now = time.monotonic()
+        lifetime = max(1, expires_in - STORAGE_TOKEN_EXPIRY_MARGIN)
+        self._token = token
+        self._expires_at = now + lifetime
+        self._refresh_at = self._expires_at - min(self.refresh_ahead, lifetime // 2)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            with self._fetch_lock:
+                token, expires_in = self._fetch()
+            with self._lock:
+                self._store(token, expires_in)
+        except Exception as e:
+            # 后台刷新失败不影响当前令牌，下次调用会再次触发；过期后转为同步获取
+            logger.warning("Background refresh of x-storage-token failed: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get_token(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            token = self._token
+            if token is not None and now < self._expires_at:
+                if now >= self._refresh_at and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name="storage-token-refresh",
+                                     daemon=True).start()
+                return token
+
+        with self._fetch_lock:
+            # 等锁期间其他线程（或后台刷新）可能已完成获取
+            with self._lock:
+                if self._token is not None and time.monotonic() < self._expires_at:
+                    return self._token
+            token, expires_in = self._fetch()
+            with self._lock:
+                self._store(token, expires_in)
+            return token
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """令牌被服务端拒绝时调用，下次获取将同步刷新；指定 token 时只在当前仍是该令牌时失效，避免重复失效刚换到的新令牌"""
+        with self._lock:
+            if token is None or self._token == token:
+                self._expires_at = 0.0
+
+
+_token_provider: Optional[StorageTokenProvider] = None
+_token_provider_lock = threading.Lock()
+
+
+def get_storage_token_provider() -> StorageTokenProvider:
+    """获取进程级存储令牌缓存（所有 S3SyncStorage 实例共享）"""
+    global _token_provider
+    if _token_provider is None:
+        with _token_provider_lock:
+            if _token_provider is None:
+                _token_provider = StorageTokenProvider()
+    return _token_provider
+
 
 class ListFilesResult(TypedDict):
     # list_files 的返回结构类型
@@ -20,6 +156,19 @@ class ListFilesResult(TypedDict):
     is_truncated: bool
     next_continuation_token: Optional[str]
 
+
+class ObjectInfo(TypedDict):
+    # iter_objects 的元素结构类型
+    key: str
+    size: int
+    last_modified: float
+
+
+class DeleteManyResult(TypedDict):
+    # delete_many 的返回结构类型
+    deleted: List[str]
+    errors: List[Dict[str, str]]
+
 class S3SyncStorage:
     """S3兼容存储实现"""
 
@@ -30,6 +179,13 @@ class S3SyncStorage:
         self.bucket_name = bucket_name
         self.region = region
         self._client = None
+        # (bucket, key, expire_time) -> 签名 URL
+        self._presigned_cache: TLRUCache = TLRUCache(
+            maxsize=PRESIGNED_URL_CACHE_SIZE,
+            ttu=lambda cache_key, url, now: now + cache_key[2] / 2,
+            timer=time.monotonic,
+        )
+        self._presigned_lock = threading.Lock()
 
     def _get_client(self):
         if self._client is None:
@@ -58,21 +214,16 @@ class S3SyncStorage:
                 aws_access_key_id=self.access_key,
                 aws_secret_access_key=self.secret_key,
                 region_name=self.region,
+                # 连接池需覆盖分片并发数，否则并发请求会反复建连
+                config=BotoConfig(max_pool_connections=max(10, DEFAULT_MAX_CONCURRENCY * 2)),
             )
 
             # 注册 before-call 钩子，发送前注入 x-storage-token 头
+            token_provider = get_storage_token_provider()
+
             def _inject_header(**kwargs):
                 try:
-                    from coze_workload_identity import Client as CozeClient
-                    coze_client = CozeClient()
-                    try:
-                        token = coze_client.get_access_token()
-                    except Exception as e:
-                        logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: %s", e)
-                        token = None
-                        raise e
-                    finally:
-                        coze_client.close()
+                    token = token_provider.get_token()
                     params = kwargs.get("params", {})
                     headers = params.setdefault("headers", {})
                     headers["x-storage-token"] = token
@@ -80,6 +231,22 @@ class S3SyncStorage:
                     logger.error("Error loading COZE_WORKLOAD_IDENTITY_TOKEN: %s", e)
                     pass
             client.meta.events.register("before-call.s3", _inject_header)
+
+            # 令牌被拒绝（401/403）时失效令牌，换取新令牌后立即重试一次
+            def _retry_on_auth_error(response=None, attempts=1, request_dict=None, **kwargs):
+                if response is None or attempts > 1 or request_dict is None:
+                    return None
+                if getattr(response[0], "status_code", None) not in (401, 403):
+                    return None
+                headers = request_dict.setdefault("headers", {})
+                token_provider.invalidate(headers.get("x-storage-token"))
+                try:
+                    headers["x-storage-token"] = token_provider.get_token()
+                except Exception as e:
+                    logger.error("Error refreshing x-storage-token after auth failure: %s", e)
+                    return None
+                return 0
+            client.meta.events.register("needs-retry.s3", _retry_on_auth_error)
             self._client = client
         return self._client
 
@@ -152,16 +319,68 @@ class S3SyncStorage:
             logger.error(self._error_msg("Error uploading file to S3", e))
             raise e
 
+    def put_file(self, *, file_key: str, file_content: bytes, content_type: str = "application/octet-stream", bucket: Optional[str] = None) -> str:
+        """按指定 key 写入对象（覆盖写，不生成随机后缀），用于资产存储等需要稳定路径的场景。"""
+        self._validate_file_name(file_key)
+        try:
+            client = self._get_client()
+            target_bucket = self._resolve_bucket(bucket)
+            client.put_object(Bucket=target_bucket, Key=file_key, Body=file_content, ContentType=content_type)
+            return file_key
+        except Exception as e:
+            logger.error(self._error_msg("Error putting file to S3", e))
+            raise e
+
     def delete_file(self, *, file_key: str, bucket: Optional[str] = None) -> bool:
         try:
             client = self._get_client()
             target_bucket = self._resolve_bucket(bucket)
             client.delete_object(Bucket=target_bucket, Key=file_key)
+            self._evict_presigned(target_bucket, {file_key})
             return True
         except Exception as e:
             logger.error(self._error_msg("Error deleting file from S3", e))
             raise e
 
+    def delete_many(self, *, file_keys: Iterable[str], bucket: Optional[str] = None) -> DeleteManyResult:
+        """批量删除对象：按 1000 个 key 一批调用 DeleteObjects（Quiet 模式，仅返回失败项）
+        返回 deleted（已删除 key）与 errors（失败项：key/code/message），单批失败不会中断后续批次。
+        """
+        client = self._get_client()
+        target_bucket = self._resolve_bucket(bucket)
+        deleted: List[str] = []
+        errors: List[Dict[str, str]] = []
+        batch: List[str] = []
+
+        def _flush(keys: List[str]) -> None:
+            try:
+                resp = client.delete_objects(
+                    Bucket=target_bucket,
+                    Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True},
+                )
+            except Exception as e:
+                logger.error(self._error_msg(f"Error batch deleting {len(keys)} files from S3", e))
+                errors.extend({"key": k, "code": "RequestFailed", "message": str(e)} for k in keys)
+                return
+            failed = {}
+            for err in resp.get("Errors", []) or []:
+                failed[err.get("Key", "")] = {"key": err.get("Key", ""), "code": err.get("Code", ""), "message": err.get("Message", "")}
+            errors.extend(failed.values())
+            deleted.extend(k for k in keys if k not in failed)
+
+        for key in file_keys:
+            batch.append(key)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                _flush(batch)
+                batch = []
+        if batch:
+            _flush(batch)
+
+        self._evict_presigned(target_bucket, set(deleted))
+        if errors:
+            logger.warning(f"delete_many finished with {len(errors)} failures out of {len(deleted) + len(errors)} keys")
+        return {"deleted": deleted, "errors": errors}
+
     def file_exists(self, *, file_key: str, bucket: Optional[str] = None) -> bool:
         try:
             client = self._get_client()
@@ -178,26 +397,137 @@ class S3SyncStorage:
             logger.error(self._error_msg("Error checking file existence in S3", e))
             return False
 
-    def read_file(self, *, file_key: str, bucket: Optional[str] = None) -> bytes:
+    def _get_range(self, client, bucket: str, file_key: str, start: int, end: int, etag: Optional[str] = None) -> bytes:
+        """读取对象的 [start, end] 字节区间（闭区间，调用方保证不越过对象末尾）；etag 非空时以 IfMatch 固定对象版本"""
+        data, _, _ = self._get_range_with_total(client, bucket, file_key, start, end, etag)
+        if len(data) != end - start + 1:
+            raise IOError(f"S3 范围读取长度不符: {file_key} bytes={start}-{end}，期望 {end - start + 1} 字节，实际 {len(data)} 字节")
+        return data
+
+    def _get_range_with_total(self, client, bucket: str, file_key: str, start: int, end: int,
+                              etag: Optional[str] = None) -> Tuple[bytes, Optional[int], Optional[str]]:
+        """
+        范围读取，返回 (数据, 对象总大小, ETag)；总大小从 Content-Range 解析（服务端忽略 Range 时返回整个对象，总大小即其长度）。
+        etag 非空时附带 IfMatch，对象在分段读取期间被覆盖时服务端返回 412，不会拼接出新旧混合的内容
+        """
+        kwargs: Dict[str, Any] = {"Bucket": bucket, "Key": file_key, "Range": f"bytes={start}-{end}"}
+        if etag:
+            kwargs["IfMatch"] = etag
+        try:
+            resp = client.get_object(**kwargs)
+        except ClientError as e:
+            code = (e.response or {}).get("Error", {}).get("Code", "")
+            # 空对象不满足任何范围，S3 返回 InvalidRange
+            if start == 0 and code == "InvalidRange":
+                return b"", 0, None
+            if code in ("PreconditionFailed", "412"):
+                raise IOError(f"S3 对象在分段读取期间被修改: {file_key}") from e
+            raise
+        body = resp.get("Body")
+        if body is None:
+            raise RuntimeError("S3 get_object returned no Body")
+        try:
+            data = body.read()
+        finally:
+            try:
+                body.close()
+            except Exception as ce:
+                # 资源关闭失败不影响读取结果，仅记录以便排查
+                logger.debug("Failed to close S3 response body: %s", ce)
+        resp_etag = resp.get("ETag")
+        content_range = resp.get("ContentRange") or ""
+        if "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            total_size = int(total) if total.isdigit() else None
+            if total_size is not None and len(data) != min(end, total_size - 1) - start + 1:
+                raise IOError(f"S3 范围读取长度不符: {file_key} {content_range}，实际 {len(data)} 字节")
+            return data, total_size, resp_etag
+        return data, len(data) if start == 0 else None, resp_etag
+
+    def read_file(
+            self,
+            *,
+            file_key: str,
+            bucket: Optional[str] = None,
+            part_size: int = DEFAULT_PART_SIZE,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> bytes:
+        """读取完整对象
+        - 首个请求读取前 part_size 字节并获知对象总大小；小对象一次请求即完成
+        - 大对象其余部分按 part_size 切分为范围请求，以 max_concurrency 并发下载后拼接；
+          后续请求以首个响应的 ETag 做 IfMatch，每段校验长度，对象被修改或读取不完整时抛出异常
+        """
         try:
             client = self._get_client()
             target_bucket = self._resolve_bucket(bucket)
-            resp = client.get_object(Bucket=target_bucket, Key=file_key)
-            body = resp.get("Body")
-            if body is None:
-                raise RuntimeError("S3 get_object returned no Body")
-            try:
-                return body.read()
-            finally:
-                try:
-                    body.close()
-                except Exception as ce:
-                    # 资源关闭失败不影响读取结果，仅记录以便排查
-                    logger.debug("Failed to close S3 response body: %s", ce)
+            first, size, etag = self._get_range_with_total(client, target_bucket, file_key, 0, part_size - 1)
+            if size is None or size <= len(first):
+                return first
+
+            buf = bytearray(size)
+            buf[:len(first)] = first
+            ranges = [(start, min(start + part_size, size) - 1) for start in range(len(first), size, part_size)]
+
+            def _fetch(r):
+                buf[r[0]:r[1] + 1] = self._get_range(client, target_bucket, file_key, r[0], r[1], etag)
+
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="s3-get") as pool:
+                # list() 使分片异常向上传播
+                list(pool.map(_fetch, ranges))
+            return bytes(buf)
         except Exception as e:
             logger.error(self._error_msg("Error reading file from S3", e))
             raise e
 
+    def read_file_iter(
+            self,
+            *,
+            file_key: str,
+            bucket: Optional[str] = None,
+            part_size: int = DEFAULT_PART_SIZE,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> Iterator[bytes]:
+        """流式读取对象，按顺序逐块产出 bytes
+        - 以 part_size 为粒度发起范围请求，最多预取 max_concurrency 块，内存占用约为 part_size * max_concurrency
+        - 后续请求以首个响应的 ETag 做 IfMatch，每块校验长度，对象被修改或读取不完整时抛出异常
+        """
+        client = self._get_client()
+        target_bucket = self._resolve_bucket(bucket)
+        try:
+            first, size, etag = self._get_range_with_total(client, target_bucket, file_key, 0, part_size - 1)
+        except Exception as e:
+            logger.error(self._error_msg("Error reading file from S3", e))
+            raise e
+        if first:
+            yield first
+        if size is None or size <= len(first):
+            return
+
+        starts = iter(range(len(first), size, part_size))
+        pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="s3-get")
+        inflight = deque()
+
+        def _submit_next() -> None:
+            start = next(starts, None)
+            if start is not None:
+                inflight.append(pool.submit(self._get_range, client, target_bucket, file_key, start,
+                                            min(start + part_size, size) - 1, etag))
+
+        try:
+            for _ in range(max(1, max_concurrency)):
+                _submit_next()
+            while inflight:
+                data = inflight.popleft().result()
+                _submit_next()
+                yield data
+        except Exception as e:
+            logger.error(self._error_msg("Error streaming file from S3", e))
+            raise e
+        finally:
+            for f in inflight:
+                f.cancel()
+            pool.shutdown(wait=False)
+
     def list_files(self, *, prefix: Optional[str] = None, bucket: Optional[str] = None, max_keys: int = 1000, continuation_token: Optional[str] = None) -> ListFilesResult:
         """列出对象，支持前缀过滤与分页；返回 keys/is_truncated/next_continuation_token。"""
         try:
@@ -230,21 +560,64 @@ class S3SyncStorage:
             logger.error(self._error_msg("Error listing files in S3", e))
             raise e
 
+    def iter_objects(self, *, prefix: Optional[str] = None, bucket: Optional[str] = None, start_after: Optional[str] = None,
+                     page_size: int = 1000) -> Iterator[ObjectInfo]:
+        """惰性遍历前缀下的对象（按 key 字典序），附带大小与最后修改时间（Unix 时间戳）；start_after 用于断点续扫"""
+        client = self._get_client()
+        target_bucket = self._resolve_bucket(bucket)
+        kwargs: Dict[str, Any] = {"Bucket": target_bucket, "MaxKeys": page_size}
+        if prefix:
+            kwargs["Prefix"] = prefix
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        while True:
+            try:
+                resp = client.list_objects_v2(**kwargs)
+            except Exception as e:
+                logger.error(self._error_msg("Error listing objects in S3", e))
+                raise e
+            for item in resp.get("Contents", []) or []:
+                if not isinstance(item, dict) or not item.get("Key"):
+                    continue
+                modified = item.get("LastModified")
+                yield {
+                    "key": item["Key"],
+                    "size": int(item.get("Size") or 0),
+                    "last_modified": modified.timestamp() if modified is not None else 0.0,
+                }
+            token = resp.get("NextContinuationToken")
+            if not resp.get("IsTruncated") or not token:
+                return
+            kwargs.pop("StartAfter", None)
+            kwargs["ContinuationToken"] = token
+
+    def _evict_presigned(self, bucket: str, keys: set) -> None:
+        """对象删除后清除其签名 URL 缓存"""
+        if not keys:
+            return
+        with self._presigned_lock:
+            for cache_key in [k for k in self._presigned_cache.keys() if k[0] == bucket and k[1] in keys]:
+                self._presigned_cache.pop(cache_key, None)
+
     def generate_presigned_url(self, *, key: str, bucket: Optional[str] = None, expire_time: int = 1800) -> str:
+        """生成签名 URL；相同 (bucket, key, expire_time) 在有效期过半前复用缓存结果。"""
+        target_bucket = self._resolve_bucket(bucket)
+        cache_key: Tuple[str, str, int] = (target_bucket, key, expire_time)
+        with self._presigned_lock:
+            url = self._presigned_cache.get(cache_key)
+        if url is not None:
+            return url
+        url = self._sign_url(key=key, bucket=target_bucket, expire_time=expire_time)
+        with self._presigned_lock:
+            self._presigned_cache[cache_key] = url
+        return url
+
+    def _sign_url(self, *, key: str, bucket: str, expire_time: int) -> str:
         """通过 S3 Proxy 生成签名 URL。"""
         import json
         import urllib.request as urllib_request
         try:
-            from coze_workload_identity import Client as CozeClient
-            coze_client = CozeClient()
-            try:
-                token = coze_client.get_access_token()
-            finally:
-                try:
-                    coze_client.close()
-                except Exception:
-                    # 资源释放失败不影响后续流程
-                    pass
+            token = get_storage_token_provider().get_token()
         except Exception as e:
             logger.error(f"Error loading x-storage-token: {e}")
             raise RuntimeError(f"获取 x-storage-token 失败: {e}")
@@ -295,10 +668,10 @@ class S3SyncStorage:
             file_name: str,
             content_type: str = "application/octet-stream",
             bucket: Optional[str] = None,
-            multipart_chunksize: int = 5 * 1024 * 1024,
-            multipart_threshold: int = 5 * 1024 * 1024,
-            max_concurrency: int = 1,
-            use_threads: bool = False,
+            multipart_chunksize: int = DEFAULT_PART_SIZE,
+            multipart_threshold: int = DEFAULT_PART_SIZE,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            use_threads: bool = True,
     ) -> str:
         """流式上传（文件对象）
         - fileobj: 任何带有 read() 方法的文件对象（如 open(..., 'rb') 返回的对象、io.BytesIO 等）
@@ -307,8 +680,8 @@ class S3SyncStorage:
         - bucket: 目标桶；为空时取环境变量或实例默认值
         - multipart_chunksize: 分片大小（默认 5MB，以适配代理层限制）
         - multipart_threshold: 触发分片上传的阈值（默认 5MB）
-        - max_concurrency: 并发分片上传的并发数（默认 1，避免代理层节流影响）
-        - use_threads: 是否启用线程并发（默认 False）
+        - max_concurrency: 并发分片上传的并发数（默认 COZE_BUCKET_MAX_CONCURRENCY；代理层节流时可调为 1）
+        - use_threads: 是否启用线程并发（默认 True；为 False 时退化为串行上传）
         返回：最终写入的对象 key
         """
         try:
@@ -364,13 +737,15 @@ class S3SyncStorage:
 
     def trunk_upload_file(self, *, chunk_iter: Iterable[bytes], file_name: str,
                            content_type: str = "application/octet-stream", bucket: Optional[str] = None,
-                           part_size: int = 5 * 1024 * 1024) -> str:
+                           part_size: int = DEFAULT_PART_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> str:
         """流式上传（字节迭代器，显式分片 Multipart Upload）
         - chunk_iter: 可迭代对象，逐块产生 bytes；每块大小可变（内部累积到 part_size 再上传），最后一块可小于 5MB
         - file_name: 原始文件名，用于生成唯一 key
         - content_type: MIME 类型
         - bucket: 目标桶；为空时取环境或实例默认值
         - part_size: 每个 part 的最小大小（除最后一个）；默认 5MB
+        - max_concurrency: 并发上传的分片数；生产者在分片上传期间继续填充缓冲，
+          在途分片最多 2 * max_concurrency 个，内存占用有上界
         返回：最终写入的对象 key
         """
         client = self._get_client()
@@ -385,7 +760,29 @@ class S3SyncStorage:
             logger.error(self._error_msg("create_multipart_upload failed", e))
             raise e
 
-        parts = []
+        max_concurrency = max(1, max_concurrency)
+        # 限制在途分片数量（排队 + 上传中），防止生产者快于上传时缓冲无限增长
+        slots = threading.BoundedSemaphore(max_concurrency * 2)
+        pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3-upload")
+        futures = []
+
+        def _upload_part(part_number: int, data: bytes) -> Dict[str, Any]:
+            try:
+                resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                          Body=data)
+                return {"PartNumber": part_number, "ETag": resp["ETag"]}
+            finally:
+                slots.release()
+
+        def _submit(part_number: int, data: bytes) -> None:
+            slots.acquire()
+            # 已有分片失败时尽早停止生产
+            for f in futures:
+                if f.done() and f.exception() is not None:
+                    slots.release()
+                    raise f.exception()
+            futures.append(pool.submit(_upload_part, part_number, data))
+
         part_number = 1
         buffer = bytearray()
         try:
@@ -395,17 +792,15 @@ class S3SyncStorage:
                 buffer.extend(chunk)
                 while len(buffer) >= part_size:
                     data = bytes(buffer[:part_size])
-                    buffer = buffer[part_size:]
-                    resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
-                                              Body=data)
-                    parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
+                    del buffer[:part_size]
+                    _submit(part_number, data)
                     part_number += 1
 
             # 上传最后不足 part_size 的余量
             if len(buffer) > 0:
-                resp = client.upload_part(Bucket=target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
-                                          Body=bytes(buffer))
-                parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
+                _submit(part_number, bytes(buffer))
+
+            parts = sorted((f.result() for f in futures), key=lambda p: p["PartNumber"])
 
             # 完成分片
             client.complete_multipart_upload(
@@ -417,8 +812,14 @@ class S3SyncStorage:
             return key
         except Exception as e:
             logger.error(self._error_msg("multipart upload failed", e))
+            # 取消排队中的分片并等待上传中的分片结束，避免 abort 之后仍有分片写入
+            for f in futures:
+                f.cancel()
+            wait(futures)
             try:
                 client.abort_multipart_upload(Bucket=target_bucket, Key=key, UploadId=upload_id)
             except Exception as ae:
                 logger.error(self._error_msg("abort_multipart_upload failed", ae))
             raise e
+        finally:
+            pool.shutdown(wait=True)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+测试脚本：全文检索索引 TextSearchIndex 的检索与首次出现定位
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from storage.search.text_index import TextSearchIndex
+
+
+def _index() -> TextSearchIndex:
+    index = TextSearchIndex("test")
+    index.index_chapter("1", 1, "林远推开门，屋里空无一人。\n桌上放着编号b1a号的钥匙。")
+    index.index_chapter("2", 1, "第二天，他看见林晓峰站在门口。\n林远问：“你是谁？”")
+    return index
+
+
+def test_search_ranks_matching_paragraph():
+    hits = _index().search("钥匙")
+    assert hits and hits[0].ref == "1" and "钥匙" in hits[0].snippet
+
+
+def test_first_appearance_in_chapter_order():
+    hit = _index().first_appearance("林远")
+    assert hit.ref == "1" and hit.offset == 0
+    assert _index().first_appearance("不存在的词") is None
+    assert _index().first_appearance("  ") is None
+
+
+def test_first_appearance_term_inside_longer_run():
+    index = _index()
+    # 英文数字片段在正文中属于更长的整词 "b1a"，单字 "号" 在正文中属于片段 "号的钥匙"
+    for term in ("1a", "a", "1a号", "a号的"):
+        hit = index.first_appearance(term)
+        assert hit is not None and hit.ref == "1", term
+        assert hit.snippet.find(term) >= 0
+    # 中文人名夹在更长的片段中
+    hit = index.first_appearance("林晓峰")
+    assert hit.ref == "2" and hit.offset == 7
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,345 @@
+"""
+NovelOS 全文检索索引
+对章节正文（按段落）和世界观数据（实体、规则、时间线、大纲）建立倒排索引：
+- 分词：中文按字符二元组（bigram），单字查询按单字；英文/数字按整词；安装了 jieba 时额外加入分词结果
+- 排序：BM25
+- 更新：提交正文时按章节增量更新；段落 para_id 即内容哈希，未变化的段落直接复用；
+  查询前按 NovelState 中各章节的 current_version 校验，其他实例写入的新版本也会被补齐
+- 首次出现：按章节序 + 段落序扫描候选段落，毫秒级定位
+"""
+import re
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from storage.asset.asset_store import get_asset_store
+from utils.text.paragraph import build_paragraph_index, load_paragraph_index
+
+logger = logging.getLogger(__name__)
+
+try:
+    import jieba  # pyright: ignore [reportMissingImports]
+    jieba.setLogLevel(logging.WARNING)
+except ImportError:
+    jieba = None
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 进程内最多缓存的项目索引数
+MAX_CACHED_PROJECTS = 16
+# 搜索结果摘要的上下文长度
+SNIPPET_CONTEXT = 30
+
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]+")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+
+
+def tokenize(text: str, for_query: bool = False) -> List[str]:
+    """
+    切分检索词项：中文连续片段产生字符二元组（长度为 1 的片段保留单字），英文数字按整词小写；
+    安装了 jieba 时，索引侧额外加入搜索引擎模式分词，查询侧加入精确模式分词
+    """
+    terms: List[str] = []
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(w.lower() for w in _WORD_RE.findall(text))
+    if jieba is not None:
+        words = jieba.lcut(text) if for_query else jieba.lcut_for_search(text)
+        terms.extend(f"w:{w}" for w in words if len(w) > 2 and _CJK_RE.fullmatch(w))
+    return terms
+
+
+class SearchDocument(BaseModel):
+    """索引文档"""
+    doc_id: str = Field(..., description="文档ID")
+    doc_type: str = Field(..., description="文档类型：chapter/entity/rule/timeline/outline")
+    ref: str = Field(..., description="引用对象（章节号/实体ID/规则ID/事件ID/大纲节点ID）")
+    title: str = Field(default="", description="标题")
+    text: str = Field(..., description="文档正文")
+    para_id: Optional[str] = Field(default=None, description="段落ID（章节文档）")
+    order: Tuple[float, int] = Field(default=(0.0, 0), description="排序键（章节序, 段落序），用于首次出现定位")
+    version: Optional[int] = Field(default=None, description="章节版本号（章节文档）")
+
+
+class SearchHit(BaseModel):
+    """检索结果"""
+    doc_id: str = Field(..., description="文档ID")
+    doc_type: str = Field(..., description="文档类型")
+    ref: str = Field(..., description="引用对象")
+    title: str = Field(default="", description="标题")
+    para_id: Optional[str] = Field(default=None, description="段落ID")
+    score: float = Field(default=0.0, description="BM25 得分")
+    snippet: str = Field(default="", description="命中片段")
+    offset: Optional[int] = Field(default=None, description="精确命中在文档中的字符偏移")
+
+
+def _chapter_order(chapter_no: str) -> float:
+    try:
+        return float(chapter_no)
+    except ValueError:
+        return math.inf
+
+
+def _signature(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class TextSearchIndex:
+    """单个项目的倒排索引（线程安全）"""
+
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+        self._lock = threading.RLock()
+        self._docs: Dict[str, SearchDocument] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+        # 章节号 -> 已索引的版本号；世界观数据签名
+        self._chapter_versions: Dict[str, int] = {}
+        self._world_signature: Optional[str] = None
+
+    # ---------- 文档增删 ----------
+
+    def _add(self, doc: SearchDocument) -> None:
+        # 章节文档的标题只是"第N章"，不参与检索
+        terms = Counter(tokenize(f"{doc.title}\n{doc.text}" if doc.title and doc.doc_type != "chapter" else doc.text))
+        self._docs[doc.doc_id] = doc
+        self._doc_terms[doc.doc_id] = terms
+        self._doc_len[doc.doc_id] = sum(terms.values())
+        self._total_len += self._doc_len[doc.doc_id]
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc.doc_id] = tf
+
+    def _remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        self._docs.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def index_chapter(self, chapter_no: str, version: int, text: str, para_index=None) -> int:
+        """
+        增量索引章节正文（按段落）。para_id 相同的段落内容必然相同，只更新排序键而不重建词项；
+        返回新增/重建的段落数
+        """
+        para_index = para_index or build_paragraph_index(text)
+        prefix = f"chapter:{chapter_no}:"
+        order = _chapter_order(chapter_no)
+        rebuilt = 0
+        with self._lock:
+            old_ids = {doc_id for doc_id in self._docs if doc_id.startswith(prefix)}
+            new_ids: Set[str] = set()
+            for p in para_index.paragraphs:
+                doc_id = prefix + p.para_id
+                new_ids.add(doc_id)
+                existing = self._docs.get(doc_id)
+                if existing is not None:
+                    existing.order = (order, p.index)
+                    existing.version = version
+                    continue
+                self._add(SearchDocument(
+                    doc_id=doc_id,
+                    doc_type="chapter",
+                    ref=chapter_no,
+                    title=f"第{chapter_no}章",
+                    text=text[p.char_start:p.char_end],
+                    para_id=p.para_id,
+                    order=(order, p.index),
+                    version=version
+                ))
+                rebuilt += 1
+            for doc_id in old_ids - new_ids:
+                self._remove(doc_id)
+            self._chapter_versions[chapter_no] = version
+        return rebuilt
+
+    def index_world(self, novel_state) -> bool:
+        """索引世界观数据（实体/规则/时间线/大纲），内容未变化时跳过，返回是否重建"""
+        docs: List[SearchDocument] = []
+        for entity in novel_state.world.entities.values():
+            attrs = "；".join(f"{k}：{v}" for k, v in entity.attributes.items())
+            docs.append(SearchDocument(
+                doc_id=f"entity:{entity.entity_id}", doc_type="entity", ref=entity.entity_id,
+                title=entity.name, text=f"{entity.description}\n{attrs}".strip()
+            ))
+        for rule in novel_state.world.canon_rules.values():
+            docs.append(SearchDocument(
+                doc_id=f"rule:{rule.rule_id}", doc_type="rule", ref=rule.rule_id,
+                title="", text="\n".join([rule.content, *rule.constraints])
+            ))
+        for event in novel_state.timeline:
+            docs.append(SearchDocument(
+                doc_id=f"timeline:{event.event_id}", doc_type="timeline", ref=event.event_id,
+                title=event.time_point, text=event.description,
+                order=(_chapter_order(event.chapter_ref) if event.chapter_ref else math.inf, 0)
+            ))
+        for beat in novel_state.outline:
+            docs.append(SearchDocument(
+                doc_id=f"outline:{beat.beat_id}", doc_type="outline", ref=beat.beat_id,
+                title=beat.title, text=beat.description, order=(0.0, beat.sequence)
+            ))
+        signature = _signature("\x00".join(f"{d.doc_id}\x01{d.title}\x01{d.text}" for d in docs))
+        with self._lock:
+            if signature == self._world_signature:
+                return False
+            for doc_id in [d for d, doc in self._docs.items() if doc.doc_type != "chapter"]:
+                self._remove(doc_id)
+            for doc in docs:
+                self._add(doc)
+            self._world_signature = signature
+        return True
+
+    def sync(self, novel_state) -> None:
+        """按 NovelState 补齐过期的章节与世界观数据（只处理版本号不一致的章节）"""
+        asset_store = get_asset_store()
+        for chapter_no, chapter in novel_state.chapters.items():
+            if not chapter.file_path or self._chapter_versions.get(chapter_no) == chapter.current_version:
+                continue
+            try:
+                text = asset_store.read_text(chapter.file_path)
+            except FileNotFoundError:
+                logger.warning(f"Chapter file not found while indexing: {chapter.file_path}")
+                continue
+            para_index = load_paragraph_index(asset_store, chapter.file_path, text)
+            self.index_chapter(chapter_no, chapter.current_version, text, para_index)
+        with self._lock:
+            for chapter_no in [c for c in self._chapter_versions if c not in novel_state.chapters]:
+                for doc_id in [d for d in self._docs if d.startswith(f"chapter:{chapter_no}:")]:
+                    self._remove(doc_id)
+                del self._chapter_versions[chapter_no]
+        self.index_world(novel_state)
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, limit: int = 10, doc_types: Optional[Iterable[str]] = None) -> List[SearchHit]:
+        """BM25 检索"""
+        terms = list(dict.fromkeys(tokenize(query, for_query=True)))
+        allowed = set(doc_types) if doc_types else None
+        phrase = query.strip()
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and self._docs[doc_id].doc_type not in allowed:
+                        continue
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / avg_len))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [self._hit(self._docs[doc_id], score, phrase) for doc_id, score in ranked]
+
+    def first_appearance(self, term: str, doc_types: Iterable[str] = ("chapter",)) -> Optional[SearchHit]:
+        """按章节序 + 段落序查找精确字符串的首次出现"""
+        term = term.strip()
+        if not term:
+            return None
+        allowed = set(doc_types)
+        # 只有中文二元组对子串安全：英文整词、单字片段、分词结果在更长的上下文中会被切成别的词项，
+        # 不能用来排除文档（如 "1a" 之于 "b1a"）；没有二元组时全量扫描
+        query_terms = [run[i:i + 2] for run in _CJK_RE.findall(term) for i in range(len(run) - 1)]
+        with self._lock:
+            # 候选集：包含全部二元组的文档（词项集合取交集），再逐个做精确子串校验
+            candidates: Set[str] = set(self._docs)
+            for t in sorted(set(query_terms), key=lambda t: len(self._postings.get(t, ()))):
+                candidates &= self._postings.get(t, {}).keys()
+                if not candidates:
+                    return None
+            ordered = sorted(
+                (self._docs[d] for d in candidates if self._docs[d].doc_type in allowed),
+                key=lambda doc: doc.order
+            )
+            for doc in ordered:
+                if term in doc.text:
+                    return self._hit(doc, 0.0, term)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "project_id": self.project_id,
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                "chapters": dict(self._chapter_versions),
+            }
+
+    @staticmethod
+    def _hit(doc: SearchDocument, score: float, phrase: str) -> SearchHit:
+        offset = doc.text.find(phrase) if phrase else -1
+        if offset >= 0:
+            start = max(0, offset - SNIPPET_CONTEXT)
+            snippet = doc.text[start:offset + len(phrase) + SNIPPET_CONTEXT]
+        else:
+            snippet = doc.text[:SNIPPET_CONTEXT * 2]
+        return SearchHit(
+            doc_id=doc.doc_id,
+            doc_type=doc.doc_type,
+            ref=doc.ref,
+            title=doc.title,
+            para_id=doc.para_id,
+            score=round(score, 4),
+            snippet=snippet,
+            offset=offset if offset >= 0 else None
+        )
+
+
+_indexes: "OrderedDict[str, TextSearchIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(project_id: str, novel_state=None) -> TextSearchIndex:
+    """获取项目索引（进程内 LRU 缓存）；提供 novel_state 时先补齐过期内容"""
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+        if index is None:
+            index = TextSearchIndex(project_id)
+            _indexes[project_id] = index
+            while len(_indexes) > MAX_CACHED_PROJECTS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(project_id)
+    if novel_state is not None:
+        index.sync(novel_state)
+    return index
+
+
+def update_search_index(novel_state, chapter_no: str, version: int, text: str, para_index=None) -> None:
+    """提交正文后增量更新索引；索引只是加速结构，失败不影响提交"""
+    try:
+        index = get_search_index(novel_state.project_id)
+        index.index_chapter(chapter_no, version, text, para_index)
+        index.index_world(novel_state)
+    except Exception as e:
+        logger.warning(f"Failed to update search index for {novel_state.project_id}: {e}")
+
+
+__all__ = [
+    "SearchDocument",
+    "SearchHit",
+    "TextSearchIndex",
+    "tokenize",
+    "get_search_index",
+    "update_search_index",
+]
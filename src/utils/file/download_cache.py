@@ -0,0 +1,249 @@
+"""
+远程文件下载缓存
+以 URL 为键（去掉预签名 URL 中每次都会变化的签名参数）缓存下载内容到本地磁盘：
+- 命中且在新鲜期内直接返回；过期后带 If-None-Match / If-Modified-Since 条件请求，304 时沿用本地副本
+- 按总大小做 LRU 淘汰；fetch 为上下文管理器，with 块内条目被固定，不会被淘汰
+- 同一 URL 的并发下载只执行一次，其余调用等待并复用结果
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CACHE_DIR = os.getenv("NOVELOS_DOWNLOAD_CACHE_DIR", "/tmp/novelos_download_cache")
+# 缓存总容量上限（字节），默认 1GB；设为 0 时关闭缓存，远程文件改为逐次流式下载
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("NOVELOS_DOWNLOAD_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 新鲜期（秒）：期内命中不发请求，过期后条件请求校验
+DOWNLOAD_CACHE_TTL = int(os.getenv("NOVELOS_DOWNLOAD_CACHE_TTL", "300"))
+
+# 预签名 URL 中随每次签发变化、与内容无关的参数
+_VOLATILE_PARAMS = {
+    "x-amz-signature", "x-amz-date", "x-amz-expires", "x-amz-credential", "x-amz-security-token",
+    "x-amz-signedheaders", "x-amz-algorithm",
+    "x-tos-signature", "x-tos-date", "x-tos-expires", "x-tos-credential", "x-tos-security-token",
+    "x-tos-signedheaders", "x-tos-algorithm",
+    "signature", "expires", "ossaccesskeyid", "security-token", "sign", "x-expires", "x-signature",
+}
+
+
+class FileTooLargeError(Exception):
+    """下载内容超过大小限制"""
+
+
+def cache_key(url: str) -> str:
+    """URL 规范化后取 sha256 作为缓存键"""
+    parsed = urlparse(url)
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k.lower() not in _VOLATILE_PARAMS)
+    normalized = urlunparse((parsed.scheme, parsed.netloc.lower(), parsed.path, parsed.params, urlencode(query), ""))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class DownloadCache:
+    """URL 下载缓存（磁盘 + 进程内 LRU 索引）"""
+
+    def __init__(self, cache_dir: str = DOWNLOAD_CACHE_DIR, max_bytes: int = DOWNLOAD_CACHE_MAX_BYTES,
+                 ttl: int = DOWNLOAD_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # LRU 索引：key -> 文件大小，越靠后越新
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # 每个 key 一把锁：下载去重，同时保护正在使用的条目不被淘汰
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._in_use: Dict[str, int] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.bin")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _scan(self) -> None:
+        """启动时按访问时间重建 LRU 索引，清理残留的临时文件"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(".tmp"):
+                    _remove_quietly(path)
+                    continue
+                if not name.endswith(".bin"):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        entries.sort()
+        for _, key, size in entries:
+            self._lru[key] = size
+            self._total_bytes += size
+
+    def _read_meta(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, key: str, size: int) -> None:
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old
+            self._lru[key] = size
+            self._total_bytes += size
+        try:
+            os.utime(self._data_path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            # 最近一次访问的条目始终保留，避免刚下载的文件在被读取前就被淘汰
+            for key in list(self._lru.keys())[:-1]:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if self._in_use.get(key):
+                    continue
+                self._total_bytes -= self._lru.pop(key)
+                _remove_quietly(self._data_path(key))
+                _remove_quietly(self._meta_path(key))
+
+    @contextmanager
+    def fetch(self, url: str, *, headers: Optional[Dict[str, str]] = None, max_size: Optional[int] = None,
+              timeout: float = 60) -> Iterator[str]:
+        """
+        产出 URL 内容的本地缓存路径（必要时下载/校验）。
+        with 块内该条目保持固定、不会被淘汰；退出后路径随时可能失效，需长期保留时在块内复制
+        """
+        key = cache_key(url)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            with key_lock:
+                path = self._fetch_locked(key, url, headers or {}, max_size, timeout)
+            yield path
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+                    self._key_locks.pop(key, None)
+            self._evict()
+
+    def _fetch_locked(self, key: str, url: str, headers: Dict[str, str], max_size: Optional[int], timeout: float) -> str:
+        data_path = self._data_path(key)
+        meta = self._read_meta(key) if os.path.exists(data_path) else None
+        if meta is not None:
+            if max_size is not None and meta.get("size", 0) > max_size:
+                raise FileTooLargeError(f"文件大小 ({meta.get('size')} bytes) 超过限制 {max_size} bytes")
+            if time.time() - meta.get("validated_at", 0) < self.ttl:
+                self._touch(key, meta.get("size", 0))
+                return data_path
+            # 过期：条件请求校验
+            if meta.get("etag"):
+                headers = {**headers, "If-None-Match": meta["etag"]}
+            if meta.get("last_modified"):
+                headers = {**headers, "If-Modified-Since": meta["last_modified"]}
+
+        with requests.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+            if resp.status_code == 304 and meta is not None:
+                meta["validated_at"] = time.time()
+                self._write_meta(key, meta)
+                self._touch(key, meta.get("size", 0))
+                return data_path
+            resp.raise_for_status()
+
+            content_length = resp.headers.get('Content-Length')
+            if max_size is not None and content_length and int(content_length) > max_size:
+                raise FileTooLargeError(f"文件大小 ({int(content_length)} bytes) 超过限制 {max_size} bytes，已终止下载。")
+
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            tmp_path = f"{data_path}.{uuid.uuid4().hex[:8]}.tmp"
+            size = 0
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in resp.iter_content(chunk_size=64 * 1024):
+                        if not chunk:
+                            continue
+                        size += len(chunk)
+                        # Header 缺失 Content-Length 或与实际不符时按实际大小中断
+                        if max_size is not None and size > max_size:
+                            raise FileTooLargeError(f"检测到文件超过限制 {max_size} bytes，已中断。")
+                        f.write(chunk)
+                os.replace(tmp_path, data_path)
+            except BaseException:
+                _remove_quietly(tmp_path)
+                raise
+
+            self._write_meta(key, {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "content_type": resp.headers.get("Content-Type"),
+                "size": size,
+                "validated_at": time.time(),
+            })
+        self._touch(key, size)
+        return data_path
+
+    def _write_meta(self, key: str, meta: dict) -> None:
+        path = self._meta_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._lru), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_download_cache: Optional[DownloadCache] = None
+_download_cache_lock = threading.Lock()
+
+
+def get_download_cache() -> DownloadCache:
+    """获取进程级下载缓存实例"""
+    global _download_cache
+    if _download_cache is None:
+        with _download_cache_lock:
+            if _download_cache is None:
+                _download_cache = DownloadCache()
+    return _download_cache
+
+
+__all__ = [
+    "DownloadCache",
+    "FileTooLargeError",
+    "cache_key",
+    "get_download_cache",
+]
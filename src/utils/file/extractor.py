@@ -0,0 +1,269 @@
+"""
+文档文本流式提取
+按页/按节产出文本（各片段直接拼接即为完整文本），供调用方边提取边消费：
+- PDF: 页数较多时按页区间切分到进程池并行提取，按页序产出；进程池不可用时退化为逐页提取
+- DOCX: 按正文段落/表格行产出；PPTX: 按幻灯片产出；XLSX/CSV: 整表产出
+- 提取结果按内容哈希缓存（进程内 LRU，按字符数计容量），同一份资料重复发送时不再解析
+"""
+import os
+import mmap
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# PDF 页数达到该值时才使用进程池（小文件进程间传输的开销得不偿失）
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("NOVELOS_PDF_PARALLEL_MIN_PAGES", "24"))
+# 每个并行任务的最少页数
+PDF_PAGES_PER_TASK = 8
+# 提取进程数，默认 min(4, CPU 数)
+EXTRACT_WORKERS = int(os.getenv("NOVELOS_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 提取结果缓存容量（字符数），默认 32M 字符
+EXTRACT_CACHE_MAX_CHARS = int(os.getenv("NOVELOS_EXTRACT_CACHE_MAX_CHARS", str(32 * 1024 * 1024)))
+
+DOCUMENT_EXTS = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.csv', '.ppt', '.pptx']
+
+# 文档来源：内存字节 / 本地文件路径 / 可 seek 的二进制文件对象（如 SpooledTemporaryFile）
+Source = Union[bytes, str, BinaryIO]
+
+_cache: LRUCache = LRUCache(maxsize=EXTRACT_CACHE_MAX_CHARS, getsizeof=len)
+_cache_lock = threading.Lock()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _open_stream(source: Source, mapped: bool = False):
+    """
+    统一为可 seek 的二进制流：bytes 包装为 BytesIO；文件对象回到开头后直接使用；
+    路径直接打开，mapped=True 时以只读 mmap 映射（pypdf 随机读取频繁，映射后按需换页，不占进程堆内存）。
+    zipfile（docx/pptx）要求流提供 seekable()，3.13 之前的 mmap 不满足，故只对 PDF 映射
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield BytesIO(source)
+        return
+    if not isinstance(source, str):
+        source.seek(0)
+        yield source
+        return
+    with open(source, 'rb') as f:
+        if not mapped:
+            yield f
+            return
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            yield f
+            return
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if EXTRACT_WORKERS <= 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn：服务进程内有大量线程，fork 子进程存在死锁风险
+                _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extract_pdf_pages(source: Source, start: int, end: int) -> List[str]:
+    """提取 [start, end) 页的文本（进程池任务，source 需可被 pickle；路径来源时各子进程自行映射文件）"""
+    import pypdf
+    with _open_stream(source, mapped=True) as stream:
+        reader = pypdf.PdfReader(stream)
+        return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+
+
+def iter_pdf_pages(source: Source) -> Iterator[str]:
+    import pypdf
+    with _open_stream(source, mapped=True) as stream:
+        reader = pypdf.PdfReader(stream)
+        page_count = len(reader.pages)
+        # 文件对象无法跨进程传递，只在进程内逐页提取
+        parallel = isinstance(source, (bytes, str)) and page_count >= PDF_PARALLEL_MIN_PAGES
+        pool = _get_pool() if parallel else None
+        if pool is None:
+            for page in reader.pages:
+                yield (page.extract_text() or "") + "\n"
+            return
+
+    step = max(PDF_PAGES_PER_TASK, -(-page_count // (EXTRACT_WORKERS * 2)))
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    try:
+        futures = [pool.submit(_extract_pdf_pages, source, start, end) for start, end in ranges]
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.warning(f"PDF extract pool unavailable, falling back to serial: {e}")
+        _reset_pool()
+        yield from _extract_pdf_pages(source, 0, page_count)
+        return
+    done = 0
+    try:
+        # 按页序产出：前面的区间完成即可开始消费，后面的区间继续在子进程中提取
+        for i, future in enumerate(futures):
+            for text in future.result():
+                yield text
+            done = ranges[i][1]
+    except BrokenProcessPool as e:
+        logger.warning(f"PDF extract pool broken at page {done}, continuing serially: {e}")
+        _reset_pool()
+        yield from _extract_pdf_pages(source, done, page_count)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_docx_parts(source) -> Iterator[str]:
+    """按顺序产出 docx 的正文段落与表格行（docx2python 以嵌套列表返回内容）"""
+    from docx2python import docx2python
+    doc_result = docx2python(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    try:
+        for section in doc_result.body:
+            if not isinstance(section, list):
+                continue
+            for item in section:
+                if isinstance(item, list):
+                    # 可能是表格或多级内容
+                    for sub_item in item:
+                        if isinstance(sub_item, str) and sub_item.strip():
+                            yield sub_item.strip()
+                        elif isinstance(sub_item, list):
+                            # 表格行
+                            row_text = "\n".join([str(cell).strip() for cell in sub_item if str(cell).strip()])
+                            if row_text:
+                                yield row_text
+                elif isinstance(item, str) and item.strip():
+                    yield item.strip()
+    finally:
+        doc_result.close()
+
+
+def iter_pptx_slides(source) -> Iterator[str]:
+    """按幻灯片产出文本（含表格与备注）"""
+    from pptx import Presentation
+    prs = Presentation(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    for i, slide in enumerate(prs.slides):
+        page_content = [f"=== 第 {i+1} 页 ==="]
+        for shape in slide.shapes:
+            # 提取普通文本框
+            if hasattr(shape, "text") and shape.text.strip():
+                page_content.append(shape.text.strip())
+            # 提取表格内容 (普通 shape.text 无法获取表格内的字)
+            if shape.has_table:
+                table_texts = []
+                for row in shape.table.rows:
+                    row_cells = [cell.text_frame.text.strip() for cell in row.cells if cell.text_frame.text.strip()]
+                    if row_cells:
+                        table_texts.append(" | ".join(row_cells))
+                if table_texts:
+                    page_content.append("[表格]\n" + "\n".join(table_texts))
+        # 很多重要信息藏在备注里
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame.text
+            if notes.strip():
+                page_content.append(f"[备注]: {notes.strip()}")
+        yield "\n".join(page_content)
+
+
+def _iter_sheet(source: Source, ext: str) -> Iterator[str]:
+    """表格整体产出（pandas 一次性读入，无法按页流式）"""
+    import pandas as pd
+    with _open_stream(source) as stream:
+        df = pd.read_csv(stream) if ext == '.csv' else pd.read_excel(stream)
+    yield df.to_string()
+
+
+def _joined(parts: Iterator[str], sep: str) -> Iterator[str]:
+    """在片段之间插入分隔符，保证拼接结果与整体提取一致"""
+    first = True
+    for part in parts:
+        yield part if first else sep + part
+        first = False
+
+
+def _iter_uncached(source: Source, ext: str) -> Iterator[str]:
+    if ext == '.pdf':
+        yield from iter_pdf_pages(source)
+    elif ext in ['.docx', '.doc']:
+        with _open_stream(source) as stream:
+            yield from _joined(iter_docx_parts(stream), "\n\n")
+    elif ext in ['.xlsx', '.xls', '.csv']:
+        yield from _iter_sheet(source, ext)
+    elif ext in ['.ppt', '.pptx']:
+        with _open_stream(source) as stream:
+            yield from _joined(iter_pptx_slides(stream), "\n\n")
+    else:
+        yield f"[暂不支持解析该文档格式: {ext}]"
+
+
+def content_hash(source: Source) -> str:
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+        return h.hexdigest()
+    with _open_stream(source) as stream:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def iter_document_text(source: Source, ext: str) -> Iterator[str]:
+    """
+    流式提取文档文本；source 为 bytes、本地文件路径或可 seek 的二进制文件对象。
+    完整提取后写入缓存；中途放弃消费的结果不缓存
+    """
+    key = f"{content_hash(source)}{ext}"
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts: List[str] = []
+    for part in _iter_uncached(source, ext):
+        parts.append(part)
+        yield part
+    text = "".join(parts)
+    if len(text) <= EXTRACT_CACHE_MAX_CHARS:
+        with _cache_lock:
+            _cache[key] = text
+
+
+def extract_document_text(source: Source, ext: str) -> str:
+    return "".join(iter_document_text(source, ext))
+
+
+__all__ = [
+    "DOCUMENT_EXTS",
+    "iter_document_text",
+    "extract_document_text",
+    "iter_pdf_pages",
+    "iter_docx_parts",
+    "iter_pptx_slides",
+    "content_hash",
+]
@@ -1,14 +1,31 @@
 import os
+import shutil
 import requests
 import uuid
+import tempfile
+import codecs
 import chardet
 from io import BytesIO
-from typing import Literal,Callable, Any, Optional,Union
+from contextlib import contextmanager, ExitStack
+from typing import Literal,Callable, Any, Optional,Union,Iterator,BinaryIO
 from pydantic import BaseModel, Field, field_validator,PrivateAttr
 from urllib.parse import urlparse
 from pptx import Presentation
 
-MAX_FILE_SIZE = 10 * 1024 * 1024
+from utils.file.download_cache import get_download_cache, FileTooLargeError
+from utils.file.extractor import extract_document_text, iter_document_text, iter_docx_parts, iter_pptx_slides
+
+# 可流式解析的文档（PDF/Word/PPT）大小上限：内容经磁盘中转、解析时按需映射，进程内存占用不随上限增长
+MAX_FILE_SIZE = int(os.getenv("NOVELOS_MAX_FILE_SIZE", str(256 * 1024 * 1024)))
+# 需整体读入内存的内容（纯文本解码结果、pandas 读取的表格、read_bytes）仍使用紧凑上限
+IN_MEMORY_MAX_FILE_SIZE = int(os.getenv("NOVELOS_IN_MEMORY_MAX_FILE_SIZE", str(10 * 1024 * 1024)))
+# 按页/按节流式解析的文档后缀
+STREAMED_DOCUMENT_EXTS = {'.pdf', '.doc', '.docx', '.ppt', '.pptx'}
+# 编码探测只读取文件前缀，之后按块增量解码
+CHARSET_DETECT_BYTES = 64 * 1024
+TEXT_DECODE_CHUNK = 1024 * 1024
+# 下载缓存关闭时远程文件写入 SpooledTemporaryFile，超过该大小后落盘
+SPOOL_MAX_MEMORY = int(os.getenv("NOVELOS_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
 
 class File(BaseModel):
     """
@@ -102,54 +119,51 @@ class FileOps:
         return file_obj.url
 
     @staticmethod
-    def _get_bytes_stream(file_obj:File) -> tuple[bytes, str]:
+    @contextmanager
+    def open_source(file_obj: File, max_size: Optional[int] = None) -> Iterator[tuple[Union[str, BinaryIO], str]]:
         """
-        获取文件内容和后缀, 5MB大小限制检查, 超出抛异常
+        打开文件内容但不整体读入内存, 产出 (来源, 后缀), 超出大小限制抛异常
+        来源为本地路径（本地文件/下载缓存副本，解析时按需 mmap）或 SpooledTemporaryFile（下载缓存关闭时）
+        max_size 默认按类型取值，见 max_file_size
         """
         _, ext = infer_file_category(file_obj.url)
+        max_size = max_size or max_file_size(ext)
 
         if file_obj.is_remote:
-            try:
-                # stream=True: 此时只下载 Headers，连接保持打开，还没下载 Body
-                with requests.get(file_obj.url, stream=True, timeout=60) as resp:
-                    resp.raise_for_status()
-
-                    content_length = resp.headers.get('Content-Length')
-                    if content_length and int(content_length) > MAX_FILE_SIZE:
-                        raise Exception(
-                            f"文件大小 ({int(content_length)} bytes) 超过限制 5MB，已终止下载。"
-                        )
-
-                    # 场景：Header 缺失 Content-Length 或服务器 Header 欺骗
-                    downloaded_content = BytesIO()
-                    current_size = 0
-
-                    # 分块读取，每块 8KB
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        if chunk:
-                            current_size += len(chunk)
-                            if current_size > MAX_FILE_SIZE:
-                                raise Exception(f"检测到文件超过 5MB，已中断。")
-                            downloaded_content.write(chunk)
-
-                    # 获取完整 bytes
-                    return downloaded_content.getvalue(), ext
-
-            except requests.RequestException as e:
-                raise RuntimeError(f"网络请求失败: {e}")
+            cache = get_download_cache()
+            with ExitStack() as stack:
+                try:
+                    if cache.enabled:
+                        # 经下载缓存获取：同一 URL 复用本地副本，过期后按 ETag/Last-Modified 校验；
+                        # 缓存条目在 with 块内保持固定，解析期间不会被淘汰
+                        source = stack.enter_context(cache.fetch(file_obj.url, max_size=max_size, timeout=60))
+                    else:
+                        source = stack.enter_context(_spool_download(file_obj.url, max_size=max_size, timeout=60))
+                except FileTooLargeError as e:
+                    raise Exception(str(e))
+                except requests.RequestException as e:
+                    raise RuntimeError(f"网络请求失败: {e}")
+                yield source, ext
 
         else:
             if not os.path.exists(file_obj.url):
                 raise FileNotFoundError(f"本地文件不存在: {file_obj.url}")
+            size = os.path.getsize(file_obj.url)
+            if size > max_size:
+                raise Exception(f"文件大小 ({size} bytes) 超过限制 {max_size} bytes")
 
-            '''
-            file_size = os.path.getsize(file_obj.url)
-            if file_size > MAX_FILE_SIZE:
-                 raise Exception(f"本地文件大小 ({file_size} bytes) 超过限制 5MB")
-            '''
+            yield file_obj.url, ext
 
-            with open(file_obj.url, 'rb') as f:
-                return f.read(), ext
+    @staticmethod
+    def _get_bytes_stream(file_obj:File) -> tuple[bytes, str]:
+        """
+        获取文件内容和后缀, 超出大小限制抛异常
+        """
+        with FileOps.open_source(file_obj, max_size=IN_MEMORY_MAX_FILE_SIZE) as (source, ext):
+            if isinstance(source, str):
+                with open(source, 'rb') as f:
+                    return f.read(), ext
+            return source.read(), ext
 
     @staticmethod
     def save_to_local(file_obj: File, filename: str) -> str:
@@ -165,18 +179,17 @@ class FileOps:
 
         try:
             os.makedirs(FileOps.DOWNLOAD_DIR, exist_ok=True)
-
-            # 简单的文件名生成策略 (真实场景建议用 url hash 避免重复下载)
-            # ext = os.path.splitext(file_obj.url.split('?')[0])[1] or ".tmp"
-            # filename = f"{uuid.uuid4().hex}{ext}"
             local_path = os.path.join(FileOps.DOWNLOAD_DIR, filename)
 
+            # 下载缓存以 URL hash 为键，避免重复下载；再链接/复制到调用方指定的文件名
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-            with requests.get(file_obj.url, headers=headers, stream=True, timeout=120) as r:
-                r.raise_for_status()
-                with open(local_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            with get_download_cache().fetch(file_obj.url, headers=headers, timeout=120) as cached_path:
+                tmp_path = f"{local_path}.{uuid.uuid4().hex[:8]}.tmp"
+                try:
+                    os.link(cached_path, tmp_path)
+                except OSError:
+                    shutil.copyfile(cached_path, tmp_path)
+            os.replace(tmp_path, local_path)
 
             return local_path
         except Exception as e:
@@ -198,45 +211,45 @@ class FileOps:
         场景：RAG、HTML解析、文档分析
         """
         try:
-            content, ext = FileOps._get_bytes_stream(file_obj)
+            with FileOps.open_source(file_obj) as (source, ext):
+                if ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
+                    return FileOps._parse_document(source, ext)
 
-            if ext in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
-                return FileOps._parse_document_bytes(file_obj, content, ext)
-
-            # 默认直接读
-            charset = chardet.detect(content)
-            if 'encoding' in charset:
-                return content.decode(charset['encoding'])
-            else:
-                return content.decode('utf-8')
+                # 默认直接读
+                return _decode_text(source)
 
         except Exception as e:
             return f"[FileOps Error] Failed to read content: {str(e)}"
 
+    @staticmethod
+    def iter_text(file_obj: File) -> Iterator[str]:
+        """
+        流式提取文本：文档按页/按节产出，各片段直接拼接即为 extract_text 的结果
+        场景：大文件边解析边消费
+        """
+        try:
+            with FileOps.open_source(file_obj) as (source, ext):
+                if ext not in ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
+                    yield from _iter_decoded_text(source)
+                    return
+                try:
+                    yield from iter_document_text(source, ext)
+                except ImportError as e:
+                    yield f"[解析库缺失] {e}"
+                except Exception as e:
+                    yield f"[解析失败] {e}"
+        except Exception as e:
+            yield f"[FileOps Error] Failed to read content: {str(e)}"
+
     @staticmethod
     def _parse_document_bytes(file_obj: File, content: bytes, ext:str) -> str:
-        stream = BytesIO(content)
-        text_result = ""
+        return FileOps._parse_document(content, ext)
 
+    @staticmethod
+    def _parse_document(source: Union[bytes, str, BinaryIO], ext: str) -> str:
         try:
-            if ext == '.pdf':
-                import pypdf
-                reader = pypdf.PdfReader(stream)
-                for page in reader.pages:
-                    text_result += page.extract_text() + "\n"
-            elif ext in ['.docx', '.doc']:
-                text_result = read_docx(stream)
-            elif ext in ['.xlsx', '.xls', '.csv']:
-                import pandas as pd
-                if ext == '.csv':
-                    df = pd.read_csv(stream)
-                else:
-                    df = pd.read_excel(stream)
-                text_result = df.to_string()
-            elif ext in ['.ppt', '.pptx']:
-                text_result = read_ppt(stream)
-            else:
-                text_result = f"[暂不支持解析该文档格式: {ext}]"
+            # 按页/按节提取（大 PDF 多进程并行），结果按内容哈希缓存
+            text_result = extract_document_text(source, ext)
         except ImportError as e:
             text_result = f"[解析库缺失] {e}"
         except Exception as e:
@@ -244,38 +257,88 @@ class FileOps:
 
         return text_result
 
+
+def _spool_download(url: str, max_size: int, timeout: float) -> BinaryIO:
+    """
+    流式下载到 SpooledTemporaryFile：SPOOL_MAX_MEMORY 以内留在内存，超过后自动落盘
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+
+            content_length = resp.headers.get('Content-Length')
+            if content_length and int(content_length) > max_size:
+                raise FileTooLargeError(f"文件大小 ({int(content_length)} bytes) 超过限制 {max_size} bytes，已终止下载。")
+
+            size = 0
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(f"检测到文件超过限制 {max_size} bytes，已中断。")
+                spooled.write(chunk)
+        spooled.seek(0)
+        return spooled
+    except BaseException:
+        spooled.close()
+        raise
+
+
+def max_file_size(ext: str) -> int:
+    """按后缀取大小上限：可流式解析的文档用 MAX_FILE_SIZE，纯文本与表格用 IN_MEMORY_MAX_FILE_SIZE"""
+    return MAX_FILE_SIZE if ext.lower() in STREAMED_DOCUMENT_EXTS else IN_MEMORY_MAX_FILE_SIZE
+
+
+def _detect_encoding(f: BinaryIO) -> str:
+    """
+    在有限长度的样本上探测编码：取文件前缀；前缀全为 ASCII 时向后跳到首个含非 ASCII 字节的块再探测，
+    每次只持有一个块。调用后文件位置不确定，由调用方重新定位
+    """
+    f.seek(0)
+    sample = f.read(CHARSET_DETECT_BYTES)
+    while sample and sample.isascii():
+        sample = f.read(CHARSET_DETECT_BYTES)
+    if not sample:
+        return 'utf-8'
+    encoding = chardet.detect(sample).get('encoding') or 'utf-8'
+    return 'utf-8' if encoding.lower() == 'ascii' else encoding
+
+
+def _iter_decoded_text(source: Union[str, BinaryIO]) -> Iterator[str]:
+    """在有限样本上探测编码，再按块增量解码产出文本片段"""
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        encoding = _detect_encoding(f)
+        f.seek(0)
+        chunk = f.read(TEXT_DECODE_CHUNK)
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)()
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')()
+        while chunk:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+            chunk = f.read(TEXT_DECODE_CHUNK)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    finally:
+        if isinstance(source, str):
+            f.close()
+
+
+def _decode_text(source: Union[str, BinaryIO]) -> str:
+    """读取文本文件并按探测到的编码解码"""
+    return "".join(_iter_decoded_text(source))
+
 def read_docx(cont_stream) -> str:
     """
     使用docx2python按顺序读取内容
     """
-    from docx2python import docx2python
-    doc_result = docx2python(cont_stream)
-
-    # 获取文档结构
-    all_parts = []
-
-    # docx2python以嵌套列表形式返回内容
-    # 遍历文档主体
-    for section in doc_result.body:
-        if isinstance(section, list):
-            for item in section:
-                if isinstance(item, list):
-                    # 可能是表格或多级内容
-                    for sub_item in item:
-                        if isinstance(sub_item, str) and sub_item.strip():
-                            all_parts.append(sub_item.strip())
-                        elif isinstance(sub_item, list):
-                            # 表格行
-                            row_text = "\n".join([str(cell).strip() for cell in sub_item if str(cell).strip()])
-                            if row_text:
-                                all_parts.append(row_text)
-                elif isinstance(item, str) and item.strip():
-                    all_parts.append(item.strip())
-
-    # 关闭文档
-    doc_result.close()
-
-    return "\n\n".join(all_parts)
+    return "\n\n".join(iter_docx_parts(cont_stream))
 
 def read_ppt(file_input: Union[str, bytes, BytesIO]) -> str:
     if not Presentation:
@@ -291,38 +354,7 @@ def read_ppt(file_input: Union[str, bytes, BytesIO]) -> str:
         ppt_stream = file_input
 
     try:
-        prs = Presentation(ppt_stream)
-        full_text = []
-
-        for i, slide in enumerate(prs.slides):
-            page_content = []
-            page_content.append(f"=== 第 {i+1} 页 ===")
-
-            # shape.text_frame 包含了形状内的文本段落
-            for shape in slide.shapes:
-                # 提取普通文本框
-                if hasattr(shape, "text") and shape.text.strip():
-                    page_content.append(shape.text.strip())
-
-                # B. 提取表格内容 (普通 shape.text 无法获取表格内的字)
-                if shape.has_table:
-                    table_texts = []
-                    for row in shape.table.rows:
-                        row_cells = [cell.text_frame.text.strip() for cell in row.cells if cell.text_frame.text.strip()]
-                        if row_cells:
-                            table_texts.append(" | ".join(row_cells))
-                    if table_texts:
-                        page_content.append("[表格]\n" + "\n".join(table_texts))
-
-            # 很多重要信息藏在备注里
-            if slide.has_notes_slide:
-                notes = slide.notes_slide.notes_text_frame.text
-                if notes.strip():
-                    page_content.append(f"[备注]: {notes.strip()}")
-
-            full_text.append("\n".join(page_content))
-
-        return "\n\n".join(full_text)
+        return "\n\n".join(iter_pptx_slides(ppt_stream))
 
     except Exception as e:
         return f"[PPT解析失败] {str(e)}"
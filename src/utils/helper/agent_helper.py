@@ -1,10 +1,15 @@
 import uuid
 import json
 import os
-from typing import Any, Dict, List, Tuple, Iterator
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Iterator
 import time
+from langchain_core.messages import AIMessageChunk
 from utils.file.file import File, FileOps, infer_file_category
 from utils.error import classify_error
+from utils.llm.json_stream import ANSWER_DELTA_EVENT
 
 from utils.messages.client import (
     ClientMessage,
@@ -30,9 +35,46 @@ from utils.messages.server import (
     MESSAGE_TYPE_TOOL_RESPONSE,
 )
 
+logger = logging.getLogger(__name__)
+
+# 附件并发预取的线程数上限（进程内所有请求共享）
+UPLOAD_PREFETCH_WORKERS = int(os.getenv("NOVELOS_UPLOAD_PREFETCH_WORKERS", "4"))
+
+_prefetch_pool: Optional[ThreadPoolExecutor] = None
+_prefetch_pool_lock = threading.Lock()
+
+
+def _get_prefetch_pool() -> ThreadPoolExecutor:
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        with _prefetch_pool_lock:
+            if _prefetch_pool is None:
+                _prefetch_pool = ThreadPoolExecutor(max_workers=UPLOAD_PREFETCH_WORKERS, thread_name_prefix="upload-prefetch")
+    return _prefetch_pool
+
+
+def _extract_file_text(file_data: File) -> str:
+    """下载并提取单个附件，异常只影响该附件"""
+    try:
+        return FileOps.extract_text(file_data)
+    except Exception as e:
+        logger.warning(f"Failed to extract upload file {file_data.url}: {e}")
+        return f"[FileOps Error] Failed to read content: {str(e)}"
+
+
+def _prefetch_files(files: List[File]) -> List[str]:
+    """并发下载/解析附件，按输入顺序返回文本；单个附件直接在当前线程处理"""
+    if len(files) <= 1:
+        return [_extract_file_text(f) for f in files]
+    pool = _get_prefetch_pool()
+    futures: List[Future] = [pool.submit(_extract_file_text, f) for f in files]
+    return [future.result() for future in futures]
+
 
 def to_stream_input(msg: ClientMessage) -> Dict[str, Any]:
     content_parts = []
+    # 需要下载解析的附件：(content_parts 中的占位下标, 文件名, 文件)
+    pending_files: List[Tuple[int, str, File]] = []
     if msg and msg.content and msg.content.query and msg.content.query.prompt:
         for block in msg.content.query.prompt:
             if block.type == "text" and block.content and block.content.text:
@@ -82,13 +124,14 @@ def to_stream_input(msg: ClientMessage) -> Dict[str, Any]:
                         }
                     )
                 else:
-                    file_content = FileOps.extract_text(file_data)
-                    content_parts.append(
-                        {
-                            "type": "text",
-                            "text": f"file name:{file_info.file_name}, url: {file_info.url}\n\nFile Content:\n{file_content}",
-                        }
-                    )
+                    # 先占位，所有附件收集完后并发下载解析
+                    pending_files.append((len(content_parts), file_info.file_name, file_data))
+                    content_parts.append({"type": "text", "text": ""})
+
+    if pending_files:
+        file_contents = _prefetch_files([f for _, _, f in pending_files])
+        for (pos, file_name, file_data), file_content in zip(pending_files, file_contents):
+            content_parts[pos]["text"] = f"file name:{file_name}, url: {file_data.url}\n\nFile Content:\n{file_content}"
 
     return {"messages": [{"role": "user", "content": content_parts}]}
 
@@ -580,6 +623,25 @@ def iter_server_messages(
         yield end_sm
 
 
+def merge_custom_stream(items: Iterator[Any]) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+    """
+    合并 stream_mode=["messages", "custom"] 的输出：
+    messages 流原样透传；custom 流中的正文增量事件（结构化起草时由节点推送）转换为 AIMessageChunk，
+    其余 custom 事件忽略
+    """
+    for mode, data in items:
+        if mode == "messages":
+            yield data
+        elif mode == "custom" and isinstance(data, dict) and data.get("type") == ANSWER_DELTA_EVENT:
+            finish = bool(data.get("finish"))
+            chunk = AIMessageChunk(
+                content=data.get("text") or "",
+                id=data.get("id"),
+                response_metadata={"finish_reason": "stop"} if finish else {},
+            )
+            yield chunk, {"langgraph_node": data.get("node")}
+
+
 def agent_iter_server_messages(
         items: Iterator[Dict[Any, Dict[str, Any]]],
         *,
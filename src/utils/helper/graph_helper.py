@@ -217,7 +217,7 @@ class ParamExtractHelper:
             tree = ast.parse(source)
 
             for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef) and node.name == func.__name__:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == func.__name__:
                     # 查找赋值语句
                     for stmt in node.body:
                         if (isinstance(stmt, ast.Assign) and
@@ -0,0 +1,342 @@
+"""
+大模型客户端连接池
+SDK 的 LLMClient 每次调用都新建 ChatOpenAI（请求上下文写在 default_headers 里），连接无法跨调用复用。
+这里改为进程级复用：
+- 按 (接口地址, 模型, 调用参数) 缓存 ChatOpenAI 实例，所有实例共享同一个 httpx 连接池（keep-alive；安装了 h2 时启用 HTTP/2）
+- 请求上下文（ctx）与自定义请求头只作为单次请求的 extra_headers 传递，不参与实例缓存
+- 异步调用（ainvoke / astream）使用按事件循环隔离的 httpx.AsyncClient 与 ChatOpenAI 实例（异步连接不能跨事件循环使用）；
+  astream 的参数处理与模型构建委托给 SDK 的 stream，只把最终调用换成 ChatOpenAI.astream，并与 SDK 一样上报 cozeloop span
+- openai 的流式响应读到 [DONE] 即关闭，此时响应体尚未读到结尾，httpx 会直接断开连接；
+  传输层在关闭前读完剩余的少量字节，使连接可以放回连接池
+"""
+import os
+import asyncio
+import inspect
+import logging
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import httpx
+from cachetools import LRUCache
+from coze_coding_dev_sdk import LLMClient
+from coze_coding_dev_sdk.core.config import Config
+from coze_coding_dev_sdk.llm.models import LLMConfig
+from coze_coding_utils.runtime_ctx.context import default_headers
+from cozeloop.decorator import observe
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+# 连接池上限与空闲连接保活
+LLM_MAX_CONNECTIONS = int(os.getenv("NOVELOS_LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("NOVELOS_LLM_MAX_KEEPALIVE", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("NOVELOS_LLM_KEEPALIVE_EXPIRY", "60"))
+# 单次请求超时（秒），与 SDK 默认一致
+LLM_TIMEOUT = float(os.getenv("NOVELOS_LLM_TIMEOUT", str(Config.DEFAULT_TIMEOUT)))
+# 缓存的 ChatOpenAI 实例数（不同模型/温度组合各一个）
+LLM_MAX_MODELS = int(os.getenv("NOVELOS_LLM_MAX_MODELS", "64"))
+# 关闭响应时最多读取的剩余字节数，超过则放弃该连接（调用方中途取消时不会读完整个响应）
+LLM_DRAIN_MAX_BYTES = 64 * 1024
+
+# SDK stream 的原始生成器函数（去掉 observe 包装，避免 astream 内再上报一个同步 span）
+_sdk_stream = inspect.unwrap(LLMClient.stream)
+# astream 执行 SDK stream 期间设置为当前事件循环：_create_llm 据此构建异步实例并返回交接对象
+_async_loop: contextvars.ContextVar[Optional[asyncio.AbstractEventLoop]] = contextvars.ContextVar(
+    "novelos_llm_async_loop", default=None)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _DrainingStream(httpx.SyncByteStream):
+    """关闭前读完剩余响应体（不超过 LLM_DRAIN_MAX_BYTES），使 keep-alive 连接可复用"""
+
+    def __init__(self, stream: httpx.SyncByteStream):
+        self._stream = stream
+        self._chunks = None
+
+    def __iter__(self):
+        self._chunks = iter(self._stream)
+        for chunk in self._chunks:
+            yield chunk
+
+    def close(self) -> None:
+        if self._chunks is not None:
+            drained = 0
+            try:
+                for chunk in self._chunks:
+                    drained += len(chunk)
+                    if drained > LLM_DRAIN_MAX_BYTES:
+                        break
+            except httpx.HTTPError:
+                pass
+        self._stream.close()
+
+
+class _DrainingTransport(httpx.HTTPTransport):
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        response.stream = _DrainingStream(response.stream)
+        return response
+
+
+class _AsyncDrainingStream(httpx.AsyncByteStream):
+    """_DrainingStream 的异步版本"""
+
+    def __init__(self, stream: httpx.AsyncByteStream):
+        self._stream = stream
+        self._chunks = None
+
+    async def __aiter__(self):
+        self._chunks = self._stream.__aiter__()
+        async for chunk in self._chunks:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if self._chunks is not None:
+            drained = 0
+            try:
+                async for chunk in self._chunks:
+                    drained += len(chunk)
+                    if drained > LLM_DRAIN_MAX_BYTES:
+                        break
+            except httpx.HTTPError:
+                pass
+        await self._stream.aclose()
+
+
+class _AsyncDrainingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        response.stream = _AsyncDrainingStream(response.stream)
+        return response
+
+
+class LLMClientPool:
+    """进程级 ChatOpenAI 实例与 HTTP 连接池（见 get_llm_client_pool）"""
+
+    def __init__(self, max_connections: int = LLM_MAX_CONNECTIONS, max_keepalive: int = LLM_MAX_KEEPALIVE,
+                 keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY, timeout: float = LLM_TIMEOUT,
+                 max_models: int = LLM_MAX_MODELS):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = timeout
+        self.http2 = _http2_available()
+        self._config: Optional[Config] = None
+        self._http_client: Optional[httpx.Client] = None
+        self.max_models = max_models
+        self._models: LRUCache = LRUCache(maxsize=max_models)
+        # 事件循环 -> (AsyncClient, ChatOpenAI 实例缓存)；事件循环销毁后自动释放
+        self._async: "WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, LRUCache]]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {"models_created": 0, "models_reused": 0, "requests": 0}
+
+    @property
+    def config(self) -> Config:
+        """共享的 SDK 配置（读取一次环境变量）"""
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = Config()
+        return self._config
+
+    def _on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    transport = _DrainingTransport(limits=self.limits, http2=self.http2)
+                    self._http_client = httpx.Client(transport=transport, timeout=self.timeout,
+                                                     event_hooks={"request": [self._on_request]})
+        return self._http_client
+
+    def _async_slot(self, loop: asyncio.AbstractEventLoop) -> Tuple[httpx.AsyncClient, LRUCache]:
+        with self._lock:
+            slot = self._async.get(loop)
+            if slot is None:
+                transport = _AsyncDrainingTransport(limits=self.limits, http2=self.http2)
+                client = httpx.AsyncClient(transport=transport, timeout=self.timeout,
+                                           event_hooks={"request": [self._on_async_request]})
+                slot = (client, LRUCache(maxsize=self.max_models))
+                self._async[loop] = slot
+        return slot
+
+    async def _on_async_request(self, request: httpx.Request) -> None:
+        self._on_request(request)
+
+    def _model_kwargs(self, llm_config: LLMConfig, use_caching: bool, previous_response_id: Optional[str]) -> Dict[str, Any]:
+        extra_body = {}
+        if llm_config.thinking:
+            extra_body["thinking"] = {"type": llm_config.thinking}
+        if llm_config.caching:
+            extra_body["caching"] = {"type": llm_config.caching}
+        return dict(
+            model=llm_config.model,
+            streaming=llm_config.streaming,
+            extra_body=extra_body if extra_body else None,
+            temperature=llm_config.temperature,
+            frequency_penalty=llm_config.frequency_penalty,
+            top_p=llm_config.top_p,
+            max_tokens=llm_config.max_tokens,
+            max_completion_tokens=llm_config.max_completion_tokens,
+            use_responses_api=use_caching,
+            use_previous_response_id=previous_response_id is not None,
+        )
+
+    def get_model(self, base_url: str, api_key: str, llm_config: LLMConfig, use_caching: bool = False,
+                  previous_response_id: Optional[str] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> ChatOpenAI:
+        """
+        按调用参数取出（或创建）共享连接池的 ChatOpenAI 实例；
+        指定 loop 时返回绑定该事件循环异步连接池的实例（用于 ainvoke / astream）
+        """
+        kwargs = self._model_kwargs(llm_config, use_caching, previous_response_id)
+        key: Tuple = (base_url, api_key, repr(sorted(kwargs.items())))
+        if loop is None:
+            models = self._models
+            kwargs["http_client"] = self.http_client
+        else:
+            async_client, models = self._async_slot(loop)
+            kwargs["http_async_client"] = async_client
+        with self._lock:
+            model = models.get(key)
+            if model is not None:
+                self._stats["models_reused"] += 1
+                return model
+        model = ChatOpenAI(api_key=api_key, base_url=base_url, **kwargs)
+        with self._lock:
+            # 并发创建时以先写入的为准
+            model = models.setdefault(key, model)
+            self._stats["models_created"] += 1
+        return model
+
+    @staticmethod
+    def _connections(client) -> List[Any]:
+        # httpcore 连接池未公开统计接口，取不到时视为无连接
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        return list(getattr(pool, "connections", None) or [])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self._stats, "models": len(self._models), "http2": self.http2, "event_loops": len(self._async)}
+            clients = [self._http_client] + [client for client, _ in self._async.values()]
+            stats["async_models"] = sum(len(models) for _, models in self._async.values())
+        connections = [c for client in clients if client is not None for c in self._connections(client)]
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._models.clear()
+            # 异步连接随事件循环释放，这里只丢弃引用
+            self._async.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+
+class _AsyncHandoff:
+    """SDK stream 构建好模型后不直接同步调用，而是把模型与消息交给 astream 异步调用"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.messages: List[BaseMessage] = []
+
+    def stream(self, messages: List[BaseMessage]):
+        self.messages = messages
+        yield self
+
+
+class PooledLLMClient(LLMClient):
+    """接口同 LLMClient；底层 ChatOpenAI 与连接取自连接池，ctx 只作为单次请求头"""
+
+    def __init__(self, ctx=None, pool: Optional[LLMClientPool] = None,
+                 custom_headers: Optional[Dict[str, str]] = None, verbose: bool = False,
+                 tags: Optional[List[str]] = None):
+        self.pool = pool or get_llm_client_pool()
+        # 附加到每次模型调用的 tags（如 nostream：不把 token 推送到 LangGraph 的 messages 流）
+        self.tags = list(tags or [])
+        super().__init__(config=self.pool.config, ctx=ctx, custom_headers=custom_headers, verbose=verbose)
+
+    def _create_llm(self, llm_config: LLMConfig, use_caching: bool = False, previous_response_id: Optional[str] = None,
+                    extra_headers: Optional[Dict[str, str]] = None):
+        headers = {}
+        if self.ctx is not None:
+            headers.update(default_headers(self.ctx))
+        if self.custom_headers:
+            headers.update(self.custom_headers)
+        headers.update(self.config.get_headers(extra_headers))
+
+        # 与 SDK 保持一致的 token 上限处理
+        if llm_config.max_tokens == 0:
+            llm_config.max_tokens = 32768
+        if llm_config.max_completion_tokens == 0:
+            llm_config.max_completion_tokens = 32768
+        if llm_config.max_tokens and llm_config.max_completion_tokens:
+            llm_config.max_tokens = None
+
+        loop = _async_loop.get()
+        model = self.pool.get_model(self.base_url, self.api_key, llm_config, use_caching, previous_response_id, loop)
+        llm = model.bind(extra_headers=headers)
+        if self.tags:
+            llm = llm.with_config(tags=self.tags)
+        return _AsyncHandoff(llm) if loop is not None else llm
+
+    @observe(name="llm_stream")
+    async def astream(self, messages: List[BaseMessage], **params) -> AsyncIterator[AIMessageChunk]:
+        """stream 的异步版本（参数与默认值同 LLMClient.stream）"""
+        token = _async_loop.set(asyncio.get_running_loop())
+        try:
+            sdk_gen = _sdk_stream(self, messages, **params)
+            handoff = next(sdk_gen)
+            sdk_gen.close()
+        finally:
+            _async_loop.reset(token)
+        async for chunk in handoff.llm.astream(handoff.messages):
+            yield chunk
+
+    @observe(name="llm_invoke")
+    async def ainvoke(self, messages: List[BaseMessage], **params) -> AIMessage:
+        """invoke 的异步版本：流式调用后组装完整响应"""
+        full_content = ""
+        response_metadata = {}
+        async for chunk in self.astream(messages=messages, **params):
+            if chunk.content:
+                full_content += chunk.content
+            if chunk.response_metadata:
+                response_metadata.update(chunk.response_metadata)
+        return AIMessage(content=full_content, response_metadata=response_metadata)
+
+
+_pool: Optional[LLMClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_llm_client_pool() -> LLMClientPool:
+    """获取进程级大模型客户端连接池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMClientPool()
+    return _pool
+
+
+__all__ = [
+    "LLMClientPool",
+    "PooledLLMClient",
+    "get_llm_client_pool",
+]
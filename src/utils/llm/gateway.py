@@ -0,0 +1,397 @@
+"""
+大模型调用网关
+所有节点通过网关调用大模型（get_llm_gateway().bind(ctx, node=...) 得到与 LLMClient 同接口的客户端），
+网关对按节点开启缓存的调用做响应缓存：
+- 缓存键为 (模型, 消息内容哈希, 温度, 最大 token 数等全部调用参数) 的 sha256；未显式传入的参数按 SDK 默认值补全，
+  默认模型升级或换模型后不会命中旧模型的缓存
+- 进程内 TTL + LRU 缓存；可选持久化到磁盘或数据库（llm_response_cache 表），进程重启后仍可命中
+- 同一请求并发到达时只调用一次大模型，其余调用等待并复用结果（重试/重复请求不再计费）
+- 提供 invoke / ainvoke 两套接口；异步调用的持久化层读写放到线程中执行，不阻塞事件循环
+- 默认给模型调用打上 nostream 标记，token 不进入 LangGraph 的 messages 流（JSON 等中间结果不会推送给客户端）；
+  正文类调用以 bind(..., stream=True) 开启逐 token 推送
+- 默认只缓存温度为 0 的确定性调用；温度大于 0 的调用是采样结果，缓存会把一次采样固定下来，每次都应重新生成
+"""
+import os
+import json
+import asyncio
+import time
+import uuid
+import hashlib
+import inspect
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from cachetools import TTLCache
+from coze_coding_dev_sdk import LLMClient
+from langchain_core.messages import AIMessage, BaseMessage, BaseMessageChunk
+from langgraph.constants import TAG_NOSTREAM
+
+from utils.llm.client_pool import PooledLLMClient
+
+logger = logging.getLogger(__name__)
+
+# 缓存有效期（秒），默认 1 小时
+LLM_CACHE_TTL = int(os.getenv("NOVELOS_LLM_CACHE_TTL", "3600"))
+# 进程内缓存条数上限（LRU 淘汰）；设为 0 时关闭缓存
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("NOVELOS_LLM_CACHE_MAX_ENTRIES", "1024"))
+# 持久化层：memory（仅进程内）/ disk / db
+LLM_CACHE_BACKEND = os.getenv("NOVELOS_LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_DIR = os.getenv("NOVELOS_LLM_CACHE_DIR", "/tmp/novelos_llm_cache")
+# 开启缓存的节点（逗号分隔，节点函数名去掉 _node 后缀）
+LLM_CACHE_NODES = frozenset(n.strip() for n in os.getenv(
+    "NOVELOS_LLM_CACHE_NODES",
+    "intent_router,select_revise_mode,consistency_check_entry,consistency_check,"
+    "consistency_check_draft,consistency_check_revise,query_setting"
+).split(",") if n.strip())
+# 温度高于该值的调用不缓存（即使节点已开启）；默认只缓存温度为 0 的调用
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("NOVELOS_LLM_CACHE_MAX_TEMPERATURE", "0"))
+
+# LLMClient.invoke 的参数默认值（模型、温度、最大 token 数等）
+_SDK_DEFAULTS: Dict[str, Any] = {
+    name: p.default for name, p in inspect.signature(inspect.unwrap(LLMClient.invoke)).parameters.items()
+    if p.default is not inspect.Parameter.empty and name != "extra_headers"
+}
+
+
+def resolve_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """按 SDK 默认值补全调用参数，得到实际生效的参数"""
+    return {**_SDK_DEFAULTS, **params}
+
+
+def request_key(messages: List[BaseMessage], params: Dict[str, Any]) -> str:
+    """按消息内容与全部生效的调用参数（含默认模型）计算缓存键"""
+    payload = {
+        "messages": [[m.type, m.content] for m in messages],
+        "params": {k: v for k, v in sorted(resolve_params(params).items()) if k != "extra_headers"},
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _DiskBackend:
+    """每个缓存项一个 JSON 文件（{key}.json，含过期时间）"""
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            _remove_quietly(path)
+            return None
+        return entry.get("response")
+
+    def set(self, key: str, response: dict, node: Optional[str], ttl: int) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"node": node, "expires_at": time.time() + ttl, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class _DBBackend:
+    """llm_response_cache 表"""
+
+    def get(self, key: str) -> Optional[dict]:
+        from storage.database.db import get_session
+        from storage.database.novel_models import LLMResponseCache
+        db = get_session()
+        try:
+            row = db.query(LLMResponseCache).filter(LLMResponseCache.cache_key == key).first()
+            if row is None or row.expires_at <= datetime.now():
+                return None
+            return row.response
+        finally:
+            db.close()
+
+    def set(self, key: str, response: dict, node: Optional[str], ttl: int) -> None:
+        from storage.database.db import get_session
+        from storage.database.novel_models import LLMResponseCache
+        db = get_session()
+        try:
+            row = db.query(LLMResponseCache).filter(LLMResponseCache.cache_key == key).first()
+            if row is None:
+                row = LLMResponseCache(cache_key=key, created_at=datetime.now())
+            row.node = node
+            row.response = response
+            row.expires_at = datetime.now() + timedelta(seconds=ttl)
+            db.add(row)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def _make_backend(name: str):
+    if name == "disk":
+        return _DiskBackend()
+    if name == "db":
+        return _DBBackend()
+    return None
+
+
+class LLMGateway:
+    """大模型调用网关（进程级单例，见 get_llm_gateway）"""
+
+    def __init__(self, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 backend: str = LLM_CACHE_BACKEND, cache_nodes=LLM_CACHE_NODES,
+                 max_temperature: float = LLM_CACHE_MAX_TEMPERATURE):
+        self.ttl = ttl
+        self.cache_nodes = frozenset(cache_nodes)
+        self.max_temperature = max_temperature
+        self._memory: Optional[TTLCache] = TTLCache(maxsize=max_entries, ttl=ttl) if max_entries > 0 else None
+        self._backend = _make_backend(backend) if self._memory is not None else None
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._in_use: Dict[str, int] = {}
+        # 异步调用的进行中请求：(事件循环 id, 缓存键) -> Future
+        self._inflight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._stats = {"calls": 0, "hits": 0, "misses": 0, "errors": 0}
+
+    def bind(self, ctx=None, node: Optional[str] = None, cache: Optional[bool] = None,
+             stream: bool = False) -> "BoundLLM":
+        """
+        返回绑定了请求上下文与节点名的客户端（接口同 LLMClient.invoke / stream，另有 ainvoke / astream）；
+        cache 为 None 时按节点配置决定是否缓存；stream=True 时生成的 token 实时推送到 LangGraph 的 messages 流
+        """
+        return BoundLLM(self, ctx, node, cache, stream)
+
+    def _client(self, ctx, stream: bool = False) -> PooledLLMClient:
+        # 客户端本身很轻，连接与 ChatOpenAI 实例由连接池复用
+        return PooledLLMClient(ctx=ctx, tags=None if stream else [TAG_NOSTREAM])
+
+    def should_cache(self, node: Optional[str], params: Dict[str, Any], cache: Optional[bool] = None) -> bool:
+        if self._memory is None or cache is False:
+            return False
+        if cache is None and node not in self.cache_nodes:
+            return False
+        temperature = resolve_params(params).get("temperature")
+        return temperature is not None and temperature <= self.max_temperature
+
+    def invoke(self, messages: List[BaseMessage], ctx=None, node: Optional[str] = None,
+               cache: Optional[bool] = None, stream: bool = False, **params) -> AIMessage:
+        with self._lock:
+            self._stats["calls"] += 1
+        if not self.should_cache(node, params, cache):
+            return self._client(ctx, stream).invoke(messages=messages, **params)
+
+        key = request_key(messages, params)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            # 同一请求串行化：第一个调用写入缓存后，等待中的调用直接命中
+            with key_lock:
+                cached = self._lookup(key)
+                if cached is not None:
+                    return self._hit(key, node, cached)
+                with self._lock:
+                    self._stats["misses"] += 1
+                response = self._client(ctx, stream).invoke(messages=messages, **params)
+                entry = self._remember(key, response)
+                if entry is not None:
+                    self._persist(key, node, entry)
+                return response
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+                    self._key_locks.pop(key, None)
+
+    async def ainvoke(self, messages: List[BaseMessage], ctx=None, node: Optional[str] = None,
+                      cache: Optional[bool] = None, stream: bool = False, **params) -> AIMessage:
+        """invoke 的异步版本"""
+        with self._lock:
+            self._stats["calls"] += 1
+        if not self.should_cache(node, params, cache):
+            return await self._client(ctx, stream).ainvoke(messages=messages, **params)
+
+        key = request_key(messages, params)
+        cached = self._memory_get(key)
+        if cached is None and self._backend is not None:
+            cached = await asyncio.to_thread(self._backend_get, key)
+        if cached is not None:
+            return self._hit(key, node, cached)
+
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            pending = self._inflight.get(flight_key)
+        if pending is not None:
+            # 同一请求正在进行：等待其结果；发起方被取消时自行调用
+            try:
+                response = await asyncio.shield(pending)
+                with self._lock:
+                    self._stats["hits"] += 1
+                return AIMessage(content=response.content, response_metadata=dict(response.response_metadata or {}))
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception:
+                pass
+            return await self._client(ctx, stream).ainvoke(messages=messages, **params)
+
+        future = loop.create_future()
+        with self._lock:
+            self._inflight[flight_key] = future
+            self._stats["misses"] += 1
+        try:
+            response = await self._client(ctx, stream).ainvoke(messages=messages, **params)
+            future.set_result(response)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有等待方时避免 "exception was never retrieved" 告警
+                future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(flight_key, None)
+        entry = self._remember(key, response)
+        if entry is not None and self._backend is not None:
+            await asyncio.to_thread(self._persist, key, node, entry)
+        return response
+
+    def stream(self, messages: List[BaseMessage], ctx=None, node: Optional[str] = None,
+               stream: bool = False, **params) -> Iterator[BaseMessageChunk]:
+        """流式调用不经过缓存"""
+        with self._lock:
+            self._stats["calls"] += 1
+        return self._client(ctx, stream).stream(messages=messages, **params)
+
+    def astream(self, messages: List[BaseMessage], ctx=None, node: Optional[str] = None,
+                stream: bool = False, **params) -> AsyncIterator[BaseMessageChunk]:
+        """stream 的异步版本，不经过缓存"""
+        with self._lock:
+            self._stats["calls"] += 1
+        return self._client(ctx, stream).astream(messages=messages, **params)
+
+    def _hit(self, key: str, node: Optional[str], cached: dict) -> AIMessage:
+        with self._lock:
+            self._stats["hits"] += 1
+        logger.debug(f"LLM cache hit: node={node} key={key[:12]}")
+        return AIMessage(content=cached["content"], response_metadata=cached.get("response_metadata", {}))
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._memory.get(key)
+
+    def _backend_get(self, key: str) -> Optional[dict]:
+        try:
+            cached = self._backend.get(key)
+        except Exception as e:
+            # 持久化层故障不影响调用，按未命中处理
+            logger.warning(f"LLM cache backend read failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+        if cached is not None:
+            with self._lock:
+                self._memory[key] = cached
+        return cached
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        cached = self._memory_get(key)
+        if cached is not None or self._backend is None:
+            return cached
+        return self._backend_get(key)
+
+    def _remember(self, key: str, response: AIMessage) -> Optional[dict]:
+        """写入进程内缓存，返回缓存项；空响应多为上游异常，不缓存"""
+        if not response.content:
+            return None
+        entry = {"content": response.content, "response_metadata": dict(response.response_metadata or {})}
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def _persist(self, key: str, node: Optional[str], entry: dict) -> None:
+        if self._backend is None:
+            return
+        try:
+            self._backend.set(key, entry, node, self.ttl)
+        except Exception as e:
+            logger.warning(f"LLM cache backend write failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def clear(self) -> None:
+        """清空进程内缓存（持久化层不清理，由过期时间失效）"""
+        if self._memory is not None:
+            with self._lock:
+                self._memory.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._memory) if self._memory is not None else 0}
+
+
+class BoundLLM:
+    """绑定请求上下文与节点名的网关客户端，接口与 LLMClient 一致"""
+
+    def __init__(self, gateway: LLMGateway, ctx, node: Optional[str], cache: Optional[bool], stream: bool = False):
+        self.gateway = gateway
+        self.ctx = ctx
+        self.node = node
+        self.cache = cache
+        self.stream_tokens = stream
+
+    def invoke(self, messages: List[BaseMessage], **params) -> AIMessage:
+        return self.gateway.invoke(messages, ctx=self.ctx, node=self.node, cache=self.cache,
+                                   stream=self.stream_tokens, **params)
+
+    def stream(self, messages: List[BaseMessage], **params) -> Iterator[BaseMessageChunk]:
+        return self.gateway.stream(messages, ctx=self.ctx, node=self.node, stream=self.stream_tokens, **params)
+
+    async def ainvoke(self, messages: List[BaseMessage], **params) -> AIMessage:
+        return await self.gateway.ainvoke(messages, ctx=self.ctx, node=self.node, cache=self.cache,
+                                          stream=self.stream_tokens, **params)
+
+    def astream(self, messages: List[BaseMessage], **params) -> AsyncIterator[BaseMessageChunk]:
+        return self.gateway.astream(messages, ctx=self.ctx, node=self.node, stream=self.stream_tokens, **params)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """获取进程级大模型网关实例"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+__all__ = [
+    "LLMGateway",
+    "BoundLLM",
+    "resolve_params",
+    "request_key",
+    "get_llm_gateway",
+]
@@ -0,0 +1,141 @@
+"""
+结构化输出的流式解析
+大模型按 JSON 返回结构化结果（正文 + 摘要 + 状态增量）时，正文位于某个字符串字段中。
+这里在 token 到达时增量解码该字段，使正文能在整个 JSON 完成之前推送给客户端：
+- 转义序列（含 \\uXXXX 与代理对）跨 chunk 截断时暂存，补齐后再解码
+- 兼容模型在字符串内直接输出换行等控制字符（按 strict=False 解码）
+正文增量通过 LangGraph 的 custom 流（runtime.stream_writer）以 answer_delta 事件推送，
+由 agent_helper.merge_custom_stream 转换为与 messages 流一致的消息块
+"""
+import re
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# custom 流中的正文增量事件类型
+ANSWER_DELTA_EVENT = "answer_delta"
+
+
+class JsonStringFieldStream:
+    """从流式到达的 JSON 文本中增量提取字符串字段的值（取首次出现的该字段，调用方应让该字段排在最前）"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self._key_re = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._parts = []
+        self._text = ""
+        self._start: Optional[int] = None
+        self._pos = 0
+        self.done = False
+        self._value_parts = []
+
+    @property
+    def text(self) -> str:
+        """目前收到的完整原始文本"""
+        return self._text
+
+    @property
+    def value(self) -> str:
+        """目前解码出的字段值"""
+        return "".join(self._value_parts)
+
+    @property
+    def found(self) -> bool:
+        return self._start is not None
+
+    def feed(self, chunk: str) -> str:
+        """输入一段原始文本，返回本次新解码出的字段内容（可能为空）"""
+        self._text += chunk
+        if self.done:
+            return ""
+        if self._start is None:
+            m = self._key_re.search(self._text)
+            if m is None:
+                return ""
+            self._start = self._pos = m.end()
+        delta = self._consume()
+        if delta:
+            self._value_parts.append(delta)
+        return delta
+
+    def _consume(self) -> str:
+        raw = self._text
+        i = self._pos
+        n = len(raw)
+        safe = i
+        closed = False
+        while i < n:
+            c = raw[i]
+            if c == '\\':
+                if i + 1 >= n:
+                    break
+                if raw[i + 1] == 'u':
+                    if i + 6 > n:
+                        break
+                    try:
+                        code = int(raw[i + 2:i + 6], 16)
+                    except ValueError:
+                        code = 0
+                    # 高代理项需与随后的低代理项一起解码
+                    if 0xD800 <= code <= 0xDBFF and raw[i + 6:i + 8] in ('\\u', '\\', ''):
+                        if i + 12 > n:
+                            break
+                        i += 12
+                    else:
+                        i += 6
+                else:
+                    i += 2
+                safe = i
+            elif c == '"':
+                closed = True
+                break
+            else:
+                i += 1
+                safe = i
+        segment = raw[self._pos:safe]
+        self._pos = safe
+        if closed:
+            self.done = True
+            self._pos = i + 1
+        if not segment:
+            return ""
+        try:
+            return json.loads(f'"{segment}"', strict=False)
+        except json.JSONDecodeError:
+            # 非法转义：按原文输出，不中断推送
+            return segment
+
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """从模型输出中取出 JSON 对象（首个 { 到最后一个 }），解析失败返回 None"""
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end], strict=False)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def answer_delta_emitter(writer: Optional[Callable[[Any], None]], node: str, msg_id: str) -> Callable[..., None]:
+    """返回向 custom 流推送正文增量的函数；writer 为空（节点不在图中运行）时为空操作"""
+    def emit(text: str, finish: bool = False) -> None:
+        if writer is None or (not text and not finish):
+            return
+        try:
+            writer({"type": ANSWER_DELTA_EVENT, "node": node, "id": msg_id, "text": text, "finish": finish})
+        except Exception as e:
+            logger.debug(f"Failed to emit answer delta: {e}")
+    return emit
+
+
+__all__ = [
+    "ANSWER_DELTA_EVENT",
+    "JsonStringFieldStream",
+    "parse_json_object",
+    "answer_delta_emitter",
+]
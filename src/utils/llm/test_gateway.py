@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试脚本：大模型网关的缓存键与缓存策略
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils.llm.gateway import LLMGateway, request_key
+
+REPO_ROOT = Path(__file__).parent.parent.parent.parent
+
+
+class _FakeClient:
+    """记录调用次数，返回固定的意图识别结果"""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages, **params):
+        self.calls.append(params)
+        return AIMessage(content='{"intent": "write_next", "confidence": 0.9, "parameters": {}}')
+
+    async def ainvoke(self, messages, **params):
+        return self.invoke(messages, **params)
+
+
+def _gateway(client: _FakeClient) -> LLMGateway:
+    gateway = LLMGateway(backend="memory")
+    gateway._client = lambda ctx, stream=False: client
+    return gateway
+
+
+def test_request_key_resolves_default_model():
+    messages = [HumanMessage(content="写下一章")]
+    assert request_key(messages, {}) == request_key(messages, {"model": "doubao-seed-1-6-251015"})
+    assert request_key(messages, {}) != request_key(messages, {"model": "doubao-seed-1-8-251228"})
+    assert request_key(messages, {"temperature": 0}) != request_key(messages, {"temperature": 0.5})
+
+
+def test_sampled_calls_are_not_cached():
+    client = _FakeClient()
+    llm = _gateway(client).bind(None, node="consistency_check")
+    messages = [HumanMessage(content="检查")]
+    for _ in range(2):
+        llm.invoke(messages, temperature=0.7)
+    llm.invoke(messages)  # SDK 默认温度 1.0
+    assert len(client.calls) == 3
+    # 未开启缓存的节点即使温度为 0 也不缓存
+    other = _gateway(client).bind(None, node="draft_scene")
+    other.invoke(messages, temperature=0)
+    other.invoke(messages, temperature=0)
+    assert len(client.calls) == 5
+
+
+def test_repeated_intent_router_call_hits_cache(monkeypatch):
+    import graphs.node as node
+
+    client = _FakeClient()
+    gateway = _gateway(client)
+    monkeypatch.setattr(node, "get_llm_gateway", lambda: gateway)
+    monkeypatch.setenv("COZE_WORKSPACE_PATH", str(REPO_ROOT))
+    config = {"metadata": {"llm_cfg": "config/intent_router_llm_cfg.json"}}
+
+    first = asyncio.run(node._llm_route_intent("继续写下一章", config, None))
+    second = asyncio.run(node._llm_route_intent("继续写下一章", config, None))
+    assert first == second == ("write_next", 0.9, {})
+    assert len(client.calls) == 1
+    assert client.calls[0]["temperature"] == 0
+    stats = gateway.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
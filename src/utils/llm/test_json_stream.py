@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试脚本：结构化输出的流式解析 JsonStringFieldStream
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.llm.json_stream import JsonStringFieldStream, parse_json_object
+
+CONTENT = "他说：“走吧。”\n\t她点头\\笑了😀，é。"
+
+
+def _feed_all(stream: JsonStringFieldStream, raw: str, size: int) -> str:
+    return "".join(stream.feed(raw[i:i + size]) for i in range(0, len(raw), size))
+
+
+def test_every_chunk_size_decodes_exactly():
+    for ensure_ascii in (False, True):
+        raw = json.dumps({"content": CONTENT, "summary": "摘要"}, ensure_ascii=ensure_ascii)
+        for size in range(1, 16):
+            stream = JsonStringFieldStream("content")
+            assert _feed_all(stream, raw, size) == CONTENT, (ensure_ascii, size)
+            assert stream.value == CONTENT
+            assert stream.done and stream.text == raw
+
+
+def test_field_not_first_and_prefix_text():
+    raw = '好的，结果如下：\n{"title": "第一章", "content": "正文\\"引号\\"", "summary": "x"}'
+    stream = JsonStringFieldStream("content")
+    assert _feed_all(stream, raw, 3) == '正文"引号"'
+    assert parse_json_object(stream.text)["summary"] == "x"
+
+
+def test_not_found_and_incomplete():
+    stream = JsonStringFieldStream("content")
+    assert stream.feed('{"summary": "没有正文"}') == ""
+    assert not stream.found and stream.value == ""
+
+    stream = JsonStringFieldStream("content")
+    stream.feed('{"content": "未完')
+    assert stream.found and not stream.done
+    assert stream.value == "未完"
+
+
+def test_raw_control_characters_and_bad_escape():
+    stream = JsonStringFieldStream("content")
+    assert stream.feed('{"content": "第一行\n第二行\\q"}') == "第一行\n第二行\\q"
+    assert stream.done
+
+
+def test_parse_json_object():
+    assert parse_json_object('前缀 {"a": 1} 后缀') == {"a": 1}
+    assert parse_json_object('{"a": "换行\n"}') == {"a": "换行\n"}
+    assert parse_json_object("[1, 2]") is None
+    assert parse_json_object("{broken") is None
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,287 @@
+"""
+NovelOS 正文差异引擎
+面向中文小说正文的版本 diff：
+- 以分句/分句读（。！？；，、：及换行）为最小单位，比逐字 diff 可读，比逐段 diff 精确
+- Myers O(ND) 算法 + 中间蛇分治（linear space），长章节内存占用与章节长度线性相关
+- 输出带字符偏移的变更块与统计信息，持久化为 vN.diff.json，供审阅、复检与同步复用
+"""
+import os
+import re
+import json
+import logging
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from utils.text.paragraph import build_paragraph_index
+
+logger = logging.getLogger(__name__)
+
+# 分句：以句读/换行结尾，后随的右引号、右括号并入同一单元
+_CLAUSE_RE = re.compile(r"[^。！？!?；;，,、：:…\n]*(?:[。！？!?；;，,、：:…]+|\n+)[”’」』）)】]*|[^。！？!?；;，,、：:…\n]+")
+# 变更摘要中每段文字的最大展示长度
+SUMMARY_SNIPPET_LEN = 30
+
+
+class DiffHunk(BaseModel):
+    """变更块"""
+    op: str = Field(..., description="操作类型：insert/delete/replace")
+    old_start: int = Field(..., description="旧版本起始字符偏移")
+    old_end: int = Field(..., description="旧版本结束字符偏移（不含）")
+    new_start: int = Field(..., description="新版本起始字符偏移")
+    new_end: int = Field(..., description="新版本结束字符偏移（不含）")
+    old_text: str = Field(default="", description="旧文本")
+    new_text: str = Field(default="", description="新文本")
+
+
+class TextDiff(BaseModel):
+    """两个版本之间的差异"""
+    base_version: Optional[int] = Field(default=None, description="旧版本号")
+    version: Optional[int] = Field(default=None, description="新版本号")
+    hunks: List[DiffHunk] = Field(default=[], description="变更块列表（按位置排序）")
+    inserted_chars: int = Field(default=0, description="新增字符数")
+    deleted_chars: int = Field(default=0, description="删除字符数")
+    changed_para_ids: List[str] = Field(default=[], description="新版本中发生变化的段落ID")
+
+
+def tokenize(text: str) -> List[str]:
+    """切分为分句单元，拼接后与原文完全一致"""
+    return _CLAUSE_RE.findall(text)
+
+
+def _middle_snake(a: Sequence[int], b: Sequence[int], a0: int, a1: int, b0: int, b1: int) -> Tuple[int, int, int, int]:
+    """
+    Myers 中间蛇：同时从两端搜索，返回最短编辑路径中间的一段对角线 (x, y, u, v)（绝对坐标）。
+    只保存两条 V 数组，空间 O(N+M)
+    """
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    off = max_d + 1
+    vf = [0] * (2 * max_d + 3)
+    vb = [0] * (2 * max_d + 3)
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            xs, ys = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + vb[off + delta - k] >= n:
+                return a0 + xs, b0 + ys, a0 + x, b0 + y
+        for k in range(-d, d + 1, 2):
+            # 反向搜索在倒序坐标系中进行，反向对角线 k 对应正向对角线 delta - k
+            if k == -d or (k != d and vb[off + k - 1] < vb[off + k + 1]):
+                x = vb[off + k + 1]
+            else:
+                x = vb[off + k - 1] + 1
+            y = x - k
+            xs, ys = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + k] = x
+            if not odd and -d <= delta - k <= d and x + vf[off + delta - k] >= n:
+                return a1 - x, b1 - y, a1 - xs, b1 - ys
+    # 理论上不可达：d = max_d 时两端路径必然相遇
+    return a0, b0, a0, b0
+
+
+def _matching_blocks(a: Sequence[int], b: Sequence[int]) -> List[Tuple[int, int, int]]:
+    """返回公共子序列的匹配块 (i, j, size)，按位置排序"""
+    blocks: List[Tuple[int, int, int]] = []
+    # 显式栈代替递归，避免超长章节触发递归深度限制
+    stack: List[Tuple[int, int, int, int]] = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        p = 0
+        while a0 + p < a1 and b0 + p < b1 and a[a0 + p] == b[b0 + p]:
+            p += 1
+        if p:
+            blocks.append((a0, b0, p))
+            a0 += p
+            b0 += p
+        s = 0
+        while a1 - s > a0 and b1 - s > b0 and a[a1 - s - 1] == b[b1 - s - 1]:
+            s += 1
+        if s:
+            blocks.append((a1 - s, b1 - s, s))
+            a1 -= s
+            b1 -= s
+        if a0 == a1 or b0 == b1:
+            continue
+        x, y, u, v = _middle_snake(a, b, a0, a1, b0, b1)
+        if u > x:
+            blocks.append((x, y, u - x))
+        if (x == a1 and y == b1) or (u == a0 and v == b0):
+            # 中间蛇未能拆分出更小的子问题，剩余部分整体视为替换
+            continue
+        stack.append((u, a1, v, b1))
+        stack.append((a0, x, b0, y))
+    blocks.sort()
+    return blocks
+
+
+def diff_tokens(old_tokens: Sequence[str], new_tokens: Sequence[str]) -> List[Tuple[str, int, int, int, int]]:
+    """对两个单元序列做 diff，返回 difflib 风格的 opcodes：(tag, i1, i2, j1, j2)"""
+    ids: Dict[str, int] = {}
+    a_all = [ids.setdefault(t, len(ids)) for t in old_tokens]
+    b_all = [ids.setdefault(t, len(ids)) for t in new_tokens]
+    # 只在一侧出现的单元不可能匹配，先剔除再 diff（整段重写时可把 O(ND) 降到接近 O(N)）
+    a_set, b_set = set(a_all), set(b_all)
+    a_map = [i for i, t in enumerate(a_all) if t in b_set]
+    b_map = [j for j, t in enumerate(b_all) if t in a_set]
+    a = [a_all[i] for i in a_map]
+    b = [b_all[j] for j in b_map]
+
+    # 过滤后的匹配块映射回原序列，原序列中不连续的部分拆成多个块
+    blocks: List[Tuple[int, int, int]] = []
+    for fi, fj, size in _matching_blocks(a, b):
+        for k in range(size):
+            i, j = a_map[fi + k], b_map[fj + k]
+            if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+                blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + 1)
+            else:
+                blocks.append((i, j, 1))
+
+    opcodes = []
+    i = j = 0
+    for bi, bj, size in blocks + [(len(a_all), len(b_all), 0)]:
+        if i < bi and j < bj:
+            opcodes.append(("replace", i, bi, j, bj))
+        elif i < bi:
+            opcodes.append(("delete", i, bi, j, bj))
+        elif j < bj:
+            opcodes.append(("insert", i, bi, j, bj))
+        if size:
+            opcodes.append(("equal", bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return opcodes
+
+
+def _offsets(tokens: Sequence[str]) -> List[int]:
+    pos = [0]
+    for t in tokens:
+        pos.append(pos[-1] + len(t))
+    return pos
+
+
+def diff_texts(old: str, new: str, base_version: Optional[int] = None, version: Optional[int] = None) -> TextDiff:
+    """计算两个版本正文的差异"""
+    old_tokens = tokenize(old)
+    new_tokens = tokenize(new)
+    old_pos = _offsets(old_tokens)
+    new_pos = _offsets(new_tokens)
+
+    hunks: List[DiffHunk] = []
+    inserted = deleted = 0
+    for tag, i1, i2, j1, j2 in diff_tokens(old_tokens, new_tokens):
+        if tag == "equal":
+            continue
+        old_text = old[old_pos[i1]:old_pos[i2]]
+        new_text = new[new_pos[j1]:new_pos[j2]]
+        deleted += len(old_text)
+        inserted += len(new_text)
+        hunks.append(DiffHunk(
+            op=tag,
+            old_start=old_pos[i1],
+            old_end=old_pos[i2],
+            new_start=new_pos[j1],
+            new_end=new_pos[j2],
+            old_text=old_text,
+            new_text=new_text
+        ))
+
+    changed: List[str] = []
+    if hunks:
+        index = build_paragraph_index(new)
+        ends = [p.char_end for p in index.paragraphs]
+        for h in hunks:
+            # 变更块覆盖的所有新版本段落（跨段的插入/替换逐段记录）
+            anchors = []
+            i = bisect_right(ends, h.new_start)
+            while i < len(index.paragraphs) and index.paragraphs[i].char_start < h.new_end:
+                anchors.append(index.paragraphs[i])
+                i += 1
+            if not anchors:
+                # 纯删除落在新版本的插入点上，取其所在（或紧邻的前一个）段落
+                anchor = index.at_offset(h.new_start) or (index.at_offset(h.new_start - 1) if h.new_start else None)
+                anchors = [anchor] if anchor is not None else []
+            for anchor in anchors:
+                if anchor.para_id not in changed:
+                    changed.append(anchor.para_id)
+
+    return TextDiff(
+        base_version=base_version,
+        version=version,
+        hunks=hunks,
+        inserted_chars=inserted,
+        deleted_chars=deleted,
+        changed_para_ids=changed
+    )
+
+
+def _clip(text: str) -> str:
+    text = text.replace("\n", "⏎")
+    return text if len(text) <= SUMMARY_SNIPPET_LEN else text[:SUMMARY_SNIPPET_LEN] + "…"
+
+
+def summarize_diff(diff: TextDiff, max_hunks: int = 5) -> str:
+    """生成人类可读的差异摘要"""
+    if not diff.hunks:
+        return "无变化"
+    lines = [f"共 {len(diff.hunks)} 处修改，新增 {diff.inserted_chars} 字，删除 {diff.deleted_chars} 字"]
+    for h in diff.hunks[:max_hunks]:
+        if h.op == "insert":
+            lines.append(f"+ 「{_clip(h.new_text)}」")
+        elif h.op == "delete":
+            lines.append(f"- 「{_clip(h.old_text)}」")
+        else:
+            lines.append(f"~ 「{_clip(h.old_text)}」→「{_clip(h.new_text)}」")
+    if len(diff.hunks) > max_hunks:
+        lines.append(f"……其余 {len(diff.hunks) - max_hunks} 处省略")
+    return "\n".join(lines)
+
+
+def diff_path_for(file_path: str) -> str:
+    """正文路径 -> 差异文件路径（v3.md -> v3.diff.json）"""
+    return f"{os.path.splitext(file_path)[0]}.diff.json"
+
+
+def save_diff(asset_store, file_path: str, diff: TextDiff) -> str:
+    """持久化差异，返回差异文件路径"""
+    path = diff_path_for(file_path)
+    asset_store.write_text(path, diff.model_dump_json())
+    return path
+
+
+def load_diff(asset_store, file_path: str) -> Optional[TextDiff]:
+    """读取版本对应的差异文件，不存在时返回 None"""
+    try:
+        return TextDiff(**json.loads(asset_store.read_text(diff_path_for(file_path))))
+    except FileNotFoundError:
+        return None
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid diff file for {file_path}: {e}")
+        return None
+
+
+__all__ = [
+    "DiffHunk",
+    "TextDiff",
+    "tokenize",
+    "diff_tokens",
+    "diff_texts",
+    "summarize_diff",
+    "diff_path_for",
+    "save_diff",
+    "load_diff",
+]
@@ -0,0 +1,318 @@
+"""
+NovelOS 本地意图分类器
+在调用大模型识别意图之前先做一次本地判断，“导出全文”“写下一个场景”这类高频短指令无需再付一次 LLM 往返：
+- 否定/驳回语气（“不要导出”“先别导出”“驳回P2”）不做本地判定，直接交给大模型
+- 规则：短指令按分句匹配关键词/正则，恰好命中一种意图时直接判定；多分句输入只有部分分句命中时视为含义不明确
+- 模型：随项目发布的字符 n-gram 朴素贝叶斯模型（config/intent_ngram_model.json），由 config/intent_samples.json 训练
+- 置信度低于阈值、命中多种意图或判为 unknown 时交给大模型
+按路径（rule/model/llm）统计请求数与耗时；本地判定的请求按比例抽样同时调用大模型，以大模型结果为准统计本地判定的准确率
+
+重新训练模型：
+    python src/utils/text/intent_classifier.py config/intent_samples.json config/intent_ngram_model.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import random
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from utils.text.numerals import cn_to_int
+
+logger = logging.getLogger(__name__)
+
+# 是否启用本地分类（设为 0 时所有请求都走大模型）
+INTENT_LOCAL_ENABLED = os.getenv("NOVELOS_INTENT_LOCAL", "1") != "0"
+# 模型文件（相对 COZE_WORKSPACE_PATH）
+INTENT_MODEL_FILE = os.getenv("NOVELOS_INTENT_MODEL", "config/intent_ngram_model.json")
+# 本地判定的置信度阈值
+INTENT_LOCAL_THRESHOLD = float(os.getenv("NOVELOS_INTENT_LOCAL_THRESHOLD", "0.9"))
+# 本地判定后仍抽样调用大模型核对的比例
+INTENT_SHADOW_RATE = float(os.getenv("NOVELOS_INTENT_SHADOW_RATE", "0.05"))
+# 规则只作用于短指令，长句交给模型或大模型
+RULE_MAX_CHARS = 30
+# 模型只处理不超过该长度的输入
+MODEL_MAX_CHARS = 80
+
+INTENTS = ["new_project", "write_next", "revise", "check_consistency", "query_setting", "approve_proposals", "export"]
+UNKNOWN_INTENT = "unknown"
+
+_RULES: List[Tuple[str, re.Pattern]] = [
+    ("new_project", re.compile(r"(新建|创建|新开|开一本|开始写|写一本|开坑).{0,12}(小说|书|项目|作品)|^新书")),
+    ("write_next", re.compile(r"^(请|帮我)?(继续|接着|往下)写?(下去|作|创作)?$|(写|继续写?)下一(个|场|章|段)|^下一(场|章|个场景)|^续写")),
+    ("revise", re.compile(r"改稿|润色|精修|修订|重写|改写|(修改|改一下|改改)")),
+    ("check_consistency", re.compile(r"一致性|(检查|校验|核对|验证).{0,10}(设定|矛盾|冲突|漏洞|时间线|bug)|吃书")),
+    ("query_setting", re.compile(r"^(查询?|查看|看看)(一下)?.{0,8}(设定|人物|角色|状态|世界观|关系|地点)|人物状态")),
+    ("approve_proposals", re.compile(r"(批准|同意|通过|接受).{0,6}(提案|P\d+)|^P\d+|^(全部|审批)(批准|通过)", re.IGNORECASE)),
+    ("export", re.compile(r"导出|(保存|输出)为|下载全文|输出全文")),
+]
+
+# 否定与驳回：关键词会命中相反的意图（“不要导出”含“导出”），本地不做判定
+_NEGATION_RE = re.compile(r"不要|不用|不必|无需|暂不|先别|(?<![特分区级性告类识辨个差鉴])别(?![名称墅])|驳回|拒绝|否决|撤销|取消")
+# 分句：按标点与连接词切分，逐句匹配规则
+_CLAUSE_SPLIT_RE = re.compile(r"[\s，,。.；;！!？?、]+|然后|并且|顺便|同时")
+# 不表达意图的客套分句，不参与“部分命中”判断
+_FILLER_RE = re.compile(r"^(好的?|好吧|行|嗯+|ok|okay|谢谢|麻烦了?|请|辛苦了)$", re.IGNORECASE)
+# 规则命中但对象不符时交给大模型：改稿针对正文，对象是设定/世界观时可能是设定变更
+_RULE_EXCLUSIONS: Dict[str, re.Pattern] = {
+    "revise": re.compile(r"设定|人设|世界观|规则|大纲|时间线"),
+}
+
+_CHAPTER_RE = re.compile(r"第\s*([0-9一二三四五六七八九十百零两]+)\s*章")
+_PROPOSAL_RE = re.compile(r"P\d+", re.IGNORECASE)
+_FORMAT_RE = re.compile(r"(txt|markdown|md|docx|word|epub)", re.IGNORECASE)
+
+
+class IntentPrediction(BaseModel):
+    """本地意图判定结果"""
+    intent: str = Field(..., description="意图类型")
+    confidence: float = Field(..., description="置信度")
+    parameters: Dict[str, Any] = Field(default={}, description="抽取的参数")
+    source: str = Field(..., description="判定来源：rule/model")
+
+
+def extract_parameters(text: str) -> Dict[str, Any]:
+    """从指令中抽取常见参数：章节号、提案ID、导出格式"""
+    params: Dict[str, Any] = {}
+    m = _CHAPTER_RE.search(text)
+    if m:
+        chapter_no = cn_to_int(m.group(1))
+        if chapter_no:
+            params["chapter_no"] = str(chapter_no)
+    proposal_ids = [p.upper() for p in _PROPOSAL_RE.findall(text)]
+    if proposal_ids:
+        params["proposal_ids"] = proposal_ids
+    m = _FORMAT_RE.search(text)
+    if m:
+        fmt = m.group(1).lower()
+        params["format"] = {"markdown": "md", "word": "docx"}.get(fmt, fmt)
+    return params
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[\s，。！？,.!?~～…]+", "", text).lower()
+
+
+def _ngrams(text: str, n_min: int, n_max: int) -> List[str]:
+    padded = f"^{text}$"
+    grams = []
+    for n in range(n_min, n_max + 1):
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+def train_ngram_model(samples: Iterable[Tuple[str, str]], n_min: int = 1, n_max: int = 3, alpha: float = 0.5,
+                      calibration: float = 8.0) -> Dict[str, Any]:
+    """
+    以 (文本, 意图) 样本训练多项式朴素贝叶斯模型，返回可序列化的模型字典。
+    calibration：n-gram 数超过该值时按比例降温，抑制朴素贝叶斯在长输入上的过度自信
+    """
+    counts: Dict[str, Counter] = {}
+    docs: Counter = Counter()
+    vocab = set()
+    for text, intent in samples:
+        grams = _ngrams(_normalize(text), n_min, n_max)
+        counts.setdefault(intent, Counter()).update(grams)
+        docs[intent] += 1
+        vocab.update(grams)
+    return {
+        "version": 1,
+        "ngram": [n_min, n_max],
+        "alpha": alpha,
+        "calibration": calibration,
+        "vocab_size": len(vocab),
+        "classes": {
+            intent: {"docs": docs[intent], "total": sum(c.values()), "counts": dict(c)}
+            for intent, c in counts.items()
+        },
+    }
+
+
+class NgramIntentModel:
+    """字符 n-gram 朴素贝叶斯意图模型"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.n_min, self.n_max = data["ngram"]
+        alpha = data["alpha"]
+        self.calibration = data.get("calibration", 8.0)
+        vocab_size = data["vocab_size"]
+        total_docs = sum(c["docs"] for c in data["classes"].values())
+        self.priors: Dict[str, float] = {}
+        self.unseen: Dict[str, float] = {}
+        self.logp: Dict[str, Dict[str, float]] = {}
+        self.vocab = set()
+        for intent, c in data["classes"].items():
+            denom = c["total"] + alpha * vocab_size
+            self.priors[intent] = math.log(c["docs"] / total_docs)
+            self.unseen[intent] = math.log(alpha / denom)
+            self.logp[intent] = {g: math.log((n + alpha) / denom) for g, n in c["counts"].items()}
+            self.vocab.update(c["counts"])
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回 (意图, 后验概率)；输入中没有任何已知的多字 n-gram 时置信度为 0"""
+        grams = _ngrams(_normalize(text), self.n_min, self.n_max)
+        if not any(len(g) > 1 and g in self.vocab for g in grams):
+            return UNKNOWN_INTENT, 0.0
+        scores = {
+            intent: self.priors[intent] + sum(table.get(g, self.unseen[intent]) for g in grams)
+            for intent, table in self.logp.items()
+        }
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        temperature = max(1.0, len(grams) / self.calibration)
+        norm = sum(math.exp((s - top) / temperature) for s in scores.values())
+        return best, 1.0 / norm
+
+
+class IntentClassifier:
+    """规则 + n-gram 模型的本地意图分类器，附带分路径统计"""
+
+    def __init__(self, model: Optional[NgramIntentModel] = None, threshold: float = INTENT_LOCAL_THRESHOLD,
+                 shadow_rate: float = INTENT_SHADOW_RATE):
+        self.model = model
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self._lock = threading.Lock()
+        self._paths: Dict[str, Dict[str, float]] = {}
+        self._accuracy: Dict[str, Dict[str, int]] = {}
+
+    def _match_rules(self, text: str) -> Optional[set]:
+        """
+        按分句匹配规则，返回命中的意图集合；部分命中（命中规则但对象不符，或多分句中只有部分分句命中）时
+        返回 None，表示含义不明确、交给大模型
+        """
+        if len(text) > RULE_MAX_CHARS:
+            return set()
+        clauses = [c for c in _CLAUSE_SPLIT_RE.split(text) if c and not _FILLER_RE.match(c)]
+        per_clause = []
+        for clause in clauses:
+            hits = {intent for intent, pattern in _RULES if pattern.search(clause)}
+            if any(intent in _RULE_EXCLUSIONS and _RULE_EXCLUSIONS[intent].search(clause) for intent in hits):
+                return None
+            per_clause.append(hits)
+        if len(per_clause) > 1 and any(per_clause) and not all(per_clause):
+            return None
+        return set().union(*per_clause)
+
+    def classify(self, text: str) -> Optional[IntentPrediction]:
+        """本地判定意图；无法给出已知意图时返回 None（置信度是否足够由调用方比较 threshold）"""
+        text = (text or "").strip()
+        if not text or _NEGATION_RE.search(text):
+            return None
+        matched = self._match_rules(text)
+        if matched is None or len(matched) > 1:
+            # 命中多种意图（如“写下一章前先检查一致性”）时交给大模型
+            return None
+        if matched:
+            return IntentPrediction(intent=matched.pop(), confidence=0.99, parameters=extract_parameters(text), source="rule")
+        if self.model is None or len(text) > MODEL_MAX_CHARS:
+            return None
+        intent, confidence = self.model.predict(text)
+        if intent not in INTENTS:
+            return None
+        return IntentPrediction(intent=intent, confidence=round(confidence, 4),
+                                parameters=extract_parameters(text), source="model")
+
+    def decide(self, text: str) -> Tuple[Optional[IntentPrediction], bool]:
+        """
+        返回 (本地判定结果, 是否仍需调用大模型)：
+        置信度达到阈值的结果直接采用，但按 shadow_rate 抽样交给大模型核对
+        """
+        if not INTENT_LOCAL_ENABLED:
+            return None, True
+        prediction = self.classify(text)
+        if prediction is None or prediction.confidence < self.threshold:
+            return prediction, True
+        return prediction, random.random() < self.shadow_rate
+
+    def record(self, path: str, latency_ms: float) -> None:
+        """记录一次意图识别的路径与耗时"""
+        with self._lock:
+            s = self._paths.setdefault(path, {"requests": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0})
+            s["requests"] += 1
+            s["latency_ms_total"] += latency_ms
+            s["latency_ms_max"] = max(s["latency_ms_max"], latency_ms)
+
+    def record_agreement(self, prediction: IntentPrediction, llm_intent: str) -> None:
+        """以大模型结果为准记录本地判定是否一致；低于阈值的判定单独统计，用于调整阈值"""
+        key = prediction.source if prediction.confidence >= self.threshold else f"{prediction.source}_below_threshold"
+        agreed = prediction.intent == llm_intent
+        with self._lock:
+            s = self._accuracy.setdefault(key, {"compared": 0, "agreed": 0})
+            s["compared"] += 1
+            s["agreed"] += int(agreed)
+        if not agreed:
+            logger.info(f"Local intent {prediction.intent} ({prediction.source}, {prediction.confidence}) "
+                        f"disagrees with LLM intent {llm_intent}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            paths = {
+                path: {
+                    "requests": s["requests"],
+                    "latency_ms_avg": round(s["latency_ms_total"] / s["requests"], 2) if s["requests"] else 0.0,
+                    "latency_ms_max": round(s["latency_ms_max"], 2),
+                }
+                for path, s in self._paths.items()
+            }
+            accuracy = {
+                key: {**s, "accuracy": round(s["agreed"] / s["compared"], 4) if s["compared"] else None}
+                for key, s in self._accuracy.items()
+            }
+        return {"threshold": self.threshold, "shadow_rate": self.shadow_rate, "paths": paths, "accuracy": accuracy}
+
+
+def load_ngram_model(path: str) -> Optional[NgramIntentModel]:
+    """加载模型文件，不存在或损坏时返回 None（仅使用规则）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return NgramIntentModel(json.load(f))
+    except FileNotFoundError:
+        logger.warning(f"Intent model not found: {path}, using rules only")
+    except Exception as e:
+        logger.warning(f"Failed to load intent model {path}: {e}, using rules only")
+    return None
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """获取全局本地意图分类器"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                model_path = os.path.join(os.getenv("COZE_WORKSPACE_PATH") or os.getcwd(), INTENT_MODEL_FILE)
+                _classifier = IntentClassifier(load_ngram_model(model_path))
+    return _classifier
+
+
+__all__ = [
+    "INTENTS",
+    "UNKNOWN_INTENT",
+    "IntentPrediction",
+    "IntentClassifier",
+    "NgramIntentModel",
+    "extract_parameters",
+    "train_ngram_model",
+    "load_ngram_model",
+    "get_intent_classifier",
+]
+
+
+if __name__ == "__main__":
+    samples_file, model_file = sys.argv[1], sys.argv[2]
+    with open(samples_file, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    model_data = train_ngram_model((text, intent) for intent, texts in corpus.items() for text in texts)
+    with open(model_file, "w", encoding="utf-8") as f:
+        json.dump(model_data, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"Trained on {sum(len(t) for t in corpus.values())} samples, vocab {model_data['vocab_size']} -> {model_file}")
@@ -0,0 +1,31 @@
+"""
+NovelOS 中文数字解析
+章节号、年龄等数量词的阿拉伯数字/中文数字转换，供意图参数抽取、段落标题识别与规则预检共用
+"""
+from typing import Optional
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def cn_to_int(text: str) -> Optional[int]:
+    """阿拉伯数字或不超过千的中文数字转整数，无法解析时返回 None"""
+    if text.isdigit():
+        return int(text)
+    total, num = 0, 0
+    for ch in text:
+        if ch in _CN_DIGITS:
+            num = _CN_DIGITS[ch]
+        elif ch == "十":
+            total += (num or 1) * 10
+            num = 0
+        elif ch == "百":
+            total += (num or 1) * 100
+            num = 0
+        else:
+            return None
+    return total + num or None
+
+
+__all__ = [
+    "cn_to_int",
+]
@@ -0,0 +1,274 @@
+"""
+NovelOS 段落锚点
+为每个章节版本建立段落索引：para_id 由段落内容哈希生成（内容不变则跨版本稳定），
+同时记录字符/字节偏移，使 IssueItem / PatchPlanItem 可以通过 para_id 以 O(1) 定位到正文位置。
+
+索引文件与正文版本并列存放：assets/{project_id}/chapter_{n}/v3.md -> v3.para.json
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from utils.text.numerals import cn_to_int
+
+logger = logging.getLogger(__name__)
+
+# 索引文件格式版本，格式变化时递增，旧索引会被重新构建
+PARA_INDEX_FORMAT = 1
+# 段落 ID 中内容哈希的长度（十六进制字符数）
+PARA_HASH_LEN = 10
+# 索引中保存的段落摘要长度
+SNIPPET_LEN = 40
+
+_WS_RE = re.compile(r"\s+")
+# 自然语言段落序号，如 "第3段"、"第三段"、"P3"、"p3"
+_ORDINAL_RE = re.compile(r"第\s*([0-9一二三四五六七八九十百零两]+)\s*段|^[Pp](\d+)$")
+
+
+class ParagraphAnchor(BaseModel):
+    """段落锚点"""
+    para_id: str = Field(..., description="段落ID（内容哈希，重复段落追加序号）")
+    index: int = Field(..., description="段落序号（从0开始）")
+    char_start: int = Field(..., description="起始字符偏移")
+    char_end: int = Field(..., description="结束字符偏移（不含）")
+    byte_start: int = Field(..., description="起始字节偏移（UTF-8）")
+    byte_end: int = Field(..., description="结束字节偏移（UTF-8，不含）")
+    snippet: str = Field(default="", description="段落开头摘要")
+
+
+class ParagraphIndex(BaseModel):
+    """章节版本的段落索引"""
+    format: int = Field(default=PARA_INDEX_FORMAT, description="索引格式版本")
+    text_hash: str = Field(..., description="正文内容哈希，用于校验索引是否过期")
+    paragraphs: List[ParagraphAnchor] = Field(default=[], description="段落锚点列表（按正文顺序）")
+
+    _by_id: Dict[str, ParagraphAnchor] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context) -> None:
+        self._by_id = {p.para_id: p for p in self.paragraphs}
+
+    def get(self, para_id: str) -> Optional[ParagraphAnchor]:
+        return self._by_id.get(para_id)
+
+    def __contains__(self, para_id: str) -> bool:
+        return para_id in self._by_id
+
+    def __len__(self) -> int:
+        return len(self.paragraphs)
+
+    def text_of(self, text: str, para_id: str) -> Optional[str]:
+        """取出段落原文"""
+        anchor = self.get(para_id)
+        if anchor is None:
+            return None
+        return text[anchor.char_start:anchor.char_end]
+
+    def resolve(self, ref: Optional[str], text: Optional[str] = None) -> Optional[ParagraphAnchor]:
+        """
+        把位置引用解析为段落锚点，依次尝试：
+        1. para_id 精确匹配
+        2. 自然语言序号（"第3段" / "P3"，从1开始）
+        3. 引用片段（需提供正文，片段落在哪个段落就返回哪个）
+        """
+        if not ref:
+            return None
+        ref = ref.strip()
+        anchor = self.get(ref)
+        if anchor is not None:
+            return anchor
+        m = _ORDINAL_RE.search(ref)
+        if m:
+            n = cn_to_int(m.group(1) or m.group(2))
+            if n is not None and 1 <= n <= len(self.paragraphs):
+                return self.paragraphs[n - 1]
+        if text:
+            snippet = ref.strip("“”\"'「」『』")
+            if len(snippet) >= 4:
+                pos = text.find(snippet)
+                if pos >= 0:
+                    return self.at_offset(pos)
+        return None
+
+    def at_offset(self, char_offset: int) -> Optional[ParagraphAnchor]:
+        """返回包含指定字符偏移的段落（二分查找）"""
+        lo, hi = 0, len(self.paragraphs) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            p = self.paragraphs[mid]
+            if char_offset < p.char_start:
+                hi = mid - 1
+            elif char_offset >= p.char_end:
+                lo = mid + 1
+            else:
+                return p
+        return None
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _para_hash(para: str) -> str:
+    # 忽略空白差异，使仅调整缩进/空格的段落保持同一 ID
+    normalized = _WS_RE.sub("", para)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:PARA_HASH_LEN]
+
+
+def build_paragraph_index(text: str) -> ParagraphIndex:
+    """按行切分段落（空行忽略），计算 para_id 与字符/字节偏移"""
+    paragraphs: List[ParagraphAnchor] = []
+    seen: Dict[str, int] = {}
+    char_pos = 0
+    byte_pos = 0
+    for line in text.splitlines(keepends=True):
+        line_bytes = len(line.encode('utf-8'))
+        body = line.rstrip("\r\n")
+        stripped = body.strip()
+        if stripped:
+            # 去掉首尾空白后的段落范围
+            lead = len(body) - len(body.lstrip())
+            start = char_pos + lead
+            end = start + len(stripped)
+            byte_start = byte_pos + len(body[:lead].encode('utf-8'))
+            byte_end = byte_start + len(stripped.encode('utf-8'))
+
+            h = _para_hash(stripped)
+            count = seen.get(h, 0) + 1
+            seen[h] = count
+            para_id = f"p_{h}" if count == 1 else f"p_{h}_{count}"
+
+            paragraphs.append(ParagraphAnchor(
+                para_id=para_id,
+                index=len(paragraphs),
+                char_start=start,
+                char_end=end,
+                byte_start=byte_start,
+                byte_end=byte_end,
+                snippet=stripped[:SNIPPET_LEN]
+            ))
+        char_pos += len(line)
+        byte_pos += line_bytes
+    return ParagraphIndex(text_hash=text_hash(text), paragraphs=paragraphs)
+
+
+def index_path_for(file_path: str) -> str:
+    """正文路径 -> 段落索引路径（v3.md -> v3.para.json）"""
+    return f"{os.path.splitext(file_path)[0]}.para.json"
+
+
+def save_paragraph_index(asset_store, file_path: str, text: str) -> ParagraphIndex:
+    """构建并持久化段落索引，返回索引"""
+    index = build_paragraph_index(text)
+    asset_store.write_text(index_path_for(file_path), index.model_dump_json())
+    return index
+
+
+def load_paragraph_index(asset_store, file_path: str, text: Optional[str] = None) -> Optional[ParagraphIndex]:
+    """
+    读取段落索引；索引缺失、格式过期或与正文不一致时，如提供了正文则即时重建（不回写）
+    """
+    try:
+        index = ParagraphIndex(**json.loads(asset_store.read_text(index_path_for(file_path))))
+        if index.format == PARA_INDEX_FORMAT and (text is None or index.text_hash == text_hash(text)):
+            return index
+    except FileNotFoundError:
+        pass
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid paragraph index for {file_path}: {e}")
+    if text is None:
+        return None
+    return build_paragraph_index(text)
+
+
+def format_annotated(anchors: Iterable[Optional[ParagraphAnchor]], text_of: Callable[[ParagraphAnchor], str],
+                     max_chars: Optional[int] = None) -> str:
+    """
+    按锚点顺序生成带段落ID前缀的正文（每段一行：[para_id] 段落内容），None 表示省略的段落区间（输出 ...）；
+    超出 max_chars 时截断并以 ... 结尾
+    """
+    lines: List[str] = []
+    total = 0
+    for p in anchors:
+        if p is None:
+            lines.append("...")
+            total += 4
+            continue
+        line = f"[{p.para_id}] {text_of(p)}"
+        if max_chars is not None and total + len(line) > max_chars:
+            remaining = max_chars - total
+            if remaining > len(p.para_id) + 3:
+                lines.append(line[:remaining])
+            lines.append("...")
+            break
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def annotate_paragraphs(text: str, index: ParagraphIndex, max_chars: Optional[int] = None) -> str:
+    """
+    生成带段落ID前缀的正文（每段一行：[para_id] 段落内容），供 LLM 在输出中引用 para_id；
+    超出 max_chars 时截断并以 ... 结尾
+    """
+    return format_annotated(index.paragraphs, lambda p: text[p.char_start:p.char_end], max_chars)
+
+
+def select_window(index: ParagraphIndex, para_ids: Iterable[str], context: int = 1) -> List[Optional[ParagraphAnchor]]:
+    """
+    选出目标段落及其前后 context 段（按正文顺序去重），不相邻的区间之间插入 None 作为省略标记
+    """
+    wanted = set()
+    for para_id in para_ids:
+        anchor = index.get(para_id) if para_id else None
+        if anchor is None:
+            continue
+        for i in range(max(0, anchor.index - context), min(len(index.paragraphs), anchor.index + context + 1)):
+            wanted.add(i)
+    selected: List[Optional[ParagraphAnchor]] = []
+    prev = -1
+    for i in sorted(wanted):
+        if i != prev + 1:
+            selected.append(None)
+        selected.append(index.paragraphs[i])
+        prev = i
+    if selected and prev != len(index.paragraphs) - 1:
+        selected.append(None)
+    return selected
+
+
+def annotate_window(text: str, index: ParagraphIndex, para_ids: Iterable[str], max_chars: Optional[int] = None,
+                    context: int = 1) -> str:
+    """只输出目标段落及其上下文的带段落ID正文，格式同 annotate_paragraphs"""
+    return format_annotated(select_window(index, para_ids, context), lambda p: text[p.char_start:p.char_end], max_chars)
+
+
+def bind_anchors(items: Iterable, index: ParagraphIndex, text: str, ref_field: str) -> None:
+    """
+    校正 LLM 返回项的 para_id：不在索引中的 para_id 置空，并尝试用自然语言位置字段（where/target）解析补全
+    """
+    for item in items:
+        para_id = getattr(item, "para_id", None)
+        if para_id and para_id in index:
+            continue
+        anchor = index.resolve(para_id, text) or index.resolve(getattr(item, ref_field, None), text)
+        item.para_id = anchor.para_id if anchor else None
+
+
+__all__ = [
+    "ParagraphAnchor",
+    "ParagraphIndex",
+    "build_paragraph_index",
+    "index_path_for",
+    "save_paragraph_index",
+    "load_paragraph_index",
+    "format_annotated",
+    "annotate_paragraphs",
+    "select_window",
+    "annotate_window",
+    "bind_anchors",
+]
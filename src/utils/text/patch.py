@@ -0,0 +1,171 @@
+"""
+NovelOS 本地修补引擎
+在本地确定性地应用 PatchPlanItem（replace / delete / insert），无需让 LLM 重写整章：
+- 定位优先级：target 中的引用片段（“...” / "..." / 「...」）> para_id > 自然语言段落序号
+- 只有引用片段才按原文字面匹配，未加引号的 target 只用于定位段落（“开头”“第2段”等不是原文）
+- 命中引用片段时 content 即替换/插入的原文；content 形如修改说明（“将…改为…”）时不写入正文
+- 未给出引用片段、只定位到段落时：删除以段落为单位执行；替换/插入的 content 是修改要求而非原文，
+  记为失败并附带段落ID，由段落级重写处理（literal=True 的整段原文除外）
+- 给出了引用片段但原文中找不到时不做整段替换，记为失败并附带段落ID
+- 无法定位或与其他修补重叠的项记为失败，由调用方决定是否回退到 LLM 局部重写
+"""
+import re
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from utils.text.paragraph import ParagraphAnchor, ParagraphIndex, build_paragraph_index
+
+logger = logging.getLogger(__name__)
+
+# 引用片段最短长度，过短的片段容易误匹配
+MIN_SNIPPET_LEN = 2
+_QUOTE_RE = re.compile(r"“([^”]+)”|\"([^\"]+)\"|「([^」]+)」|『([^』]+)』|‘([^’]+)’")
+# target 中表示“插入到前面”的提示词，其余情况插入到目标之后
+_BEFORE_HINTS = ("之前", "前面", "前插入", "开头", "段首", "句首", "before")
+# 修改说明而非原文的 content（“将叹气改为微笑”“删除这句”“改为……”）
+_INSTRUCTION_RE = re.compile(r"^(?:请|建议)?(?:(?:将|把)[^，。！？\n]{1,30}?(?:改为|改成|换成|替换为|删去|删除|去掉)"
+                             r"|改为|改成|替换为|删去|删除|去掉|增加|添加|补充)")
+
+
+class PatchFailure(BaseModel):
+    """未能本地应用的修补项"""
+    item_index: int = Field(..., description="修补项在计划中的序号")
+    reason: str = Field(..., description="失败原因")
+    para_id: Optional[str] = Field(default=None, description="可定位到的段落ID（可用于局部重写）")
+
+
+class PatchApplyResult(BaseModel):
+    """本地修补结果"""
+    content: str = Field(..., description="应用修补后的正文")
+    applied: List[int] = Field(default=[], description="已应用的修补项序号")
+    failed: List[PatchFailure] = Field(default=[], description="未能应用的修补项")
+    touched_para_ids: List[str] = Field(default=[], description="被修改的段落ID（按原文索引）")
+
+
+def _quoted_snippets(target: str) -> List[str]:
+    return [next(g for g in m.groups() if g) for m in _QUOTE_RE.finditer(target or "")]
+
+
+def _find_snippet(text: str, target: str, anchor: Optional[ParagraphAnchor]) -> Optional[Tuple[int, int]]:
+    """
+    在正文中定位引用片段，返回 (start, end)。有段落锚点时优先在该段落内查找，避免命中其他段落的同一片段；
+    全文出现多次且无法用段落消歧时视为无法定位
+    """
+    for snippet in _quoted_snippets(target):
+        if len(snippet) < MIN_SNIPPET_LEN:
+            continue
+        if anchor is not None:
+            pos = text.find(snippet, anchor.char_start, anchor.char_end)
+            if pos >= 0:
+                return pos, pos + len(snippet)
+        pos = text.find(snippet)
+        if pos >= 0 and text.find(snippet, pos + 1) < 0:
+            return pos, pos + len(snippet)
+    return None
+
+
+def _line_span(text: str, anchor: ParagraphAnchor) -> Tuple[int, int]:
+    """段落所在整行（含行尾换行）的范围，删除段落时连同换行一起删除"""
+    start = text.rfind("\n", 0, anchor.char_start) + 1
+    end = text.find("\n", anchor.char_end)
+    end = len(text) if end < 0 else end + 1
+    return start, end
+
+
+def _wants_before(target: str) -> bool:
+    return any(h in (target or "") for h in _BEFORE_HINTS)
+
+
+def _is_instruction(content: str) -> bool:
+    return bool(_INSTRUCTION_RE.match((content or "").strip()))
+
+
+def apply_patch_plan(text: str, items: Sequence, index: Optional[ParagraphIndex] = None) -> PatchApplyResult:
+    """
+    应用修补计划。所有修补项都基于原文定位，最后从后往前一次性替换，互相之间不受偏移影响；
+    区间重叠的修补项只保留先出现的那一个
+    """
+    index = index or build_paragraph_index(text)
+    edits: List[Tuple[int, int, str, int]] = []  # (start, end, replacement, item_index)
+    failed: List[PatchFailure] = []
+    touched: List[str] = []
+
+    for i, item in enumerate(items):
+        target = getattr(item, "target", "") or ""
+        anchor = index.get(item.para_id) if getattr(item, "para_id", None) else None
+        if anchor is None:
+            anchor = index.resolve(target, text)
+        span = _find_snippet(text, target, anchor)
+        content = item.content or ""
+        literal = bool(getattr(item, "literal", False))
+
+        if item.action != "delete" and not literal and _is_instruction(content):
+            # content 是修改说明，不能写入正文
+            hit = anchor or (index.at_offset(span[0]) if span else None)
+            failed.append(PatchFailure(item_index=i, reason="修补内容是修改说明而非原文",
+                                       para_id=hit.para_id if hit else None))
+            continue
+        if span is not None:
+            start, end = span
+            if item.action == "replace":
+                edit = (start, end, content)
+            elif item.action == "delete":
+                edit = (start, end, "")
+            else:
+                pos = start if _wants_before(target) else end
+                edit = (pos, pos, content)
+        elif anchor is not None and _quoted_snippets(target):
+            # 指定了引用片段却未找到（LLM 引用与原文有出入），不能退化为整段替换，交给段落级重写
+            failed.append(PatchFailure(item_index=i, reason="引用片段未在原文中找到", para_id=anchor.para_id))
+            continue
+        elif anchor is not None:
+            if item.action == "delete":
+                edit = (*_line_span(text, anchor), "")
+            elif not literal:
+                # 未引用原文片段时 content 是修改要求，交给段落级重写
+                failed.append(PatchFailure(item_index=i, reason="未引用原文片段，需按修改要求重写段落",
+                                           para_id=anchor.para_id))
+                continue
+            elif item.action == "replace":
+                edit = (anchor.char_start, anchor.char_end, content.strip())
+            else:
+                # 段落级插入：作为独立段落插入到目标段落前/后
+                line_start, line_end = _line_span(text, anchor)
+                if _wants_before(target):
+                    edit = (line_start, line_start, content.strip() + "\n")
+                elif line_end > 0 and text[line_end - 1] == "\n":
+                    edit = (line_end, line_end, content.strip() + "\n")
+                else:
+                    edit = (line_end, line_end, "\n" + content.strip())
+        else:
+            failed.append(PatchFailure(item_index=i, reason="无法定位目标位置"))
+            continue
+
+        start, end, _ = edit
+        hit = anchor or index.at_offset(start)
+        if any(s < end and start < e or (s == e == start == end) for s, e, _, _ in edits):
+            failed.append(PatchFailure(item_index=i, reason="与其他修补项重叠", para_id=hit.para_id if hit else None))
+            continue
+        edits.append((*edit, i))
+        if hit is not None and hit.para_id not in touched:
+            touched.append(hit.para_id)
+
+    result = text
+    for start, end, replacement, _ in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        result = result[:start] + replacement + result[end:]
+
+    return PatchApplyResult(
+        content=result,
+        applied=sorted(e[3] for e in edits),
+        failed=failed,
+        touched_para_ids=touched
+    )
+
+
+__all__ = [
+    "PatchFailure",
+    "PatchApplyResult",
+    "apply_patch_plan",
+]
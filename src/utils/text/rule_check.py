@@ -0,0 +1,236 @@
+"""
+NovelOS 本地规则预检
+一致性检查调用大模型之前，先在本地找出机械性问题，直接生成 IssueItem：
+- 禁忌词：StyleBible.taboos 与实体名称一起构建 Aho-Corasick 自动机，一次扫描完成多模式匹配
+- 视角：第三人称作品中，对白（引号内）之外出现第一人称代词
+- 实体：以“XX说/道：”形式说话但不在 world.entities 中的人物；与实体年龄属性矛盾的“N岁”
+只有禁忌词为 blocker（有 blocker 时调用方可跳过大模型检查）；视角问题为 warn（代词可能出自未加引号的内心独白或引文，
+由大模型结合上下文判断），实体问题为 warn/info
+"""
+import os
+import re
+import logging
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from graphs.state import Entity, IssueItem, NovelState
+from utils.text.paragraph import ParagraphIndex, build_paragraph_index
+from utils.text.numerals import cn_to_int
+
+logger = logging.getLogger(__name__)
+
+# 是否启用本地规则预检
+RULE_CHECK_ENABLED = os.getenv("NOVELOS_RULE_CHECK", "1") != "0"
+
+# 对白：引号内的内容不参与视角检查
+_QUOTE_RE = re.compile(r"“[^”]*”|「[^」]*」|『[^』]*』|\"[^\"\n]*\"")
+_FIRST_PERSON_RE = re.compile(r"(?<!自)(我们|我|咱们|俺)")
+# 说话人：句首的 XX说/道 + 冒号或引号
+_SPEAKER_RE = re.compile(r"(?<![一-龥])([一-龥]{2,3}?)(?:低声|轻声|冷冷地|笑着|大声)?(?:说道|问道|笑道|喊道|答道|说|道|问)[：:，,]?\s*[“「]")
+# 不是人名的常见说话人称呼
+_NON_NAME_PREFIXES = ("他", "她", "我", "你", "它", "那", "这", "有人", "众人", "大家", "对方", "老人", "少年", "少女",
+                      "男人", "女人", "孩子", "来人", "随即", "于是", "忽然", "然后", "接着", "只是", "轻轻", "低低")
+_AGE_KEYS = ("年龄", "age")
+_AGE_RE = re.compile(r"[^。！？\n，,]{0,8}?([0-9]+|[一二三四五六七八九十百两]+)岁")
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str]]:
+        """逐个产出 (起始偏移, 命中模式)，包含重叠命中"""
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern in out[state]:
+                yield i - len(pattern) + 1, pattern
+
+
+@lru_cache(maxsize=64)
+def _automaton(patterns: Tuple[str, ...]) -> AhoCorasick:
+    return AhoCorasick(patterns)
+
+
+def _issue(index: ParagraphIndex, pos: int, severity: str, where: str, why: str, fix: str,
+           rule_ref: Optional[str] = None) -> IssueItem:
+    anchor = index.at_offset(pos)
+    return IssueItem(
+        severity=severity,
+        where=f"第{anchor.index + 1}段：{where}" if anchor else where,
+        para_id=anchor.para_id if anchor else None,
+        why=why,
+        fix_suggestion=fix,
+        rule_ref=rule_ref
+    )
+
+
+def check_taboos(text: str, taboos: Iterable[str], index: ParagraphIndex,
+                 matches: Optional[List[Tuple[int, str]]] = None) -> List[IssueItem]:
+    """禁忌词命中（同一段落同一禁忌词只报一次）"""
+    taboo_set = {t.strip() for t in taboos if t and t.strip()}
+    if not taboo_set:
+        return []
+    if matches is None:
+        matches = list(_automaton(tuple(sorted(taboo_set))).finditer(text))
+    issues: List[IssueItem] = []
+    seen = set()
+    for pos, pattern in matches:
+        if pattern not in taboo_set:
+            continue
+        anchor = index.at_offset(pos)
+        key = (anchor.para_id if anchor else None, pattern)
+        if key in seen:
+            continue
+        seen.add(key)
+        issues.append(_issue(index, pos, "blocker", f"“{pattern}”", f"出现写作宪法禁忌内容：{pattern}",
+                             f"删除或改写“{pattern}”", rule_ref="style.taboos"))
+    return issues
+
+
+def check_pov(text: str, perspective: str, index: ParagraphIndex) -> List[IssueItem]:
+    """第三人称作品中叙述部分出现第一人称代词（每段报一次）"""
+    if "第三人称" not in (perspective or ""):
+        return []
+    narrative = _QUOTE_RE.sub(lambda m: " " * len(m.group(0)), text)
+    hits = [m.start() for m in _FIRST_PERSON_RE.finditer(narrative)]
+    if not hits:
+        return []
+    issues: List[IssueItem] = []
+    seen = set()
+    for pos in hits:
+        anchor = index.at_offset(pos)
+        key = anchor.para_id if anchor else pos
+        if key in seen:
+            continue
+        seen.add(key)
+        snippet = text[max(0, pos - 8):pos + 8].replace("\n", " ")
+        issues.append(_issue(index, pos, "warn", f"“{snippet}”", "第三人称作品的叙述中出现第一人称代词（视角漂移）",
+                             "改为第三人称叙述，或将内心独白放入引号", rule_ref="project.narrative_perspective"))
+    return issues
+
+
+def _expected_age(entity: Entity) -> Optional[int]:
+    for key in _AGE_KEYS:
+        value = entity.attributes.get(key)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            # 属性值可能写作“17”“17岁”或“十七岁”
+            m = re.search(r"\d+|[一二三四五六七八九十百两零]+", value)
+            if m:
+                return cn_to_int(m.group(0))
+    return None
+
+
+def check_entities(text: str, entities: Dict[str, Entity], index: ParagraphIndex,
+                   matches: Optional[List[Tuple[int, str]]] = None) -> List[IssueItem]:
+    """未登记的说话人物，以及与实体年龄属性矛盾的描述"""
+    names = {e.name: e for e in entities.values() if e.name}
+    if not names:
+        return []
+    if matches is None:
+        matches = list(_automaton(tuple(sorted(names))).finditer(text))
+    issues: List[IssueItem] = []
+
+    # 年龄矛盾：实体名称后紧跟的“N岁”
+    for pos, name in matches:
+        entity = names.get(name)
+        if entity is None or entity.type != "character":
+            continue
+        expected = _expected_age(entity)
+        if expected is None:
+            continue
+        m = _AGE_RE.match(text, pos + len(name))
+        if m is None:
+            continue
+        actual = cn_to_int(m.group(1))
+        if actual is not None and actual != expected:
+            issues.append(_issue(index, pos, "warn", f"“{text[pos:m.end()]}”",
+                                 f"{name}的年龄为{expected}岁，正文写作{actual}岁",
+                                 f"统一为{expected}岁，或先更新人物设定", rule_ref=entity.entity_id))
+
+    # 未登记的说话人物
+    reported = set()
+    for m in _SPEAKER_RE.finditer(text):
+        speaker = m.group(1)
+        if speaker in reported or speaker.startswith(_NON_NAME_PREFIXES):
+            continue
+        if any(speaker in name or name in speaker for name in names):
+            continue
+        reported.add(speaker)
+        issues.append(_issue(index, m.start(1), "info", f"“{speaker}”说话",
+                             f"说话人物“{speaker}”不在设定实体中", "确认是否为新人物；如是，先提交新设定提案"))
+    return issues
+
+
+def run_rule_checks(text: str, novel_state: Optional[NovelState], index: Optional[ParagraphIndex] = None) -> List[IssueItem]:
+    """执行全部本地规则，返回问题列表（未启用或无正文时为空）"""
+    if not RULE_CHECK_ENABLED or not text or novel_state is None:
+        return []
+    if index is None:
+        index = build_paragraph_index(text)
+    taboos = tuple(sorted({t.strip() for t in novel_state.style.taboos if t and t.strip()}))
+    entities = novel_state.world.entities
+    patterns = tuple(sorted(set(taboos) | {e.name for e in entities.values() if e.name}))
+    # 禁忌词与实体名称共用一个自动机，正文只扫描一遍
+    matches = list(_automaton(patterns).finditer(text)) if patterns else []
+    issues = check_taboos(text, taboos, index, matches)
+    issues += check_pov(text, novel_state.project.narrative_perspective, index)
+    issues += check_entities(text, entities, index, matches)
+    if issues:
+        logger.info(f"Rule check found {len(issues)} issues "
+                    f"({sum(1 for i in issues if i.severity == 'blocker')} blockers)")
+    return issues
+
+
+def has_blocker(issues: Iterable[IssueItem]) -> bool:
+    """是否有阻断问题（本地规则中只有禁忌词命中）"""
+    return any(i.severity == "blocker" for i in issues)
+
+
+__all__ = [
+    "AhoCorasick",
+    "check_taboos",
+    "check_pov",
+    "check_entities",
+    "run_rule_checks",
+    "has_blocker",
+]
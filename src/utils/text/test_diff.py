@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试脚本：正文差异引擎 diff_texts
+"""
+
+import random
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.text.diff import TextDiff, diff_texts, summarize_diff, tokenize
+from utils.text.paragraph import build_paragraph_index
+
+OLD = "开头的风很冷。\n他叹了口气，推开门。\n屋里没有人，桌上只有一盏灯。"
+
+
+def _apply(old: str, diff: TextDiff) -> str:
+    """按变更块把旧版本还原成新版本"""
+    parts, pos = [], 0
+    for h in diff.hunks:
+        assert old[h.old_start:h.old_end] == h.old_text
+        parts.append(old[pos:h.old_start])
+        parts.append(h.new_text)
+        pos = h.old_end
+    parts.append(old[pos:])
+    return "".join(parts)
+
+
+def test_tokenize_is_lossless():
+    assert "".join(tokenize(OLD)) == OLD
+    assert tokenize("他说：“走吧。”然后") == ["他说：", "“走吧。”", "然后"]
+
+
+def test_identical_texts():
+    diff = diff_texts(OLD, OLD)
+    assert diff.hunks == []
+    assert diff.changed_para_ids == []
+    assert summarize_diff(diff) == "无变化"
+
+
+def test_replace_insert_delete_round_trip():
+    new = "开头的风很冷。\n他笑了笑，推开门。\n屋里没有人。\n门外传来脚步声。"
+    diff = diff_texts(OLD, new, base_version=1, version=2)
+    assert _apply(OLD, diff) == new
+    assert diff.inserted_chars == sum(len(h.new_text) for h in diff.hunks)
+    assert diff.deleted_chars == sum(len(h.old_text) for h in diff.hunks)
+    index = build_paragraph_index(new)
+    assert diff.changed_para_ids == [p.para_id for p in index.paragraphs[1:]]
+
+
+def test_pure_delete_marks_enclosing_paragraph():
+    new = "开头的风很冷。\n推开门。\n屋里没有人，桌上只有一盏灯。"
+    diff = diff_texts(OLD, new)
+    assert [h.op for h in diff.hunks] == ["delete"]
+    assert _apply(OLD, diff) == new
+    assert diff.changed_para_ids == [build_paragraph_index(new).paragraphs[1].para_id]
+
+
+def test_random_edits_round_trip():
+    rng = random.Random(7)
+    clauses = tokenize(OLD * 5)
+    for _ in range(50):
+        edited = list(clauses)
+        for _ in range(rng.randint(1, 4)):
+            i = rng.randrange(len(edited))
+            op = rng.choice(["replace", "delete", "insert"])
+            if op == "replace":
+                edited[i] = f"改写{rng.randint(0, 99)}，"
+            elif op == "delete":
+                del edited[i]
+            else:
+                edited.insert(i, "新增一句。")
+        old, new = "".join(clauses), "".join(edited)
+        assert _apply(old, diff_texts(old, new)) == new
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
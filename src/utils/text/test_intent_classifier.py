@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试脚本：本地意图分类器（规则、否定/部分命中、n-gram 模型）
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.text.intent_classifier import (
+    IntentClassifier, NgramIntentModel, extract_parameters, load_ngram_model, train_ngram_model
+)
+from utils.text.numerals import cn_to_int
+
+MODEL_PATH = Path(__file__).parent.parent.parent.parent / "config" / "intent_ngram_model.json"
+
+
+def _classifier() -> IntentClassifier:
+    return IntentClassifier(load_ngram_model(str(MODEL_PATH)), shadow_rate=0.0)
+
+
+def test_cn_to_int():
+    assert cn_to_int("12") == 12
+    assert cn_to_int("三") == 3
+    assert cn_to_int("十二") == 12
+    assert cn_to_int("二十") == 20
+    assert cn_to_int("一百零五") == 105
+    assert cn_to_int("第三") is None
+
+
+def test_extract_parameters():
+    assert extract_parameters("导出第十二章为markdown") == {"chapter_no": "12", "format": "md"}
+    assert extract_parameters("批准p1和P3") == {"proposal_ids": ["P1", "P3"]}
+
+
+def test_rules_decide_short_commands():
+    classifier = _classifier()
+    for text, intent in [("导出全文", "export"), ("写下一章", "write_next"), ("继续写", "write_next"),
+                         ("批准P1", "approve_proposals"), ("帮我润色第三章", "revise"), ("好的，导出全文", "export")]:
+        prediction, need_llm = classifier.decide(text)
+        assert prediction is not None and prediction.intent == intent and prediction.source == "rule", text
+        assert not need_llm
+
+
+def test_negation_and_rejection_go_to_llm():
+    classifier = _classifier()
+    for text in ["不要导出", "先别导出，继续写", "驳回P2", "不用检查一致性"]:
+        prediction, need_llm = classifier.decide(text)
+        assert prediction is None and need_llm, text
+
+
+def test_partial_matches_go_to_llm():
+    classifier = _classifier()
+    for text in ["修改人物设定里张三的年龄", "导出全文，然后看看人物设定"]:
+        prediction, need_llm = classifier.decide(text)
+        assert prediction is None and need_llm, text
+
+
+def test_multiple_intents_go_to_llm():
+    assert _classifier().classify("导出全文，写下一章") is None
+
+
+def test_ngram_model():
+    model = NgramIntentModel(train_ngram_model([
+        ("导出全文", "export"), ("导出成txt", "export"), ("下载全文", "export"),
+        ("写下一章", "write_next"), ("继续往下写", "write_next"), ("续写下一场", "write_next"),
+    ]))
+    intent, confidence = model.predict("全文导出")
+    assert intent == "export" and confidence > 0.5
+    assert model.predict("你好")[1] == 0.0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
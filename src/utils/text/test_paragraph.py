@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试脚本：段落索引与段落引用解析
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from graphs.state import IssueItem
+from utils.text.paragraph import annotate_window, bind_anchors, build_paragraph_index
+
+TEXT = "  开头的风很冷。\n\n他叹了口气，推开门。\n屋里没有人。\n他叹了口气，推开门。\n"
+
+
+def test_anchor_offsets():
+    index = build_paragraph_index(TEXT)
+    assert len(index) == 4
+    for p in index.paragraphs:
+        assert TEXT[p.char_start:p.char_end] == index.text_of(TEXT, p.para_id)
+        assert TEXT.encode('utf-8')[p.byte_start:p.byte_end].decode('utf-8') == TEXT[p.char_start:p.char_end]
+    assert index.text_of(TEXT, index.paragraphs[0].para_id) == "开头的风很冷。"
+
+
+def test_para_id_stability():
+    index = build_paragraph_index(TEXT)
+    # 重复段落按出现次数区分
+    assert index.paragraphs[3].para_id == index.paragraphs[1].para_id + "_2"
+    # 只调整空白时 para_id 不变；前面插入段落不影响其余段落
+    edited = build_paragraph_index("开头的风很冷。\n新的一段。\n他叹了口气，  推开门。\n屋里没有人。")
+    assert edited.paragraphs[0].para_id == index.paragraphs[0].para_id
+    assert edited.paragraphs[2].para_id == index.paragraphs[1].para_id
+    assert edited.paragraphs[3].para_id == index.paragraphs[2].para_id
+
+
+def test_resolve_ordinals():
+    text = "\n".join(f"第{i}段的内容。" for i in range(1, 13))
+    index = build_paragraph_index(text)
+    for ref, expected in [("第3段", 2), ("第 12 段", 11), ("第三段", 2), ("第十二段", 11), ("P4", 3), ("p1", 0)]:
+        assert index.resolve(ref).index == expected, ref
+    assert index.resolve("第十三段") is None
+    assert index.resolve("第0段") is None
+    assert index.resolve(None) is None
+
+
+def test_resolve_id_and_snippet():
+    index = build_paragraph_index(TEXT)
+    target = index.paragraphs[2]
+    assert index.resolve(target.para_id) is target
+    assert index.resolve("“屋里没有人”", TEXT) is target
+    # 过短的片段不做全文匹配
+    assert index.resolve("屋里", TEXT) is None
+    assert index.at_offset(TEXT.index("屋里")) is target
+    assert index.at_offset(0) is None
+
+
+def test_bind_anchors():
+    index = build_paragraph_index(TEXT)
+    issues = [
+        IssueItem(severity="warn", where="第三段", para_id="p_unknown", why="x", fix_suggestion="y"),
+        IssueItem(severity="warn", where="无法定位", why="x", fix_suggestion="y"),
+        IssueItem(severity="warn", where="开头", para_id=index.paragraphs[0].para_id, why="x", fix_suggestion="y"),
+    ]
+    bind_anchors(issues, index, TEXT, "where")
+    assert [i.para_id for i in issues] == [index.paragraphs[2].para_id, None, index.paragraphs[0].para_id]
+
+
+def test_annotate_window():
+    text = "\n".join(f"段落{i}。" for i in range(1, 8))
+    index = build_paragraph_index(text)
+    window = annotate_window(text, index, [index.paragraphs[3].para_id]).split("\n")
+    assert window == ["...", f"[{index.paragraphs[2].para_id}] 段落3。", f"[{index.paragraphs[3].para_id}] 段落4。",
+                      f"[{index.paragraphs[4].para_id}] 段落5。", "..."]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+测试脚本：本地修补引擎 apply_patch_plan
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from graphs.state import PatchPlanItem
+from utils.text.paragraph import build_paragraph_index
+from utils.text.patch import apply_patch_plan
+
+TEXT = "开头的风很冷。\n他叹了口气，推开门。\n屋里没有人。"
+
+
+def _item(target, action="replace", content="", para_id=None, literal=False):
+    return PatchPlanItem(target=target, para_id=para_id, action=action, content=content,
+                         rationale="测试", literal=literal)
+
+
+def test_replace_quoted_snippet():
+    result = apply_patch_plan(TEXT, [_item("第2段“叹了口气”", content="笑了笑")])
+    assert result.content == "开头的风很冷。\n他笑了笑，推开门。\n屋里没有人。"
+    assert result.applied == [0]
+    assert not result.failed
+
+
+def test_delete_and_insert_quoted_snippet():
+    items = [
+        _item("“，推开门”", action="delete"),
+        _item("第3段“屋里”之前", action="insert", content="此时"),
+    ]
+    result = apply_patch_plan(TEXT, items)
+    assert result.content == "开头的风很冷。\n他叹了口气。\n此时屋里没有人。"
+    assert result.applied == [0, 1]
+
+
+def test_unquoted_target_is_not_literal():
+    """未加引号的 target（“开头”）只用于定位，不能当作原文片段替换"""
+    result = apply_patch_plan(TEXT, [_item("开头", content="结尾")])
+    assert result.content == TEXT
+    assert result.applied == []
+    assert "结尾" not in result.content
+
+
+def test_paragraph_replace_goes_to_rewrite():
+    """只定位到段落时 content 是修改要求，不能整段替换"""
+    index = build_paragraph_index(TEXT)
+    result = apply_patch_plan(TEXT, [_item("第2段", content="将叹气改为微笑")], index)
+    assert result.content == TEXT
+    assert len(result.failed) == 1
+    assert result.failed[0].para_id == index.paragraphs[1].para_id
+
+
+def test_instruction_content_not_written():
+    index = build_paragraph_index(TEXT)
+    result = apply_patch_plan(TEXT, [_item("“叹了口气”", content="将叹气改为微笑")], index)
+    assert result.content == TEXT
+    assert result.failed[0].para_id == index.paragraphs[1].para_id
+
+
+def test_literal_paragraph_replace():
+    index = build_paragraph_index(TEXT)
+    para_id = index.paragraphs[1].para_id
+    result = apply_patch_plan(TEXT, [_item("", content="他微笑着推开门。", para_id=para_id, literal=True)], index)
+    assert result.content == "开头的风很冷。\n他微笑着推开门。\n屋里没有人。"
+    assert result.touched_para_ids == [para_id]
+
+
+def test_paragraph_delete():
+    result = apply_patch_plan(TEXT, [_item("第3段", action="delete")])
+    assert result.content == "开头的风很冷。\n他叹了口气，推开门。\n"
+
+
+def test_missing_snippet_and_overlap_fail():
+    items = [
+        _item("第1段“不存在的句子”", content="x"),
+        _item("“叹了口气”", content="笑了"),
+        _item("“口气，推开”", content="y"),
+    ]
+    result = apply_patch_plan(TEXT, items)
+    assert result.applied == [1]
+    assert [f.item_index for f in result.failed] == [0, 2]
+    assert result.failed[0].para_id is not None
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+测试脚本：本地规则预检 rule_check
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from graphs.state import NovelState
+from utils.text.paragraph import build_paragraph_index
+from utils.text.rule_check import AhoCorasick, check_pov, has_blocker, run_rule_checks
+
+
+def _state(taboos=(), perspective="第三人称", entities=None) -> NovelState:
+    return NovelState.model_validate({
+        "project_id": "test",
+        "project": {"title": "测试", "genre": "悬疑", "narrative_perspective": perspective},
+        "style": {"taboos": list(taboos)},
+        "world": {"entities": entities or {}},
+    })
+
+
+def test_aho_corasick_overlapping_matches():
+    matches = sorted(AhoCorasick(["他", "他们", "们来"]).finditer("他们来了，他"))
+    assert matches == [(0, "他"), (0, "他们"), (1, "们来"), (5, "他")]
+
+
+def test_taboo_is_blocker_once_per_paragraph():
+    text = "他骂了一句脏话，又是脏话。\n第二段也有脏话。"
+    issues = run_rule_checks(text, _state(taboos=["脏话"]))
+    index = build_paragraph_index(text)
+    assert [(i.severity, i.para_id) for i in issues] == [
+        ("blocker", index.paragraphs[0].para_id), ("blocker", index.paragraphs[1].para_id)]
+    assert all(i.rule_ref == "style.taboos" for i in issues)
+    assert has_blocker(issues)
+
+
+def test_pov_drift_is_warn_only():
+    text = "我推开门，我看见了他。我想起了过去。\n他说：“我不知道。”"
+    index = build_paragraph_index(text)
+    issues = check_pov(text, "第三人称", index)
+    # 多次出现也只是 warn；对白中的第一人称不计
+    assert [(i.severity, i.para_id) for i in issues] == [("warn", index.paragraphs[0].para_id)]
+    assert not has_blocker(run_rule_checks(text, _state()))
+    assert check_pov(text, "第一人称", index) == []
+    assert check_pov("他自我安慰。", "第三人称", build_paragraph_index("他自我安慰。")) == []
+
+
+def test_entity_age_and_unknown_speaker():
+    entities = {
+        "c1": {"entity_id": "c1", "name": "林远", "type": "character", "attributes": {"年龄": "十七岁"}},
+        "c2": {"entity_id": "c2", "name": "苏晴", "type": "character", "attributes": {"age": 17}},
+    }
+    text = "林远今年二十岁了。苏晴十七岁。\n王五笑道：“来了。”苏晴说：“好。”他说：“嗯。”"
+    issues = run_rule_checks(text, _state(entities=entities))
+    assert [(i.severity, i.rule_ref) for i in issues] == [("warn", "c1"), ("info", None)]
+    assert "17" in issues[0].why and "20" in issues[0].why
+    assert "王五" in issues[1].why
+
+
+def test_disabled_without_state_or_text():
+    assert run_rule_checks("我来了。", None) == []
+    assert run_rule_checks("", _state(taboos=["我"])) == []
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
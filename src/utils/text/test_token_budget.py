@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+测试脚本：提示词 token 预算 pack / pack_ranked
+"""
+
+import sys
+from pathlib import Path
+
+# 添加src目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.text.token_budget import BudgetItem, char_bigrams, estimate_tokens, pack, pack_ranked
+
+
+def _item(key: str, text: str, score: float = 0.0) -> BudgetItem:
+    return BudgetItem(key=key, text=text, score=score)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("林远") > 0
+    assert estimate_tokens("林远林远林远林远") > estimate_tokens("林远")
+
+
+def test_char_bigrams():
+    assert char_bigrams("林远说") == {"林远", "远说"}
+    assert char_bigrams("剑，A") == {"剑", "a"}
+
+
+def test_pack_keeps_high_score_in_original_order():
+    items = [_item("a", "甲" * 40, 1.0), _item("b", "乙" * 40, 3.0), _item("c", "丙" * 40, 2.0)]
+    cost = estimate_tokens("甲" * 40) + 1
+    result = pack(items, budget=cost * 2, log=False)
+    assert result.keys == ["b", "c"]
+    assert result.dropped == ["a"]
+    assert result.tokens == cost * 2
+    assert result.note("规则") == "\n（另有 1 条规则与本次内容相关度较低，已省略）"
+
+
+def test_pack_skips_oversized_item_and_keeps_shorter():
+    items = [_item("long", "长" * 400, 5.0), _item("short", "短句", 1.0)]
+    result = pack(items, budget=50, log=False)
+    assert result.keys == ["short"]
+    assert result.dropped == ["long"]
+
+
+def test_pack_everything_fits():
+    items = [_item("a", "规则一"), _item("b", "规则二")]
+    result = pack(items, budget=1000, log=False)
+    assert result.keys == ["a", "b"]
+    assert result.note("规则") == ""
+    assert result.text() == "规则一\n规则二"
+    assert pack([], budget=10, log=False).kept == []
+
+
+def test_pack_ranked_prefers_named_and_relevant():
+    items = [_item("r1", "- 魔法需要咒语"), _item("r2", "- 林远不会游泳"), _item("r3", "- 王城在北方")]
+    one = estimate_tokens("- 林远不会游泳") + 1
+    result = pack_ranked(items, one, "林远跳进河里游泳", label="rules", names=[[], ["林远"], []])
+    assert result.keys == ["r2"]
+    assert sorted(result.dropped) == ["r1", "r3"]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,129 @@
+"""
+NovelOS 提示词 token 预算
+设定规则、人物、时间线会随世界观增长，全部拼进提示词会让成本线性增长并最终超出上下文窗口：
+- estimate_tokens：本地估算 token 数（中文按字、英文按词片近似），无需调用分词器
+- relevance：按与查询文本（场景卡、待检查正文、用户查询）的字符二元组重合度和名称命中打分
+- pack：按相关度从高到低装入预算，保持原始顺序输出，并报告被省略的条目
+"""
+import os
+import re
+import math
+import logging
+from typing import Iterable, List, Optional, Set
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# 每个汉字折合的 token 数（主流中文分词器约 0.6~1.0）
+CJK_TOKENS_PER_CHAR = float(os.getenv("NOVELOS_TOKENS_PER_CJK_CHAR", "0.75"))
+# 各类上下文在单个提示词中的 token 预算
+PROMPT_RULES_BUDGET = int(os.getenv("NOVELOS_PROMPT_RULES_TOKENS", "1500"))
+PROMPT_ENTITIES_BUDGET = int(os.getenv("NOVELOS_PROMPT_ENTITIES_TOKENS", "1500"))
+PROMPT_TIMELINE_BUDGET = int(os.getenv("NOVELOS_PROMPT_TIMELINE_TOKENS", "800"))
+
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_GRAM_RE = re.compile(r"[㐀-鿿豈-﫿A-Za-z0-9]+")
+# 名称命中的加分（远高于文本重合度，确保被提及的人物/规则优先保留）
+NAME_HIT_SCORE = 10.0
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：汉字按 CJK_TOKENS_PER_CHAR，英文/数字按每 4 字符 1 token，其余符号按 0.5"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    words = _WORD_RE.findall(text)
+    latin = sum(math.ceil(len(w) / 4) for w in words)
+    other = len(text) - cjk - sum(len(w) for w in words) - text.count(" ")
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + latin + max(0, other) * 0.5)
+
+
+def char_bigrams(text: str) -> Set[str]:
+    """文本的字符二元组集合（按连续的汉字/字母数字片段切分，片段不足两字时取单字）"""
+    grams: Set[str] = set()
+    for run in _GRAM_RE.findall((text or "").lower()):
+        if len(run) == 1:
+            grams.add(run)
+        else:
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def relevance(text: str, query_grams: Set[str], query: str = "", names: Iterable[str] = ()) -> float:
+    """条目与查询的相关度：名称出现在查询中时加分，再加上二元组重合比例"""
+    score = sum(NAME_HIT_SCORE for name in names if name and name in query)
+    grams = char_bigrams(text)
+    if grams and query_grams:
+        score += len(grams & query_grams) / math.sqrt(len(grams))
+    return score
+
+
+class BudgetItem(BaseModel):
+    """待装入提示词的候选条目"""
+    key: str = Field(..., description="条目标识（规则ID/实体ID/事件ID）")
+    text: str = Field(..., description="写入提示词的文本")
+    score: float = Field(default=0.0, description="相关度")
+
+
+class PackResult(BaseModel):
+    """预算装箱结果"""
+    kept: List[BudgetItem] = Field(default=[], description="保留的条目（原始顺序）")
+    dropped: List[str] = Field(default=[], description="因预算省略的条目标识")
+    tokens: int = Field(default=0, description="保留条目的估算 token 数")
+    budget: int = Field(default=0, description="预算")
+
+    @property
+    def keys(self) -> List[str]:
+        return [item.key for item in self.kept]
+
+    def text(self, sep: str = "\n") -> str:
+        return sep.join(item.text for item in self.kept)
+
+    def note(self, label: str) -> str:
+        """省略说明，附在提示词对应段落之后；无省略时为空"""
+        return f"\n（另有 {len(self.dropped)} 条{label}与本次内容相关度较低，已省略）" if self.dropped else ""
+
+
+def pack(items: List[BudgetItem], budget: int, label: str = "", log: bool = True) -> PackResult:
+    """按相关度从高到低装入预算（放不下的条目跳过，继续尝试更短的），输出保持原始顺序"""
+    order = sorted(range(len(items)), key=lambda i: (-items[i].score, i))
+    kept_idx: List[int] = []
+    dropped: List[str] = []
+    used = 0
+    for i in order:
+        cost = estimate_tokens(items[i].text) + 1
+        if used + cost <= budget:
+            kept_idx.append(i)
+            used += cost
+        else:
+            dropped.append(items[i].key)
+    result = PackResult(kept=[items[i] for i in sorted(kept_idx)], dropped=dropped, tokens=used, budget=budget)
+    if dropped and log:
+        logger.info(f"Prompt budget for {label or 'context'}: kept {len(kept_idx)}/{len(items)} items "
+                    f"(~{used}/{budget} tokens), dropped {dropped}")
+    return result
+
+
+def pack_ranked(items: List[BudgetItem], budget: int, query: str, label: str = "",
+                names: Optional[List[List[str]]] = None) -> PackResult:
+    """按与 query 的相关度打分后装箱（累加到条目已有的 score 上）；names[i] 为第 i 个条目的名称列表（命中查询时加分）"""
+    query_grams = char_bigrams(query)
+    for i, item in enumerate(items):
+        item.score += relevance(item.text, query_grams, query, names[i] if names else ())
+    return pack(items, budget, label)
+
+
+__all__ = [
+    "PROMPT_RULES_BUDGET",
+    "PROMPT_ENTITIES_BUDGET",
+    "PROMPT_TIMELINE_BUDGET",
+    "estimate_tokens",
+    "char_bigrams",
+    "relevance",
+    "BudgetItem",
+    "PackResult",
+    "pack",
+    "pack_ranked",
+]